@@ -1,31 +1,137 @@
+import copy
+import json
+import hashlib
 import logging
-import math
+import itertools
+import contextlib
 import pytz
+import requests
 
-from typing import Any, Optional, List
-from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Iterable, Iterator, Optional, List
+from datetime import date, datetime, timezone, timedelta
+from gw2tpdb import rollup
+from gw2tpdb import archive
+from gw2tpdb import snapshot
 from gw2tpdb.db import db
-from gw2tpdb.api.datawars import get_daily, get_items, get_dailies
-from gw2tpdb.api.history import HistoryEntry, row_to_history_entry, history_entry_to_tuple
+from gw2tpdb.metrics import Metrics
+from gw2tpdb.watermark import RemoteWatermark
+from gw2tpdb.read_cache import ReadCache, estimate_bytes
+from gw2tpdb.pipeline import run_pipeline, default_queue_size
+from gw2tpdb.api import datawars
+from gw2tpdb.api.datawars import get_daily, get_items, get_dailies_json, iter_dailies_json, iter_hourlies_json, _datawars_get_async
+from gw2tpdb.api.history import HistoryEntry, history_fields, history_json_to_tuple, row_to_history_entry, projected_row_to_history_entry, history_entry_to_tuple
+from gw2tpdb.api.series import HistorySeries
+from gw2tpdb.api.summary import ItemSummary, row_to_item_summary
+from gw2tpdb.api.url import build_history_request_url
+from gw2tpdb.api.endpoint import Endpoint
 from gw2tpdb.api.item import ItemEntry, row_to_item_entry, item_entry_to_tuple
 
 logger = logging.getLogger(__name__)
 glob_of_ectoplasm_id = 19721
 
+# Full-history backfill sizes each multi-ID request to return about this many rows.
+backfill_target_rows_per_request = 10000
+backfill_initial_batch_size = 10
+backfill_max_batch_size = 200
+
+# Rows per executemany when writing streamed history.
+write_chunk_rows = 5000
+
+# After this many failed requests in a row a sync stops requesting and
+# dead-letters its remaining IDs instead. High enough that bisecting a chunk
+# of a few dozen IDs down to one bad ID never trips it.
+max_consecutive_failures = 8
+
+# Finished sync_runs rows kept per table, for inspecting recent failures.
+kept_sync_runs = 100
+
+# Dead-lettered IDs are retried by full syncs after a backoff that doubles
+# with each failed attempt, and given up on after max_dead_letter_attempts.
+dead_letter_backoff_seconds = 60 * 60
+max_dead_letter_attempts = 8
+
+def _summary_upsert(where: str) -> str:
+    """Return SQL that recomputes item_summary rows for items whose latest daily row l matches WHERE."""
+
+    def window_sum(column, days):
+        return f"(SELECT SUM(d.{column}) FROM daily_history d WHERE d.id = l.id AND d.utc_timestamp > l.utc_timestamp - {days * 86400})"
+
+    def window_avg(column, days):
+        return f"(SELECT AVG(d.{column}) FROM daily_history d WHERE d.id = l.id AND d.utc_timestamp > l.utc_timestamp - {days * 86400})"
+
+    return f"""INSERT INTO item_summary
+        SELECT l.id, l.utc_timestamp, l.buy_price_avg, l.sell_price_avg,
+            {window_sum("buy_sold", 7)}, {window_sum("sell_sold", 7)},
+            {window_avg("buy_price_avg", 30)}, {window_avg("sell_price_avg", 30)}
+        FROM daily_history l
+        WHERE {where} AND l.utc_timestamp = (SELECT MAX(utc_timestamp) FROM daily_history WHERE id = l.id)
+        ON CONFLICT(id) DO UPDATE SET
+            utc_timestamp = excluded.utc_timestamp,
+            buy_price = excluded.buy_price,
+            sell_price = excluded.sell_price,
+            buy_sold_7d = excluded.buy_sold_7d,
+            sell_sold_7d = excluded.sell_sold_7d,
+            buy_price_avg_30d = excluded.buy_price_avg_30d,
+            sell_price_avg_30d = excluded.sell_price_avg_30d"""
+
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER (999 on older SQLite builds).
+max_query_variables = 900
+
+def _chunked(items: List[Any], chunk_size: int) -> List[List[Any]]:
+    """Return ITEMS split into lists of at most CHUNK_SIZE elements."""
+
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+def _to_timestamp(value: datetime) -> float:
+    """Return epoch seconds for VALUE, taking a naive datetime or a date as UTC."""
+
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    return value.timestamp()
+
 class Gw2TpDb():
     """TODO"""
 
-    def __init__(self, database_path, auto_update: bool = False):
+    def __init__(self, database_path, auto_update: bool = False, ingestion_profile: Optional[db.IngestionProfile] = None, read_cache: Optional[ReadCache] = None, archive_directory: Optional[str] = None, metrics: Optional[Metrics] = None, read_only: bool = False):
         """TODO
 
-        - auto_update: `update_` automatically before any `get_`"""
+        - auto_update: `update_` automatically before any `get_`, without retrying dead letters
+        - ingestion_profile: SQLite pragmas for bulk writes, e.g. `db.IngestionProfile()` for WAL
+        - read_cache: keep recent `get_daily`/`get_dailies` results, e.g. `ReadCache(max_bytes=64 * 1024 * 1024)`
+        - archive_directory: where `archive_dailies` and `archive_hourlies` keep partitions, by default database_path with an ".archive" suffix
+        - metrics: where sync stages, rows written and skipped or failed chunks are recorded, by default the registry Datawars requests are recorded in (see `datawars.set_metrics`)
+        - read_only: open an existing database without running the schema script or allowing writes (see `db.connect_read_only`)"""
 
         self._auto_update = auto_update
-        self.conn = db.connect(database_path)
+        self.metrics = metrics if metrics is not None else datawars.metrics
+        self._read_cache = read_cache
+        self._remote_daily_watermark = RemoteWatermark()
+        self._upsert_statements = {}
+        self._read_only = read_only
+        self.conn = db.connect_read_only(database_path, ingestion_profile) if read_only else db.connect(database_path, ingestion_profile)
+        self._archive_directory = archive_directory if archive_directory is not None else f"{database_path}.archive"
+        self._archived_tables = self._archived_table_names()
 
     def __del__(self):
         """TODO"""
-        self.conn.close()
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection. Safe to call more than once."""
+
+        conn = getattr(self, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def update_daily(self, item_id: int, full_download: bool = False) -> bool:
         """Download and write missing daily data for item_id to database.
@@ -37,155 +143,873 @@ class Gw2TpDb():
         Idempotent."""
 
         if full_download:
-            logger.debug(f"Daily history data for item_id {item_id} not found in database. Will download full history.")
+            logger.debug("Daily history data for item_id %s not found in database. Will download full history.", item_id)
             start = None
         else:
             most_recent_local_timestamp_opt = self._most_recent_local_daily_timestamp(item_id)
             if most_recent_local_timestamp_opt is None:
-                logger.debug(f"Daily history data for item_id {item_id} not found in database. Will download full history.")
+                logger.debug("Daily history data for item_id %s not found in database. Will download full history.", item_id)
                 start = None
             else:
                 most_recent_local_timestamp = most_recent_local_timestamp_opt
                 most_recent_remote_timestamp = self._most_recent_remote_daily_timestamp()
-                logger.debug(f"Most recent remote data is dated {most_recent_remote_timestamp}")
-                if most_recent_local_timestamp > most_recent_remote_timestamp:
-                    logger.debug(f"Daily history data for item_id {item_id} is more recent than most-recent remote data. Skipping update.")
+                logger.debug("Most recent remote data is dated %s", most_recent_remote_timestamp)
+                if most_recent_remote_timestamp is None:
+                    logger.debug("Cannot determine most recent remote data. Will download partial history for item_id %s.", item_id)
+                    start = (most_recent_local_timestamp + timedelta(days=1)).date()
+                elif most_recent_local_timestamp > most_recent_remote_timestamp:
+                    logger.debug("Daily history data for item_id %s is more recent than most-recent remote data. Skipping update.", item_id)
                     return True
-                if most_recent_local_timestamp == most_recent_remote_timestamp:
-                    logger.debug(f"Daily history data for item_id {item_id} is up to date. Skipping update.")
+                elif most_recent_local_timestamp == most_recent_remote_timestamp:
+                    logger.debug("Daily history data for item_id %s is up to date. Skipping update.", item_id)
                     return True
                 else:
-                    logger.debug(f"Daily history data for item_id {item_id} is out of date. Most recent available data is dated at {most_recent_remote_timestamp} whereas the latest in database is {most_recent_local_timestamp}. Will download partial history.")
+                    logger.debug("Daily history data for item_id %s is out of date. Most recent available data is dated at %s whereas the latest in database is %s. Will download partial history.", item_id, most_recent_remote_timestamp, most_recent_local_timestamp)
                     start = (most_recent_local_timestamp + timedelta(days=1)).date()
 
-        daily_data_opt = get_daily(item_id, start=start)
-        if daily_data_opt is None:
-            logger.error(f"Daily history data download returned None. Cannot update item_id {item_id} in database.")
+        records_opt = get_dailies_json([item_id], start=start)
+        if records_opt is None:
+            logger.error("Daily history data download returned None. Cannot update item_id %s in database.", item_id)
             return False
-        daily_data = daily_data_opt
+        rows = list(map(history_json_to_tuple, records_opt))
 
-        self._write_daily(daily_data)
+        self._observe_remote_daily_rows(rows)
+        with self._transaction():
+            self._write_daily_rows(rows, commit=False)
 
         return True
 
-    def update_dailies(self, item_ids: int, chunk_size: int = 20) -> bool:
+    def update_dailies(self, item_ids: int, chunk_size: int = 20, retry_dead_letters: bool = True) -> bool:
         """Download and write missing daily data for each ID in item_ids.
 
-        Return false when unsuccessful.
+        Each chunk commits together with its sync_journal entry, so an
+        interrupted run can be finished by `resume_sync` without repeating
+        a request. Failed chunks are bisected down to the IDs that keep
+        failing, which are recorded in dead_letters. Unless
+        retry_dead_letters is false, dead-lettered IDs whose backoff has
+        passed are synced along with item_ids (see `_with_dead_letters`).
+
+        Return false when any item failed to download.
 
         Idempotent."""
 
-        # TODO: Squash this into a single SQL query
+        if retry_dead_letters:
+            item_ids = self._with_dead_letters("daily_history", item_ids)
         most_recent_local_timestamps = self._most_recent_local_daily_timestamps(item_ids)
 
+        success = True
         item_ids_not_in_db = [key for key in most_recent_local_timestamps if most_recent_local_timestamps[key] is None]
         if (len(item_ids_not_in_db) > 0):
-            logger.debug(f"{len(item_ids_not_in_db)} item IDs are missing from the database. Will download full history with individual requests.")
-
-            for i, item_id in enumerate(item_ids_not_in_db):
-                most_recent_local_timestamp = most_recent_local_timestamps[item_id]
-                self.update_daily(item_id, full_download=True)
+            logger.debug("%s item IDs are missing from the database. Will download full history with batched requests.", len(item_ids_not_in_db))
+            success = self._backfill_dailies(item_ids_not_in_db)
 
         item_ids_in_db = [key for key in most_recent_local_timestamps if most_recent_local_timestamps[key] is not None]
         if (len(item_ids_in_db) == 0):
-            return True
+            return success
 
-        sublist_count = math.ceil(len(item_ids_in_db) / chunk_size)
-        most_recent_remote_timestamp = self._most_recent_remote_daily_timestamp()
-        logger.debug(f"Most recent remote data is dated {most_recent_remote_timestamp}")
-        for item_ids in [item_ids_in_db[i*chunk_size:(i+1)*chunk_size] for i in range(sublist_count)]:
-            self._update_dailies(item_ids, most_recent_local_timestamps, most_recent_remote_timestamp)
+        jobs, _ = self._daily_jobs(item_ids_in_db, chunk_size)
+        if len(jobs) == 0:
+            return success
+        run_id = self._start_sync_run("daily_history", jobs)
 
-        self.conn.commit()
+        return self._run_sync(run_id) and success
 
-        return True
+    def backfill_dailies(self, item_ids: List[int], target_rows_per_request: int = backfill_target_rows_per_request, max_batch_size: int = backfill_max_batch_size) -> bool:
+        """Download and write full daily history for each ID in item_ids missing from the database.
 
-    def _update_dailies(self, item_ids: int, most_recent_local_timestamps: dict[int, datetime], most_recent_remote_timestamp: datetime) -> bool:
-        """TODO"""
+        Return false when any item failed to download.
 
-        oldest_most_recent_local_timestamp = self._oldest_timestamp([most_recent_local_timestamps[item_id] for item_id in item_ids])
-        if oldest_most_recent_local_timestamp > most_recent_remote_timestamp:
-            logger.debug(f"Daily history data for all item_ids ({item_ids}) is more recent than most-recent remote data. Skipping update.")
+        Idempotent and resumable: see `_backfill_dailies`."""
+
+        most_recent_local_timestamps = self._most_recent_local_daily_timestamps(item_ids)
+        item_ids_not_in_db = [key for key in most_recent_local_timestamps if most_recent_local_timestamps[key] is None]
+
+        return self._backfill_dailies(item_ids_not_in_db, target_rows_per_request, max_batch_size)
+
+    def _backfill_dailies(self, item_ids: List[int], target_rows_per_request: int = backfill_target_rows_per_request, max_batch_size: int = backfill_max_batch_size) -> bool:
+        """Download and write full daily history for item_ids with multi-ID requests.
+
+        Batches grow or shrink so each response holds about
+        target_rows_per_request rows. Each batch commits together with its
+        backfill_progress rows, so a backfill that was interrupted before
+        returning skips the IDs it already reached when it is run again.
+        The progress of item_ids is cleared before returning, so IDs without
+        any history are requested again by later backfills.
+
+        Return false when any ID failed to download on its own and was
+        dead-lettered; batches recovered by smaller retries count as success."""
+
+        attempted_item_ids = self._backfill_progress_ids()
+        remaining_item_ids = [item_id for item_id in item_ids if item_id not in attempted_item_ids]
+        if len(remaining_item_ids) < len(item_ids):
+            logger.debug("Resuming backfill: skipping %s item IDs attempted by an earlier run", len(item_ids) - len(remaining_item_ids))
+
+        success = True
+        batch_size = min(backfill_initial_batch_size, max_batch_size)
+        rows_per_item = None
+        while len(remaining_item_ids) > 0:
+            batch = remaining_item_ids[:batch_size]
+            with self.metrics.stage("backfill_batch"):
+                row_counts_opt = self._backfill_batch(batch)
+            if row_counts_opt is None:
+                if batch_size > 1:
+                    # Large responses are the most likely cause of a timeout, so retry the same IDs in smaller batches.
+                    batch_size = max(1, batch_size // 2)
+                    continue
+                success = False
+                self._add_dead_letters("daily_history", batch)
+                remaining_item_ids = remaining_item_ids[1:]
+                continue
+            row_counts = row_counts_opt
+            remaining_item_ids = remaining_item_ids[len(batch):]
+            self._clear_dead_letters("daily_history", batch)
+
+            row_count = sum(row_counts.values())
+            logger.debug("Backfilled %s rows for %s item IDs; %s item IDs remaining", row_count, len(batch), len(remaining_item_ids))
+
+            # Smooth the estimate so one sparse or dense batch doesn't swing the next batch size.
+            batch_rows_per_item = max(row_count / len(batch), 1)
+            rows_per_item = batch_rows_per_item if rows_per_item is None else (rows_per_item + batch_rows_per_item) / 2
+            batch_size = max(1, min(max_batch_size, int(target_rows_per_request / rows_per_item)))
+
+        with self._transaction():
+            for chunk in _chunked(item_ids, max_query_variables):
+                self.conn.cursor().execute(f"DELETE FROM backfill_progress WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+        return success
+
+    def _backfill_batch(self, item_ids: List[int]) -> Optional[dict[int, int]]:
+        """Stream full daily history for item_ids into the database.
+
+        Commits the rows together with their backfill_progress rows. Return
+        the number of rows written per item ID, or None when the download
+        failed, in which case nothing is written."""
+
+        records_opt = iter_dailies_json(item_ids)
+        if records_opt is None:
+            logger.error("Daily history data download returned None. Cannot backfill %s item IDs starting at %s.", len(item_ids), item_ids[0])
+            return None
+        records = records_opt
+
+        row_counts = dict.fromkeys(item_ids, 0)
+        newest_timestamp = None
+
+        def counted(rows):
+            nonlocal newest_timestamp
+            for row in rows:
+                row_counts[row[0]] = row_counts.get(row[0], 0) + 1
+                if newest_timestamp is None or row[-1] > newest_timestamp:
+                    newest_timestamp = row[-1]
+                yield row
+
+        try:
+            with self._transaction():
+                self._write_daily_rows(counted(map(history_json_to_tuple, records)), commit=False)
+                self.conn.cursor().executemany("INSERT OR REPLACE INTO backfill_progress VALUES(?, ?)", row_counts.items())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error("Daily history data download failed part way. Cannot backfill %s item IDs starting at %s: %s", len(item_ids), item_ids[0], e)
+            return None
+
+        if newest_timestamp is not None:
+            self._remote_daily_watermark.observe([datetime.fromtimestamp(newest_timestamp, tz=timezone.utc)])
+
+        return row_counts
+
+    def _backfill_progress_ids(self) -> set[int]:
+        """Return IDs reached by an interrupted backfill."""
+
+        return {row[0] for row in self._execute("SELECT id FROM backfill_progress")}
+
+    def _download_daily_rows(self, item_ids: List[int], start: Optional[datetime], most_recent_local_timestamps: dict[int, Optional[datetime]]) -> Optional[List[tuple]]:
+        """Download daily data from start for item_ids and return the rows newer than the local data.
+
+        Return None when the download failed."""
+
+        records_opt = get_dailies_json(item_ids, start=start)
+        if records_opt is None:
+            logger.error("Daily history data download returned None. Cannot update %s item IDs starting at %s.", len(item_ids), item_ids[0])
+            return None
+        with self.metrics.stage("convert"):
+            rows = list(map(history_json_to_tuple, records_opt))
+        self._observe_remote_daily_rows(rows)
+
+        return list(self._rows_newer_than(rows, most_recent_local_timestamps))
+
+    async def update_dailies_async(self, item_ids: List[int], chunk_size: int = 20, queue_size: int = default_queue_size) -> bool:
+        """Download and write missing daily data for each ID in item_ids.
+
+        Like `update_dailies`, but downloading, parsing and writing run as
+        overlapping stages (see `run_pipeline`) so the sync is bound by the
+        rate limit alone. Missing items are downloaded in full, chunk_size IDs
+        per request. Must be awaited on the thread that opened the database.
+
+        Each chunk commits together with its sync_journal entry, so
+        `resume_sync` can finish an interrupted run. Chunks that failed are
+        retried and bisected like in `update_dailies` once the pipeline has
+        drained.
+
+        Return false when unsuccessful.
+
+        Idempotent."""
+
+        jobs, most_recent_local_timestamps = self._daily_jobs(item_ids, chunk_size)
+        if len(jobs) == 0:
             return True
+        run_id = self._start_sync_run("daily_history", jobs)
+
+        async def fetch(job):
+            _, (chunk, start) = job
+            return await _datawars_get_async(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, chunk, start))
+
+        def parse(job, response):
+            rows = list(map(history_json_to_tuple, response.json()))
+            newest_timestamp = max((row[-1] for row in rows), default=None)
+            return newest_timestamp, list(self._rows_newer_than(rows, most_recent_local_timestamps))
+
+        def write(job, result):
+            index, (chunk, _) = job
+            newest_timestamp, rows = result
+            if newest_timestamp is not None:
+                self._remote_daily_watermark.observe([datetime.fromtimestamp(newest_timestamp, tz=timezone.utc)])
+            self._write_sync_chunk("daily_history", run_id, index, chunk, rows)
+
+        failed_jobs = []
+        with self.metrics.stage("sync_run"):
+            await run_pipeline(list(enumerate(jobs)), fetch, parse, write, queue_size=queue_size, on_failure=failed_jobs.append)
+            if len(failed_jobs) > 0:
+                logger.debug("Retrying %s failed daily history requests", len(failed_jobs))
+                self._sync_chunks("daily_history",
+                                  [job for _, job in failed_jobs],
+                                  lambda chunk, start: self._download_daily_rows(chunk, start, most_recent_local_timestamps),
+                                  lambda index, succeeded: self._checkpoint_sync(run_id, failed_jobs[index][0], succeeded))
+
+        return self._finish_sync_run(run_id)
+
+    def _daily_jobs(self, item_ids: List[int], chunk_size: int) -> tuple[List[tuple[List[int], Optional[date]]], dict[int, Optional[datetime]]]:
+        """Plan the daily history requests that bring item_ids up to date.
+
+        Return (item ID chunk, start date) jobs, with a start of None for
+        items missing from the database, and the local freshness the jobs
+        were planned from. Chunks that are already up to date are skipped."""
+
+        most_recent_local_timestamps = self._most_recent_local_daily_timestamps(item_ids)
+        item_ids_not_in_db = [key for key in most_recent_local_timestamps if most_recent_local_timestamps[key] is None]
+        item_ids_in_db = [key for key in most_recent_local_timestamps if most_recent_local_timestamps[key] is not None]
+
+        jobs = [(chunk, None) for chunk in _chunked(item_ids_not_in_db, chunk_size)]
+        if len(item_ids_in_db) > 0:
+            most_recent_remote_timestamp = self._most_recent_remote_daily_timestamp()
+            for chunk in _chunked(item_ids_in_db, chunk_size):
+                oldest_most_recent_local_timestamp = self._oldest_timestamp([most_recent_local_timestamps[item_id] for item_id in chunk])
+                if most_recent_remote_timestamp is not None and oldest_most_recent_local_timestamp >= most_recent_remote_timestamp:
+                    self.metrics.increment("chunks", outcome="skipped", table="daily_history")
+                    continue
+                jobs.append((chunk, (oldest_most_recent_local_timestamp + timedelta(days=1)).date()))
+        logger.debug("Downloading daily history for %s item IDs in %s requests", len(item_ids_not_in_db) + len(item_ids_in_db), len(jobs))
+
+        return jobs, most_recent_local_timestamps
+
+    def update_hourly(self, item_id: int) -> bool:
+        """Download and write missing hourly data for item_id to database.
+
+        Return false when unsuccessful.
+
+        Idempotent."""
+
+        return self.update_hourlies([item_id], retry_dead_letters=False)
+
+    def update_hourlies(self, item_ids: List[int], chunk_size: int = 20, retry_dead_letters: bool = True) -> bool:
+        """Download and write missing hourly data for each ID in item_ids.
+
+        IDs are requested chunk_size at a time, starting the hour after the
+        oldest latest stored hour in the chunk; IDs missing from the database
+        are downloaded in full in their own chunks. Responses are parsed as
+        they stream in, keeping only the new rows, and each chunk's rows
+        commit together with its sync_journal entry once its download
+        finishes, so `resume_sync` can finish an interrupted run.
+
+        Failed chunks are bisected and dead-lettered, and dead letters are
+        retried, like in `update_dailies`.
 
-        if oldest_most_recent_local_timestamp == most_recent_remote_timestamp:
-            logger.debug(f"Daily history data for all item_ids ({item_ids}) are up to date. Skipping update.")
+        Return false when any item failed to download.
+
+        Idempotent."""
+
+        if retry_dead_letters:
+            item_ids = self._with_dead_letters("hourly_history", item_ids)
+        most_recent_local_timestamps = self._most_recent_local_timestamps("hourly_history", item_ids)
+        item_ids_not_in_db = [key for key in most_recent_local_timestamps if most_recent_local_timestamps[key] is None]
+        item_ids_in_db = [key for key in most_recent_local_timestamps if most_recent_local_timestamps[key] is not None]
+
+        # Hourly entries are dated at the start of their hour and published once it ends.
+        most_recent_possible_timestamp = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+
+        jobs = [(chunk, None) for chunk in _chunked(item_ids_not_in_db, chunk_size)]
+        for chunk in _chunked(item_ids_in_db, chunk_size):
+            oldest_most_recent_local_timestamp = self._oldest_timestamp([most_recent_local_timestamps[item_id] for item_id in chunk])
+            if oldest_most_recent_local_timestamp >= most_recent_possible_timestamp:
+                logger.debug("Hourly history data for %s item IDs starting at %s is up to date. Skipping update.", len(chunk), chunk[0])
+                self.metrics.increment("chunks", outcome="skipped", table="hourly_history")
+                continue
+            jobs.append((chunk, oldest_most_recent_local_timestamp + timedelta(hours=1)))
+        if len(jobs) == 0:
             return True
+        run_id = self._start_sync_run("hourly_history", jobs)
 
-        logger.debug(f"Daily history data is out of date. Most recent available data is dated at {most_recent_remote_timestamp} whereas the oldest most-recent in database is {oldest_most_recent_local_timestamp}. Will download partial history for all item ids ({item_ids}).")
-        start = (oldest_most_recent_local_timestamp + timedelta(days=1)).date()
+        return self._run_sync(run_id)
 
-        daily_entries = get_dailies(item_ids, start=start)
-        if daily_entries is None:
-            logger.error(f"Daily history data download returned None. Cannot update item_ids ({item_ids}).")
-            return False
+    def _download_hourly_rows(self, item_ids: List[int], start: Optional[datetime], most_recent_local_timestamps: dict[int, Optional[datetime]]) -> Optional[List[tuple]]:
+        """Download hourly data from start for item_ids and return the rows newer than the local data.
 
-        for item_id, entries in daily_entries.items():
-            most_recent_local_timestamp_opt = self._most_recent_local_daily_timestamp(item_id)
-            if most_recent_local_timestamp_opt is None:
-                entries_to_write = entries
-            else:
-                most_recent_local_timestamp = most_recent_local_timestamp_opt
-                entries_to_write = [entry for entry in entries if entry.utc_timestamp > most_recent_local_timestamp]
+        The response is parsed as it streams in, so only the rows to write
+        are held in memory. Return None when the download failed."""
+
+        records_opt = iter_hourlies_json(item_ids, start=start)
+        if records_opt is None:
+            logger.error("Hourly history data download returned None. Cannot update %s item IDs starting at %s.", len(item_ids), item_ids[0])
+            return None
+        records = records_opt
+
+        try:
+            rows = list(self._rows_newer_than(map(history_json_to_tuple, records), most_recent_local_timestamps))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error("Hourly history data download failed part way. Cannot update %s item IDs starting at %s: %s", len(item_ids), item_ids[0], e)
+            return None
+
+        logger.debug("Downloaded %s new hourly rows for %s item IDs starting at %s", len(rows), len(item_ids), item_ids[0])
+
+        return rows
+
+    def resume_sync(self) -> bool:
+        """Finish every sync run that was interrupted before completing.
+
+        Chunks committed by the interrupted run are not requested again.
+
+        Return false when any chunk of the resumed runs failed."""
+
+        success = True
+        for (run_id,) in self._execute("SELECT run_id FROM sync_runs WHERE finished_at IS NULL ORDER BY run_id"):
+            logger.debug("Resuming sync run %s", run_id)
+            success = self._run_sync(run_id) and success
+
+        return success
+
+    def _start_sync_run(self, table_name: str, jobs: List[tuple[List[int], Optional[datetime]]]) -> int:
+        """Record a sync run of table_name with one pending sync_journal entry per (item IDs, start) job.
+
+        Return the run ID."""
+
+        started_at = int(datetime.now(timezone.utc).timestamp())
+        with self._transaction():
+            cursor = self.conn.cursor()
+            cursor.execute("INSERT INTO sync_runs (table_name, started_at) VALUES (?, ?)", (table_name, started_at))
+            run_id = cursor.lastrowid
+            cursor.executemany("INSERT INTO sync_journal VALUES (?, ?, ?, ?, 'pending')",
+                               [(run_id, chunk, ",".join(map(str, item_ids)), None if start is None else int(_to_timestamp(start)))
+                                for chunk, (item_ids, start) in enumerate(jobs)])
+        logger.debug("Started sync run %s of %s with %s chunks", run_id, table_name, len(jobs))
+
+        return run_id
+
+    def _run_sync(self, run_id: int) -> bool:
+        """Sync the pending chunks of run_id, committing each with its journal entry, then mark the run finished.
+
+        Return false when any chunk of the run failed, including chunks
+        that failed before an interruption."""
+
+        table_name = self._execute("SELECT table_name FROM sync_runs WHERE run_id = ?", (run_id,))[0][0]
+        entries = [(chunk, list(map(int, item_ids.split(","))), None if start is None else datetime.fromtimestamp(start, tz=timezone.utc))
+                   for chunk, item_ids, start in self._execute("SELECT chunk, item_ids, start FROM sync_journal WHERE run_id = ? AND status = 'pending' ORDER BY chunk", (run_id,))]
+        most_recent_local_timestamps = self._most_recent_local_timestamps(table_name, [item_id for _, item_ids, _ in entries for item_id in item_ids])
+        download = self._download_daily_rows if table_name == "daily_history" else self._download_hourly_rows
+
+        with self.metrics.stage("sync_run"):
+            self._sync_chunks(table_name,
+                              [(item_ids, start) for _, item_ids, start in entries],
+                              lambda item_ids, start: download(item_ids, start, most_recent_local_timestamps),
+                              lambda index, succeeded: self._checkpoint_sync(run_id, entries[index][0], succeeded))
+
+        return self._finish_sync_run(run_id)
+
+    def _checkpoint_sync(self, run_id: int, chunk: int, succeeded: bool) -> None:
+        """Mark sync_journal entry chunk of run_id done or failed. Does not commit."""
+
+        self.conn.cursor().execute("UPDATE sync_journal SET status = ? WHERE run_id = ? AND chunk = ?", ("done" if succeeded else "failed", run_id, chunk))
+
+    def _finish_sync_run(self, run_id: int) -> bool:
+        """Mark run_id finished and drop its journal entries.
+
+        Only the last kept_sync_runs finished runs of each table are kept.
+
+        Return false when any chunk of the run failed."""
+
+        with self._transaction():
+            failed_chunk_count = self._execute("SELECT COUNT(*) FROM sync_journal WHERE run_id = ? AND status = 'failed'", (run_id,))[0][0]
+            self.conn.cursor().execute("UPDATE sync_runs SET finished_at = ?, failed_chunk_count = ? WHERE run_id = ?", (int(datetime.now(timezone.utc).timestamp()), failed_chunk_count, run_id))
+            self.conn.cursor().execute("DELETE FROM sync_journal WHERE run_id = ?", (run_id,))
+            self.conn.cursor().execute(
+                "DELETE FROM sync_runs WHERE finished_at IS NOT NULL AND table_name = (SELECT table_name FROM sync_runs WHERE run_id = ?) AND run_id NOT IN "
+                "(SELECT run_id FROM sync_runs WHERE finished_at IS NOT NULL AND table_name = (SELECT table_name FROM sync_runs WHERE run_id = ?) ORDER BY run_id DESC LIMIT ?)",
+                (run_id, run_id, kept_sync_runs))
+
+        return failed_chunk_count == 0
+
+    def _write_sync_chunk(self, table_name: str, run_id: int, chunk: int, item_ids: List[int], rows: List[tuple]) -> None:
+        """Write rows downloaded for journal entry chunk of run_id and mark it done, in one transaction.
+
+        For syncs that download chunks ahead of `_sync_chunks`."""
+
+        with self._transaction():
+            self._insert_many(table_name, rows, commit=False)
+            self.metrics.increment("chunks", outcome="succeeded", table=table_name)
+            self._clear_dead_letters(table_name, item_ids)
+            self._checkpoint_sync(run_id, chunk, True)
+
+    def _sync_chunks(self, table_name: str, jobs: List[tuple[List[int], Optional[datetime]]], download_chunk: Callable[[List[int], Optional[datetime]], Optional[List[tuple]]], checkpoint: Optional[Callable[[int, bool], None]] = None) -> bool:
+        """Download and write each (item IDs, start) job with download_chunk, bisecting the IDs of jobs that fail.
+
+        download_chunk returns the rows to write to table_name, or None when
+        the download failed. Each job's downloads, including its bisection,
+        finish before one transaction writes its rows, updates the dead
+        letters and calls checkpoint(job index, whether every ID succeeded),
+        so the write lock is never held during a request. IDs that fail on
+        their own are dead-lettered for table_name, as are all remaining IDs
+        once max_consecutive_failures requests in a row have failed, so an
+        outage doesn't spend the request budget on bisection. IDs that
+        succeed leave the dead letters.
+
+        Return false when any ID failed."""
+
+        success = True
+        consecutive_failures = 0
+        for index, (item_ids, start) in enumerate(jobs):
+            rows = []
+            succeeded_item_ids = []
+            failed_item_ids = []
+            pending_chunks = [item_ids]
+            while len(pending_chunks) > 0:
+                chunk = pending_chunks.pop()
+                if consecutive_failures >= max_consecutive_failures:
+                    self.metrics.increment("chunks", outcome="deferred", table=table_name)
+                    failed_item_ids += chunk
+                    continue
+                with self.metrics.stage("sync_chunk"):
+                    chunk_rows_opt = download_chunk(chunk, start)
+                if chunk_rows_opt is not None:
+                    consecutive_failures = 0
+                    self.metrics.increment("chunks", outcome="succeeded", table=table_name)
+                    rows += chunk_rows_opt
+                    succeeded_item_ids += chunk
+                    continue
+
+                consecutive_failures += 1
+                self.metrics.increment("chunks", outcome="failed", table=table_name)
+                if consecutive_failures == max_consecutive_failures:
+                    logger.error("%s requests failed in a row. Deferring the remaining %s item IDs to the next sync.", consecutive_failures, table_name)
+                if len(chunk) > 1:
+                    middle = len(chunk) // 2
+                    pending_chunks += [chunk[middle:], chunk[:middle]]
+                else:
+                    failed_item_ids += chunk
+
+            job_success = len(failed_item_ids) == 0
+            with self._transaction():
+                self._write_history_rows(table_name, rows, commit=False)
+                if len(succeeded_item_ids) > 0:
+                    self._clear_dead_letters(table_name, succeeded_item_ids)
+                if not job_success:
+                    self._add_dead_letters(table_name, failed_item_ids)
+                if checkpoint is not None:
+                    checkpoint(index, job_success)
+            success = success and job_success
+
+        return success
+
+    def get_dead_letters(self, table_name: str = "daily_history") -> dict[int, int]:
+        """Return the number of failed attempts for each dead-lettered item ID of table_name."""
+
+        return dict(self._execute("SELECT id, attempts FROM dead_letters WHERE table_name = ? ORDER BY id", (table_name,)))
+
+    def _with_dead_letters(self, table_name: str, item_ids: List[int]) -> List[int]:
+        """Return item_ids followed by the dead-lettered IDs of table_name that are due for a retry.
+
+        An ID is due dead_letter_backoff_seconds after its first failure,
+        twice that after its second and so on. IDs that failed
+        max_dead_letter_attempts times are only synced when requested."""
+
+        now = int(datetime.now(timezone.utc).timestamp())
+        due_item_ids = [item_id for item_id, attempts, last_failed_at in self._execute("SELECT id, attempts, last_failed_at FROM dead_letters WHERE table_name = ? AND attempts < ? ORDER BY id", (table_name, max_dead_letter_attempts))
+                        if last_failed_at + dead_letter_backoff_seconds * 2 ** (attempts - 1) <= now]
+
+        return list(dict.fromkeys(list(item_ids) + due_item_ids))
+
+    def _add_dead_letters(self, table_name: str, item_ids: List[int]) -> None:
+        logger.warning("Dead-lettering %s %s item IDs starting at %s", len(item_ids), table_name, item_ids[0])
+        self.metrics.increment("dead_lettered", len(item_ids), table=table_name)
+        failed_at = int(datetime.now(timezone.utc).timestamp())
+        with self._transaction():
+            self.conn.cursor().executemany(
+                "INSERT INTO dead_letters VALUES (?, ?, 1, ?) ON CONFLICT(table_name, id) DO UPDATE SET attempts = attempts + 1, last_failed_at = excluded.last_failed_at",
+                [(table_name, item_id, failed_at) for item_id in item_ids])
+
+    def _clear_dead_letters(self, table_name: str, item_ids: List[int]) -> None:
+        with self._transaction():
+            for chunk in _chunked(item_ids, max_query_variables):
+                self.conn.cursor().execute(f"DELETE FROM dead_letters WHERE table_name = ? AND id IN ({','.join('?' * len(chunk))})", [table_name] + chunk)
+
+    def rollup_hourlies(self) -> int:
+        """Recompute daily_history rows from hourly_history for days whose hourly data changed.
+
+        Writes to hourly_history mark their day as pending (see the triggers
+        in schema.sql), so only those days are recomputed. Days that have not
+        ended yet stay pending. Sums, minimums, maximums, count-weighted
+        averages and pooled standard deviations are computed inside SQLite.
+
+        Return the number of days recomputed."""
+
+        with self._transaction():
+            day_count = rollup.rollup(self.conn, complete_before=int(datetime.now(timezone.utc).timestamp()))
+            if day_count > 0:
+                self._refresh_summaries(rollup.batch_item_ids(self.conn))
+                self._invalidate_reads(rollup.batch_item_ids(self.conn))
 
-            self._write_daily(entries_to_write, commit=False)
+        return day_count
 
+    def validate_rollup(self, item_ids: Optional[List[int]] = None, start: Optional[datetime] = None, end: Optional[datetime] = None, tolerance: float = rollup.default_tolerance) -> List[rollup.RollupMismatch]:
+        """Return differences between daily rows computed from hourly data and downloaded daily rows.
+
+        Compares days with start <= utc_timestamp < end present in both
+        tables. Run it before `rollup_hourlies` overwrites downloaded days."""
+
+        return rollup.validate(self.conn, item_ids,
+                               None if start is None else _to_timestamp(start),
+                               None if end is None else _to_timestamp(end),
+                               tolerance)
 
     def populate_items(self) -> bool:
         """Download and write item data to database.
 
+        Return false when unsuccessful. See `sync_items`.
+
         Idempotent."""
-        logger.debug(f"Attempting to populate items table")
 
-        if self._items_table_populated():
-            logger.debug(f"Item table already populated")
-            return False
+        return self.sync_items() is not None
+
+    def sync_items(self) -> Optional[int]:
+        """Download the item catalog and write new and renamed items to database.
+
+        The catalog's hash is stored in catalog_version, so an unchanged
+        catalog is recognized without comparing it item by item. Items that
+        disappear from the catalog are kept since history may refer to them.
+
+        Return the number of items written, or None when the download failed.
 
+        Idempotent."""
+
+        logger.debug("Attempting to sync items table")
         items_opt = get_items()
         if items_opt is None:
-            logger.debug(f"ItemEntry data missing. Cannot update items table.")
-            return False
-        items = items_opt
+            logger.debug("ItemEntry data missing. Cannot update items table.")
+            return None
+        rows = sorted(map(item_entry_to_tuple, items_opt))
 
-        self._write_items(items)
+        catalog_hash = hashlib.sha256(json.dumps(rows, separators=(",", ":")).encode()).hexdigest()
+        stored_hash_opt = self._execute("SELECT hash FROM catalog_version")
+        if stored_hash_opt and stored_hash_opt[0][0] == catalog_hash and self._items_table_populated():
+            logger.debug("Item catalog unchanged")
+            return 0
 
-        return True
+        with self._transaction():
+            if self._items_table_populated():
+                stored_names = dict(self._execute("SELECT id, name FROM items"))
+                rows = [row for row in rows if stored_names.get(row[0]) != row[1]]
+            self._insert_many("items", rows, commit=False)
+            self.conn.cursor().execute("INSERT OR REPLACE INTO catalog_version VALUES (0, ?, ?, ?)",
+                                       (catalog_hash, len(items_opt), int(datetime.now(timezone.utc).timestamp())))
+        logger.debug("Wrote %s new or renamed items", len(rows))
+
+        return len(rows)
 
-    def get_daily(self, item_id: int) -> Optional[List[HistoryEntry]]:
-        """Return daily data for ITEM_ID."""
+    def get_daily(self, item_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[List[str]] = None) -> Optional[List[HistoryEntry]]:
+        """Return daily data for ITEM_ID, oldest first.
+
+        See `_select_history` for start, end and columns."""
         if self._auto_update:
             self.update_daily(item_id)
 
-        rows_opt = self._execute(f"SELECT * FROM daily_history WHERE id = {item_id} ORDER BY utc_timestamp ASC")
-        if rows_opt is None:
-            logger.debug(f"No items (id = {item_id}) found in database")
-            return None
-        rows = rows_opt
+        return list(self._read_dailies([item_id], start, end, columns)[item_id])
 
-        return list(map(row_to_history_entry, rows))
+    def get_dailies(self, item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[List[str]] = None) -> Optional[dict[int, List[HistoryEntry]]]:
+        """Return daily data for each ID in item_ids, oldest first.
 
-    def get_dailies(self, item_ids: List[int]) -> Optional[dict[List[HistoryEntry]]]:
-        """Return daily data for ITEM_ID."""
+        Items without data are absent from the result. See `_select_history`
+        for start, end and columns."""
         if self._auto_update:
-            self.update_dailies(item_ids)
+            self.update_dailies(item_ids, retry_dead_letters=False)
 
-        logger.debug("Querying database")
-        rows_opt = self._execute(f"SELECT * FROM daily_history WHERE id IN ({','.join(list(map(str, item_ids)))}) ORDER BY utc_timestamp ASC")
-        if rows_opt is None:
-            logger.debug(f"Database returned no rows")
-            return None
-        rows = rows_opt
-        logger.debug(f"Done querying database")
+        return {item_id: list(entries)
+                for item_id, entries in sorted(self._read_dailies(item_ids, start, end, columns).items())
+                if len(entries) > 0}
+
+    def get_dailies_columnar(self, item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[List[str]] = None) -> dict[int, HistorySeries]:
+        """Return daily data for each ID in item_ids as a columnar HistorySeries.
+
+        Uses a fraction of the memory of `get_dailies`: rows are packed into
+        typed arrays one item at a time and no HistoryEntry is built. Items
+        without data are absent from the result. See `_select_history` for
+        start, end and columns."""
+        if self._auto_update:
+            self.update_dailies(item_ids, retry_dead_letters=False)
+
+        names, rows = self._select_history("daily_history", item_ids, start, end, columns)
+
+        return {item_id: HistorySeries.from_rows(item_id, list(item_rows), names)
+                for item_id, item_rows in itertools.groupby(rows, key=lambda row: row[0])}
+
+    def get_hourly(self, item_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[List[str]] = None) -> List[HistoryEntry]:
+        """Return hourly data for ITEM_ID, oldest first.
+
+        See `_select_history` for start, end and columns."""
+        if self._auto_update:
+            self.update_hourly(item_id)
+
+        names, rows = self._select_history("hourly_history", [item_id], start, end, columns)
+
+        return [self._row_to_history_entry(names, row) for row in rows]
+
+    def get_hourlies(self, item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[List[str]] = None) -> dict[int, List[HistoryEntry]]:
+        """Return hourly data for each ID in item_ids, oldest first.
+
+        Items without data are absent from the result. See `_select_history`
+        for start, end and columns; pass start to avoid loading every hour
+        ever stored."""
+        if self._auto_update:
+            self.update_hourlies(item_ids, retry_dead_letters=False)
+
+        names, rows = self._select_history("hourly_history", item_ids, start, end, columns)
+
+        return {item_id: [self._row_to_history_entry(names, row) for row in item_rows]
+                for item_id, item_rows in itertools.groupby(rows, key=lambda row: row[0])}
+
+    def archive_dailies(self, before: datetime, vacuum: bool = False) -> int:
+        """Move daily history older than the UTC month containing BEFORE into compressed monthly partitions.
+
+        Archived rows are still returned by `get_daily`, `get_dailies` and
+        `get_dailies_columnar`. Each item's last 30 days of rows, counted
+        from its own most recent row, stay in SQLite so item summaries can
+        still be recomputed from it. Pass vacuum to shrink the database file
+        afterwards; otherwise freed pages are reused by later writes.
+
+        Return the number of rows moved."""
+
+        return self._archive("daily_history", before, vacuum)
+
+    def archive_hourlies(self, before: datetime, vacuum: bool = False) -> int:
+        """Move hourly history older than the UTC month containing BEFORE into compressed monthly partitions.
+
+        Like `archive_dailies`: archived rows are still returned by
+        `get_hourly` and `get_hourlies`, and each item's last 30 days of rows
+        stay in SQLite. Pending days are rolled up first (see
+        `rollup_hourlies`), so no day is rolled up after its hours left
+        SQLite.
+
+        Return the number of rows moved."""
+
+        self.rollup_hourlies()
+
+        return self._archive("hourly_history", before, vacuum)
+
+    def _archive(self, table_name: str, before: datetime, vacuum: bool) -> int:
+        with self._transaction():
+            row_count = archive.archive(self.conn, self._archive_directory, table_name, list(history_fields), int(_to_timestamp(before)))
+        if row_count > 0:
+            self._archived_tables.add(table_name)
+        if vacuum:
+            self.conn.execute("VACUUM")
+        logger.debug("Archived %s %s rows", row_count, table_name)
+
+        return row_count
+
+    def _archived_table_names(self) -> set[str]:
+        """Return the tables with rows in archive partitions."""
+
+        return {row[0] for row in self._execute("SELECT DISTINCT table_name FROM archive_partitions")}
+
+    def export_snapshot(self, directory: str, tables: Iterable[str] = snapshot.default_tables) -> dict:
+        """Write TABLES to a columnar snapshot in DIRECTORY and return its manifest.
+
+        Archived history is included. Every table is read in one read
+        transaction, so the snapshot is consistent even while another
+        connection writes. See `gw2tpdb.snapshot`."""
+
+        joined_transaction = self.conn.in_transaction
+        if not joined_transaction:
+            self.conn.execute("BEGIN")
+        try:
+            table_rows = dict.fromkeys(tables)
+            for table_name in self._archived_tables.intersection(table_rows):
+                # Every item keeps its latest rows in SQLite, so this lists every archived item too.
+                item_ids = [row[0] for row in self._execute(f"SELECT DISTINCT id FROM {table_name} ORDER BY id")]
+                # Merge archived rows a chunk of items at a time to bound memory.
+                table_rows[table_name] = itertools.chain.from_iterable(
+                    self._select_history(table_name, chunk)[1] for chunk in _chunked(item_ids, max_query_variables))
+
+            return snapshot.export_snapshot(self.conn, directory, table_rows)
+        finally:
+            if not joined_transaction:
+                self.conn.commit()
+
+    def import_snapshot(self, directory: str, tables: Optional[List[str]] = None) -> dict[str, int]:
+        """Bulk-load a snapshot written by `export_snapshot`, e.g. to seed a new replica.
+
+        Loads every table in the snapshot, or only TABLES, in one
+        transaction, then rebuilds the item summaries. Run `update_dailies`
+        afterwards to download only what is newer than the snapshot.
+
+        Return the number of rows loaded per table."""
+
+        with self._transaction():
+            row_counts = snapshot.import_snapshot(self.conn, directory, tables)
+            if "daily_history" in row_counts:
+                self.conn.cursor().execute("DELETE FROM item_summary")
+                self.conn.cursor().execute(_summary_upsert("1"))
+        if self._read_cache is not None:
+            self._read_cache.clear()
 
-        dailies = {}
-        logger.debug(f"Parsing {len(rows)} database rows")
-        for entry in list(map(row_to_history_entry, rows)):
-            if not entry.id in dailies:
-                dailies[entry.id] = []
-            dailies[entry.id] += [entry]
-        logger.debug(f"Done parsing {len(rows)} database rows")
+        return row_counts
 
-        return dailies
+    def get_summaries(self, item_ids: Optional[List[int]] = None) -> dict[int, ItemSummary]:
+        """Return the current summary for each ID in item_ids, or for every item.
+
+        Reads the item_summary table, which is kept up to date as daily
+        history is written, so no history is scanned. Items without daily
+        history are absent from the result."""
+
+        if item_ids is None:
+            rows = self._execute("SELECT * FROM item_summary ORDER BY id")
+        else:
+            rows = []
+            for chunk in _chunked(sorted(set(item_ids)), max_query_variables):
+                rows += self._execute(f"SELECT * FROM item_summary WHERE id IN ({','.join('?' * len(chunk))}) ORDER BY id", chunk)
+
+        return {row[0]: row_to_item_summary(row) for row in rows}
+
+    def rebuild_summaries(self) -> int:
+        """Recompute item_summary from daily_history for every item.
+
+        For recovery when the table is lost or suspect. Return the number of
+        summaries written."""
+
+        with self._transaction():
+            self.conn.cursor().execute("DELETE FROM item_summary")
+            self.conn.cursor().execute(_summary_upsert("1"))
+
+        return self._execute("SELECT COUNT(*) FROM item_summary")[0][0]
+
+    def _refresh_summaries(self, item_ids: Iterable[int]) -> None:
+        """Recompute item_summary rows for item_ids from daily_history. Does not commit."""
+
+        for chunk in _chunked(sorted(set(item_ids)), max_query_variables):
+            self.conn.cursor().execute(_summary_upsert(f"l.id IN ({','.join('?' * len(chunk))})"), chunk)
+
+    def _read_dailies(self, item_ids: List[int], start: Optional[datetime], end: Optional[datetime], columns: Optional[List[str]]) -> dict[int, List[HistoryEntry]]:
+        """Return daily entries for each ID in item_ids, with an empty list for items without data.
+
+        Uses the read cache when there is one; only items missing from it
+        are queried. Cached entries are returned as copies, so callers can
+        modify them without changing later reads."""
+
+        if self._read_cache is None:
+            names, rows = self._select_history("daily_history", item_ids, start, end, columns)
+            result = dict.fromkeys(item_ids, [])
+            result.update({item_id: [self._row_to_history_entry(names, row) for row in item_rows]
+                           for item_id, item_rows in itertools.groupby(rows, key=lambda row: row[0])})
+            return result
+
+        window = (None if start is None else _to_timestamp(start),
+                  None if end is None else _to_timestamp(end),
+                  None if columns is None else tuple(sorted(set(columns))))
+        result = {}
+        missing_item_ids = []
+        for item_id in dict.fromkeys(item_ids):
+            cached_opt = self._read_cache.get(("daily_history", item_id) + window)
+            if cached_opt is None:
+                missing_item_ids.append(item_id)
+            else:
+                result[item_id] = list(map(copy.copy, cached_opt))
+
+        if len(missing_item_ids) > 0:
+            names, rows = self._select_history("daily_history", missing_item_ids, start, end, columns)
+            loaded = {item_id: [self._row_to_history_entry(names, row) for row in item_rows]
+                      for item_id, item_rows in itertools.groupby(rows, key=lambda row: row[0])}
+            for item_id in missing_item_ids:
+                entries = loaded.get(item_id, [])
+                self._read_cache.put(("daily_history", item_id) + window, item_id, entries, estimate_bytes(entries))
+                result[item_id] = list(map(copy.copy, entries))
+
+        return result
+
+    def _invalidate_reads(self, item_ids: Iterable[int]) -> None:
+        """Drop cached reads of item_ids after their daily history changed."""
+
+        if self._read_cache is not None:
+            self._read_cache.invalidate(item_ids)
+
+    def _select_history(self, table_name: str, item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[List[str]] = None) -> tuple[List[str], Iterator[tuple]]:
+        """Query history rows for item_ids in (id, utc_timestamp) primary key order.
+
+        - start, end: only rows with start <= utc_timestamp < end. A naive
+          datetime or a date is taken as UTC.
+        - columns: only select these columns, plus id and utc_timestamp.
+
+        IDs are bound in chunks of `max_query_variables`. Archived rows are
+        merged in (see `archive_dailies`, `archive_hourlies`). Return the selected
+        column names and a lazy iterator over the rows.
+
+        Raises ValueError for unknown column names."""
+
+        if columns is None:
+            names = list(history_fields)
+        else:
+            unknown_columns = set(columns) - set(history_fields)
+            if len(unknown_columns) > 0:
+                raise ValueError(f"Unknown history columns: {sorted(unknown_columns)}")
+            names = ["id"] + [name for name in history_fields if name in columns and name not in ("id", "utc_timestamp")] + ["utc_timestamp"]
+
+        conditions = []
+        bounds = []
+        if start is not None:
+            conditions.append("utc_timestamp >= ?")
+            bounds.append(_to_timestamp(start))
+        if end is not None:
+            conditions.append("utc_timestamp < ?")
+            bounds.append(_to_timestamp(end))
+
+        def rows():
+            for chunk in _chunked(sorted(set(item_ids)), max_query_variables - len(bounds)):
+                question_marks = ",".join("?" * len(chunk))
+                where = " AND ".join([f"id IN ({question_marks})"] + conditions)
+                yield from self.conn.cursor().execute(f"SELECT {', '.join(names)} FROM {table_name} WHERE {where} ORDER BY id, utc_timestamp", chunk + bounds)
+
+        if self._read_only:
+            # Another process may have archived rows since this connection was opened.
+            self._archived_tables = self._archived_table_names()
+        if table_name in self._archived_tables:
+            archived_rows = archive.iter_archived_rows(self.conn, self._archive_directory, table_name, item_ids,
+                                                       None if start is None else _to_timestamp(start),
+                                                       None if end is None else _to_timestamp(end),
+                                                       names)
+            return names, archive.merge_rows(archived_rows, rows())
+
+        return names, rows()
+
+    def _row_to_history_entry(self, names: List[str], row: tuple) -> HistoryEntry:
+        """Build a HistoryEntry from a row selected by `_select_history`."""
+
+        if len(names) == len(history_fields):
+            return row_to_history_entry(row)
+
+        return projected_row_to_history_entry(names, row)
 
     def _daily_history_ids(self, ):
         """Return list of unique IDs in daily_history table."""
@@ -202,15 +1026,41 @@ class Gw2TpDb():
     def _write_daily(self, entries: List[HistoryEntry], commit: bool = True) -> None:
         """Write given daily history data to database."""
 
-        # TODO: Replace "daily_history" with variable
-        self._insert_many("daily_history", list(map(history_entry_to_tuple, entries)), commit)
+        self._write_daily_rows(map(history_entry_to_tuple, entries), commit)
+
+    def _write_daily_rows(self, rows: Iterable[tuple], commit: bool = True, chunk_rows: int = write_chunk_rows) -> int:
+        """Write daily history rows (see `history_json_to_tuple`) to database.
+
+        Return the number of rows written."""
+
+        return self._write_history_rows("daily_history", rows, commit, chunk_rows)
+
+    def _write_history_rows(self, table_name: str, rows: Iterable[tuple], commit: bool = True, chunk_rows: int = write_chunk_rows) -> int:
+        """Write history rows (see `history_json_to_tuple`) to table_name.
+
+        Rows are inserted chunk_rows at a time, so only one chunk is held in
+        memory. Return the number of rows written."""
+
+        rows = iter(rows)
+        row_count = 0
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if len(chunk) == 0:
+                break
+            self._insert_many(table_name, chunk, commit=False)
+            row_count += len(chunk)
+
+        if commit:
+            self._commit()
+
+        return row_count
 
     def _items_table_populated(self) -> bool:
         """Return true if the items table has any rows."""
 
-        result = self._execute("SELECT COUNT(*) FROM items LIMIT 1")
-        if result is None or result[0][0] is None:
-            logger.debug(f"Items table is empty")
+        result = self._execute("SELECT EXISTS (SELECT 1 FROM items)")
+        if result is None or not result[0][0]:
+            logger.debug("Items table is empty")
             return False
 
         return True
@@ -221,25 +1071,39 @@ class Gw2TpDb():
         Returns None if item_id is absent from the table."""
 
         # TODO: Replace "daily_history" with variable
-        result = self._execute(f"SELECT MAX(utc_timestamp) FROM daily_history WHERE id = {item_id}")
+        result = self._execute("SELECT MAX(utc_timestamp) FROM daily_history WHERE id = ?", (item_id,))
         if result is None or result[0][0] is None:
-            logger.debug(f"No daily history data found for item_id {item_id}")
+            logger.debug("No daily history data found for item_id %s", item_id)
             return None
         most_recent_timestamp = result[0][0]
         most_recent_datetime = datetime.fromtimestamp(most_recent_timestamp, tz=timezone.utc)
 
-        logger.debug(f"Most recent daily history data for item_id {item_id} is from {most_recent_datetime.isoformat()} ({most_recent_timestamp})")
+        logger.debug("Most recent daily history data for item_id %s is from %s (%s)", item_id, most_recent_datetime.isoformat(), most_recent_timestamp)
 
         return most_recent_datetime
 
     def _most_recent_local_daily_timestamps(self, item_ids: List[int]) -> dict[int, Optional[datetime]]:
-        """Return most recent timestamp for item_id in daily table.
+        """Return most recent timestamp for each ID in item_ids in daily table.
 
-        Returns None if item_id is absent from the table."""
+        Maps an ID to None if it is absent from the table."""
+
+        return self._most_recent_local_timestamps("daily_history", item_ids)
 
-        most_recent_timestamps = {}
-        for item_id in item_ids:
-            most_recent_timestamps[item_id] = self._most_recent_local_daily_timestamp(item_id)
+    def _most_recent_local_timestamps(self, table_name: str, item_ids: List[int]) -> dict[int, Optional[datetime]]:
+        """Return most recent timestamp for each ID in item_ids in table_name.
+
+        Maps an ID to None if it is absent from the table. Uses one grouped
+        query per `max_query_variables` IDs rather than one query per ID."""
+
+        most_recent_timestamps = dict.fromkeys(item_ids)
+        for chunk in _chunked(list(most_recent_timestamps), max_query_variables):
+            question_marks = ",".join("?" * len(chunk))
+            rows = self.conn.cursor().execute(f"SELECT id, MAX(utc_timestamp) FROM {table_name} WHERE id IN ({question_marks}) GROUP BY id", chunk).fetchall()
+            for item_id, most_recent_timestamp in rows:
+                most_recent_timestamps[item_id] = datetime.fromtimestamp(most_recent_timestamp, tz=timezone.utc)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Found %s data for %s of %s item IDs", table_name, sum(1 for timestamp in most_recent_timestamps.values() if timestamp is not None), len(most_recent_timestamps))
 
         return most_recent_timestamps
 
@@ -253,10 +1117,10 @@ class Gw2TpDb():
 
         return oldest_timestamp
 
-    def _execute(self, query: str) -> Optional[List[tuple]]:
-        """Execute given query and return results if present."""
+    def _execute(self, query: str, parameters: tuple = ()) -> Optional[List[tuple]]:
+        """Execute given query with bound parameters and return results if present."""
 
-        result = self.conn.cursor().execute(query)
+        result = self.conn.cursor().execute(query, parameters)
         if result is None:
             return None
 
@@ -266,27 +1130,110 @@ class Gw2TpDb():
         """Insert rows into table."""
 
         if len(rows) == 0:
-            logger.debug(f"Cannot insert an empty list into {table_name}")
+            logger.debug("Cannot insert an empty list into %s", table_name)
             return None
 
         if len(rows[0]) == 0:
-            logger.debug(f"Cannot insert empty tuples into {table_name}")
+            logger.debug("Cannot insert empty tuples into %s", table_name)
             return None
 
-        field_count = len(rows[0])
-        question_marks = ",".join(list("?" * field_count))
-        logger.debug(f"Inserting {len(rows)} rows into {table_name}")
-        self.conn.cursor().executemany(f"INSERT INTO {table_name} VALUES({question_marks})", rows)
+        logger.debug("Inserting %s rows into %s", len(rows), table_name)
+        with self.metrics.stage("write"):
+            self.conn.cursor().executemany(self._upsert_statement(table_name), rows)
+            if table_name == "daily_history":
+                self._refresh_summaries(row[0] for row in rows)
+                self._invalidate_reads(row[0] for row in rows)
+        self.metrics.increment("rows_written", len(rows), table=table_name)
         if commit:
+            self._commit()
+            logger.debug("Inserted %s rows into %s", len(rows), table_name)
+
+    def _upsert_statement(self, table_name: str) -> str:
+        """Return a statement that inserts a row into table_name, updating any row with the same primary key."""
+
+        if table_name in self._upsert_statements:
+            return self._upsert_statements[table_name]
+
+        columns = self._execute(f"PRAGMA table_info({table_name})")
+        column_names = [column[1] for column in columns]
+        primary_key = [column[1] for column in sorted(columns, key=lambda column: column[5]) if column[5] > 0]
+        question_marks = ",".join("?" * len(column_names))
+        statement = f"INSERT INTO {table_name} VALUES({question_marks})"
+        if len(primary_key) > 0:
+            updates = ", ".join(f"{name} = excluded.{name}" for name in column_names if name not in primary_key)
+            action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+            statement += f" ON CONFLICT({', '.join(primary_key)}) {action}"
+
+        self._upsert_statements[table_name] = statement
+        return statement
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Run the body in one explicit transaction.
+
+        Commits when the body succeeds and rolls back when it raises. Joins
+        the open transaction instead when one is already in progress, rolling
+        back only the body's own writes when it raises."""
+
+        if self.conn.in_transaction:
+            self.conn.execute("SAVEPOINT nested")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK TO nested")
+                self.conn.execute("RELEASE nested")
+                if self._read_cache is not None:
+                    self._read_cache.clear()
+                raise
+            self.conn.execute("RELEASE nested")
+            return
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            # Reads during the transaction may have cached rows that no longer exist.
+            if self._read_cache is not None:
+                self._read_cache.clear()
+            raise
+        self._commit()
+
+    def _commit(self) -> None:
+        with self.metrics.stage("commit"):
             self.conn.commit()
-            logger.debug(f"Inserted {len(rows)} rows into {table_name}")
 
     def _most_recent_remote_daily_timestamp(self) -> Optional[datetime]:
-        """Return most recent timestamp from server."""
+        """Return most recent timestamp from server.
+
+        Only asks the server when the cached watermark is absent or expired."""
+
+        cached_timestamp = self._remote_daily_watermark.get()
+        if cached_timestamp is not None:
+            return cached_timestamp
 
         yesterday = datetime.now(timezone.utc) - timedelta(days=1)
         entries_opt = get_daily(glob_of_ectoplasm_id, start=yesterday.date())
         if entries_opt is None or len(entries_opt) < 1:
-            logger.error(f"Daily history data download returned None or empty. Cannot determine most recent daily data.")
-            return False
-        return sorted(entries_opt, key=lambda entry: entry.utc_timestamp)[-1].utc_timestamp
+            logger.error("Daily history data download returned None or empty. Cannot determine most recent daily data.")
+            return None
+        most_recent_timestamp = max(entry.utc_timestamp for entry in entries_opt)
+        self._remote_daily_watermark.set(most_recent_timestamp)
+
+        return most_recent_timestamp
+
+    def _observe_remote_daily_rows(self, rows: List[tuple]) -> None:
+        """Update the cached remote watermark from downloaded daily rows."""
+
+        newest_timestamp = max((row[-1] for row in rows), default=None)
+        if newest_timestamp is not None:
+            self._remote_daily_watermark.observe([datetime.fromtimestamp(newest_timestamp, tz=timezone.utc)])
+
+    def _rows_newer_than(self, rows: Iterable[tuple], most_recent_local_timestamps: dict[int, Optional[datetime]]) -> Iterator[tuple]:
+        """Yield rows newer than the most recent local timestamp for their item ID."""
+
+        most_recent_local_epochs = {item_id: timestamp.timestamp() for item_id, timestamp in most_recent_local_timestamps.items() if timestamp is not None}
+        for row in rows:
+            most_recent_local_epoch = most_recent_local_epochs.get(row[0])
+            if most_recent_local_epoch is None or row[-1] > most_recent_local_epoch:
+                yield row
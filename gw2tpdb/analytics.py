@@ -0,0 +1,180 @@
+import sqlite3
+import logging
+
+# Requires numpy: pip install gw2tpdb[analytics]
+import numpy as np
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+from gw2tpdb.api.history import history_fields
+
+logger = logging.getLogger(__name__)
+
+# The trading post keeps 5% of the sell price as a listing fee and 10% on sale.
+tp_fee = 0.15
+
+seconds_per_day = 86400
+default_window = 30
+default_volume_days = 7
+default_columns = ("buy_price_avg", "sell_price_avg", "buy_sold", "sell_sold")
+fetch_rows = 100000
+
+@dataclass
+class MarketColumns():
+    """Daily history columns for many items in one set of NumPy arrays.
+
+    Rows are ordered by (id, utc_timestamp); the rows of item_ids[i] are
+    offsets[i]:offsets[i + 1] of every column. Values are float64 except
+    utc_timestamp (int64 epoch seconds)."""
+
+    item_ids: np.ndarray
+    offsets: np.ndarray
+    columns: dict[str, np.ndarray]
+
+    def latest(self, name: str) -> np.ndarray:
+        """Return the most recent value of column NAME for each item."""
+
+        return self.columns[name][self.offsets[1:] - 1]
+
+def load_columns(conn: sqlite3.Connection, item_ids: Optional[List[int]] = None, start: Optional[int] = None, columns: tuple = default_columns) -> MarketColumns:
+    """Load COLUMNS of daily_history into a MarketColumns.
+
+    Optionally limited to item_ids and to rows at or after START (epoch
+    seconds). Raises ValueError for unknown column names."""
+
+    unknown_columns = set(columns) - set(history_fields)
+    if len(unknown_columns) > 0:
+        raise ValueError(f"Unknown history columns: {sorted(unknown_columns)}")
+    names = [name for name in columns if name not in ("id", "utc_timestamp")]
+
+    conditions = ["1"]
+    parameters = []
+    if item_ids is not None:
+        # Bound per call rather than per ID; a temp table avoids SQLite's variable limit.
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS analytics_item_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM analytics_item_ids")
+        conn.executemany("INSERT OR IGNORE INTO analytics_item_ids VALUES (?)", [(item_id,) for item_id in item_ids])
+        conditions.append("id IN (SELECT id FROM analytics_item_ids)")
+    if start is not None:
+        conditions.append("utc_timestamp >= ?")
+        parameters.append(start)
+
+    cursor = conn.cursor().execute(f"SELECT {', '.join(['id', 'utc_timestamp'] + names)} FROM daily_history WHERE {' AND '.join(conditions)} ORDER BY id, utc_timestamp", parameters)
+    blocks = []
+    while True:
+        rows = cursor.fetchmany(fetch_rows)
+        if len(rows) == 0:
+            break
+        # NULL becomes NaN.
+        blocks.append(np.array(rows, dtype=np.float64))
+    data = np.concatenate(blocks) if len(blocks) > 0 else np.empty((0, len(names) + 2))
+
+    ids = data[:, 0].astype(np.int64)
+    boundaries = np.flatnonzero(np.diff(ids)) + 1
+    offsets = np.concatenate(([0], boundaries, [len(ids)])) if len(ids) > 0 else np.zeros(1, dtype=np.int64)
+    result = {"utc_timestamp": data[:, 1].astype(np.int64)}
+    for i, name in enumerate(names):
+        result[name] = data[:, i + 2]
+
+    return MarketColumns(ids[offsets[:-1]], offsets.astype(np.int64), result)
+
+def _rolling_sum(values: np.ndarray, offsets: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return the sum of each row and up to window - 1 earlier rows of the same item, and how many rows were summed."""
+
+    index = np.arange(len(values))
+    item_starts = np.repeat(offsets[:-1], np.diff(offsets))
+    first = np.maximum(index - window + 1, item_starts)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+
+    return cumulative[index + 1] - cumulative[first], index - first + 1
+
+def rolling_mean(values: np.ndarray, offsets: np.ndarray, window: int) -> np.ndarray:
+    """Return the WINDOW-row moving average of VALUES within each item.
+
+    NaN until an item has WINDOW rows."""
+
+    sums, counts = _rolling_sum(values, offsets, window)
+    return np.where(counts >= window, sums / np.maximum(counts, 1), np.nan)
+
+def log_returns(values: np.ndarray, offsets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return row-over-row log returns of VALUES within each item and a mask of valid returns.
+
+    The first row of each item and rows with non-positive prices are invalid."""
+
+    previous = np.roll(values, 1)
+    valid = (values > 0) & (previous > 0)
+    valid[offsets[:-1]] = False
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(valid, np.log(np.where(valid, values / previous, 1.0)), 0.0)
+
+    return returns, valid
+
+def rolling_volatility(values: np.ndarray, offsets: np.ndarray, window: int) -> np.ndarray:
+    """Return the sample standard deviation of log returns over the last WINDOW rows within each item.
+
+    NaN when fewer than two valid returns are in the window."""
+
+    returns, valid = log_returns(values, offsets)
+    sums, _ = _rolling_sum(returns, offsets, window)
+    squares, _ = _rolling_sum(returns * returns, offsets, window)
+    counts, _ = _rolling_sum(valid.astype(np.float64), offsets, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = (squares - sums * sums / counts) / (counts - 1)
+
+    return np.where(counts >= 2, np.sqrt(np.maximum(variance, 0)), np.nan)
+
+def compute_metrics(market: MarketColumns, window: int = default_window, volume_days: int = default_volume_days) -> dict[str, np.ndarray]:
+    """Return per-item indicators as arrays aligned with market.item_ids.
+
+    Requires the buy_price_avg, sell_price_avg, buy_sold and sell_sold
+    columns. Prices are each item's latest daily averages; flip_margin is
+    what buying at the buy price and selling at the sell price earns after
+    the trading post fee; volume_rank 1 is the most traded item over the
+    last volume_days days."""
+
+    offsets = market.offsets
+    buy = market.latest("buy_price_avg")
+    sell = market.latest("sell_price_avg")
+    sell_prices = market.columns["sell_price_avg"]
+
+    timestamps = market.columns["utc_timestamp"]
+    latest_timestamps = np.repeat(timestamps[offsets[1:] - 1], np.diff(offsets))
+    recent = timestamps > latest_timestamps - volume_days * seconds_per_day
+    traded = np.nan_to_num(market.columns["buy_sold"] + market.columns["sell_sold"]) * recent
+    volume = np.add.reduceat(traded, offsets[:-1]) if len(traded) > 0 else np.zeros(0)
+    volume_rank = np.empty(len(volume), dtype=np.int64)
+    volume_rank[np.argsort(-volume, kind="stable")] = np.arange(1, len(volume) + 1)
+
+    flip_margin = sell * (1 - tp_fee) - buy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread_pct = np.where(sell > 0, (sell - buy) / sell, np.nan)
+        flip_margin_pct = np.where(buy > 0, flip_margin / buy, np.nan)
+
+    return {
+        "id": market.item_ids,
+        "utc_timestamp": timestamps[offsets[1:] - 1],
+        "buy_price": buy,
+        "sell_price": sell,
+        "sell_price_sma": rolling_mean(sell_prices, offsets, window)[offsets[1:] - 1],
+        "volatility": rolling_volatility(sell_prices, offsets, window)[offsets[1:] - 1],
+        "spread": sell - buy,
+        "spread_pct": spread_pct,
+        "flip_margin": flip_margin,
+        "flip_margin_pct": flip_margin_pct,
+        "volume": volume,
+        "volume_rank": volume_rank,
+    }
+
+def write_item_metrics(conn: sqlite3.Connection, metrics: dict[str, np.ndarray]) -> None:
+    """Replace rows of the item_metrics table with METRICS from `compute_metrics`.
+
+    Does not commit."""
+
+    computed_at = int(datetime.now(timezone.utc).timestamp())
+    names = list(metrics)
+    rows = zip(*[metrics[name].tolist() for name in names], [computed_at] * len(metrics["id"]))
+    # NaN is stored as NULL.
+    rows = [tuple(None if value != value else value for value in row) for row in rows]
+    conn.cursor().executemany(f"INSERT OR REPLACE INTO item_metrics ({', '.join(names)}, computed_at) VALUES ({','.join('?' * (len(names) + 1))})", rows)
+    logger.debug("Wrote metrics for %s items", len(rows))
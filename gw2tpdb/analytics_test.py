@@ -0,0 +1,48 @@
+import unittest
+
+from datetime import datetime, timezone, timedelta
+from gw2tpdb import Gw2TpDb
+from gw2tpdb.api.history import HistoryEntry
+
+try:
+    import numpy as np
+    from gw2tpdb import analytics
+except ImportError:
+    np = None
+
+def _entry(item_id: int, day: int, buy: int, sell: int, sold: int) -> HistoryEntry:
+    return HistoryEntry(item_id, 0, 0, buy, buy, buy, 0.0, 0, 0, 0, 0.0, sold, 0, 1,
+                        0, 0, sell, sell, sell, 0.0, 0, 0, 0, 0.0, sold, 0,
+                        datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=day))
+
+@unittest.skipIf(np is None, "requires numpy")
+class ComputeMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.db._write_daily([_entry(1, day, 80, 100 + day, 10) for day in range(10)]
+                             + [_entry(2, day, 50, 100, 100) for day in range(3)])
+
+    def test_metrics(self):
+        market = analytics.load_columns(self.db.conn)
+        metrics = analytics.compute_metrics(market, window=3, volume_days=2)
+
+        np.testing.assert_array_equal(metrics["id"], [1, 2])
+        np.testing.assert_allclose(metrics["sell_price_sma"], [108, 100])
+        np.testing.assert_allclose(metrics["flip_margin"], [109 * 0.85 - 80, 100 * 0.85 - 50])
+        np.testing.assert_allclose(metrics["volume"], [40, 400])
+        np.testing.assert_array_equal(metrics["volume_rank"], [2, 1])
+        returns = np.log([107 / 106, 108 / 107, 109 / 108])
+        np.testing.assert_allclose(metrics["volatility"], [np.std(returns, ddof=1), 0], atol=1e-9)
+
+    def test_rolling_mean_does_not_cross_items(self):
+        offsets = np.array([0, 2, 4])
+        np.testing.assert_allclose(analytics.rolling_mean(np.array([1.0, 3.0, 10.0, 20.0]), offsets, 2), [np.nan, 2, np.nan, 15])
+
+    def test_write_item_metrics(self):
+        metrics = analytics.compute_metrics(analytics.load_columns(self.db.conn, item_ids=[2]))
+        analytics.write_item_metrics(self.db.conn, metrics)
+
+        self.assertEqual(self.db._execute("SELECT id, sell_price, sell_price_sma, volume_rank FROM item_metrics"), [(2, 100.0, None, 1)])
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -0,0 +1,222 @@
+import os
+import time
+import zlib
+import hashlib
+import sqlite3
+import logging
+import requests
+import threading
+
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from gw2tpdb.api.endpoint import Endpoint
+
+logger = logging.getLogger(__name__)
+
+# How long a cached response is used without asking the server. Hourly and
+# daily history gain a row per hour or day; the catalog rarely changes.
+default_ttls = {
+    Endpoint.HISTORY_HOURLY_JSON: timedelta(minutes=10),
+    Endpoint.HISTORY_DAILY_JSON: timedelta(hours=1),
+    Endpoint.ITEMS_JSON: timedelta(days=1),
+}
+default_max_bytes = 512 * 1024 * 1024
+
+def canonical_url(url: str) -> str:
+    """Return URL with its query parameters sorted so equivalent requests share a cache entry."""
+
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(query=urlencode(sorted(parse_qsl(parts.query))), fragment=""))
+
+@dataclass
+class CachedResponse():
+    """A cached response body and the validators needed to revalidate it."""
+
+    url: str
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_type: Optional[str]
+    stored_at: float
+
+    def validators(self) -> dict[str, str]:
+        """Return conditional request headers for revalidating this response."""
+
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self) -> requests.Response:
+        """Return the cached body as a completed 200 response."""
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = self.url
+        response._content = self.body
+        response._content_consumed = True
+        if self.content_type is not None:
+            response.headers["Content-Type"] = self.content_type
+        response.headers["Content-Length"] = str(len(self.body))
+        return response
+
+class ResponseCache():
+    """On-disk cache of Datawars response bodies.
+
+    Entries are keyed by canonical request URL. Bodies are stored
+    zlib-compressed under the SHA-256 of their content, so identical
+    responses to different URLs are stored once. An entry is served without
+    a request until its endpoint's TTL passes; after that it is revalidated
+    with its ETag/Last-Modified and served again if the server answers 304.
+    Least recently used entries are evicted once the compressed bodies
+    exceed max_bytes. Lookups only read the index: when an entry was last
+    used is kept in memory and written with the next `put` or `close`, so
+    eviction order across processes is approximate. Safe to share between
+    threads and processes."""
+
+    def __init__(self, directory: str, max_bytes: int = default_max_bytes, ttls: dict[Endpoint, timedelta] = default_ttls, clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Lookups since the last write, by URL, not yet stored as last_used_at.
+        self._last_used: dict[str, float] = {}
+        os.makedirs(os.path.join(directory, "bodies"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+              url TEXT NOT NULL PRIMARY KEY,
+              body_hash TEXT NOT NULL,
+              etag TEXT,
+              last_modified TEXT,
+              content_type TEXT,
+              stored_at REAL NOT NULL,
+              last_used_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bodies (
+              body_hash TEXT NOT NULL PRIMARY KEY,
+              size INTEGER NOT NULL
+            );""")
+
+    def ttl(self, url: str) -> float:
+        """Return the TTL in seconds for URL's endpoint, or 0 for unknown endpoints."""
+
+        endpoint = urlunsplit(urlsplit(url)._replace(query="", fragment=""))
+        for known_endpoint, ttl in self.ttls.items():
+            if endpoint == known_endpoint:
+                return ttl.total_seconds()
+        return 0
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response for URL, fresh or not, or None."""
+
+        url = canonical_url(url)
+        with self._lock:
+            row = self._select(url)
+            return None if row is None else self._load(url, row)
+
+    def get_fresh(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response for URL if it is within its TTL, or None.
+
+        Stale bodies are not read."""
+
+        url = canonical_url(url)
+        with self._lock:
+            row = self._select(url)
+            if row is None or self._clock() - row[-1] >= self.ttl(url):
+                return None
+            return self._load(url, row)
+
+    def _select(self, url: str) -> Optional[tuple]:
+        return self._conn.execute("SELECT body_hash, etag, last_modified, content_type, stored_at FROM entries WHERE url = ?", (url,)).fetchone()
+
+    def _load(self, url: str, row: tuple) -> Optional[CachedResponse]:
+        """Return the response for URL's index ROW, dropping the entry when its body is unreadable."""
+
+        body_hash, etag, last_modified, content_type, stored_at = row
+        try:
+            with open(self._body_path(body_hash), "rb") as f:
+                body = zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            logger.warning("Dropping unreadable cache entry for '%s': %s", url, e)
+            self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self._conn.commit()
+            return None
+        self._last_used[url] = self._clock()
+
+        return CachedResponse(url, body, etag, last_modified, content_type, stored_at)
+
+    def put(self, url: str, response: requests.Response) -> None:
+        """Store the body and validators of a successful RESPONSE to URL."""
+
+        url = canonical_url(url)
+        body = response.content
+        body_hash = hashlib.sha256(body).hexdigest()
+        now = self._clock()
+        with self._lock:
+            if not os.path.exists(self._body_path(body_hash)):
+                compressed = zlib.compress(body)
+                temporary_path = f"{self._body_path(body_hash)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporary_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(temporary_path, self._body_path(body_hash))
+            size = os.path.getsize(self._body_path(body_hash))
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO bodies VALUES (?, ?)", (body_hash, size))
+                self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (url, body_hash, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                                    response.headers.get("Content-Type"), now, now))
+            self._evict()
+
+    def refresh(self, url: str) -> None:
+        """Restart URL's TTL after the server confirmed the cached body is current."""
+
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET stored_at = ? WHERE url = ?", (self._clock(), canonical_url(url)))
+
+    def size(self) -> int:
+        """Return the total size of the stored compressed bodies in bytes."""
+
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            with self._conn:
+                self._flush_last_used()
+            self._conn.close()
+
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.directory, "bodies", f"{body_hash}.z")
+
+    def _flush_last_used(self) -> None:
+        """Store the last_used_at of lookups since the last write. Does not commit."""
+
+        if len(self._last_used) > 0:
+            self._conn.executemany("UPDATE entries SET last_used_at = MAX(last_used_at, ?) WHERE url = ?",
+                                   [(used_at, url) for url, used_at in self._last_used.items()])
+            self._last_used.clear()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries, and bodies no entry refers to, until within max_bytes."""
+
+        with self._conn:
+            self._flush_last_used()
+            total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+            while total_bytes > self.max_bytes:
+                row = self._conn.execute("SELECT url FROM entries ORDER BY last_used_at LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE url = ?", row)
+                for (body_hash, size) in self._conn.execute("SELECT body_hash, size FROM bodies WHERE body_hash NOT IN (SELECT body_hash FROM entries)").fetchall():
+                    self._conn.execute("DELETE FROM bodies WHERE body_hash = ?", (body_hash,))
+                    try:
+                        os.remove(self._body_path(body_hash))
+                    except FileNotFoundError:
+                        pass
+                    total_bytes -= size
@@ -0,0 +1,117 @@
+import tempfile
+import unittest
+import requests
+
+from unittest import mock
+from datetime import timedelta
+from gw2tpdb.api.cache import ResponseCache, canonical_url
+from gw2tpdb.api.datawars import Transport
+from gw2tpdb.api.endpoint import Endpoint
+
+class _FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def _response(status_code: int, body: bytes = b"", headers: dict = {}) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers)
+    return response
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.clock = _FakeClock()
+        self.cache = ResponseCache(self.directory, clock=self.clock)
+        self.addCleanup(self.cache.close)
+
+    def test_canonical_url_sorts_parameters(self):
+        self.assertEqual(canonical_url("https://a.test/x?b=2&a=1"), canonical_url("https://a.test/x?a=1&b=2"))
+
+    def test_fresh_until_ttl(self):
+        url = f"{Endpoint.HISTORY_DAILY_JSON}?itemID=1"
+        self.cache.put(url, _response(200, b"[1]"))
+
+        self.assertEqual(self.cache.get_fresh(url).body, b"[1]")
+        self.clock.now += timedelta(hours=1).total_seconds()
+        self.assertIsNone(self.cache.get_fresh(url))
+        self.assertEqual(self.cache.get(url).body, b"[1]")
+
+    def test_identical_bodies_are_stored_once(self):
+        self.cache.put(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=1", _response(200, b"[]" * 100))
+        self.cache.put(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=2", _response(200, b"[]" * 100))
+
+        self.assertEqual(self.cache._conn.execute("SELECT COUNT(*) FROM bodies").fetchone()[0], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.directory, max_bytes=1, clock=self.clock)
+        self.addCleanup(cache.close)
+        cache.put(f"{Endpoint.ITEMS_JSON}", _response(200, b"items"))
+        self.clock.now += 1
+        cache.put(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=1", _response(200, b"daily"))
+
+        self.assertIsNone(cache.get(f"{Endpoint.ITEMS_JSON}"))
+        self.assertEqual(cache.size(), 0)
+
+    def test_lookups_do_not_write_to_the_index(self):
+        url = f"{Endpoint.HISTORY_DAILY_JSON}?itemID=1"
+        self.cache.put(url, _response(200, b"[1]"))
+        changes = self.cache._conn.total_changes
+
+        self.cache.get_fresh(url)
+        self.cache.get(url)
+
+        self.assertEqual(self.cache._conn.total_changes, changes)
+
+    def test_eviction_sees_lookups_since_the_last_write(self):
+        self.cache.put(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=1", _response(200, b"[1]"))
+        self.clock.now += 1
+        self.cache.put(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=2", _response(200, b"[2]"))
+        self.clock.now += 1
+        self.cache.get(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=1")
+        self.cache.max_bytes = self.cache.size()
+        self.cache.put(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=3", _response(200, b"[3]"))
+
+        self.assertIsNotNone(self.cache.get(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=1"))
+        self.assertIsNone(self.cache.get(f"{Endpoint.HISTORY_DAILY_JSON}?itemID=2"))
+
+class TransportCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.clock = _FakeClock()
+        self.cache = ResponseCache(directory.name, clock=self.clock)
+        self.addCleanup(self.cache.close)
+        self.session = mock.Mock(headers={})
+        self.transport = Transport(session=self.session, cache=self.cache)
+        self.url = f"{Endpoint.ITEMS_JSON}"
+
+    def test_revalidates_stale_entries(self):
+        self.session.get.return_value = _response(200, b"[]", {"ETag": '"v1"'})
+        self.transport.get(self.url)
+        self.assertIsNotNone(self.transport.get_fresh(self.url))
+
+        self.clock.now += timedelta(days=1).total_seconds()
+        self.assertIsNone(self.transport.get_fresh(self.url))
+        self.session.get.return_value = _response(304)
+        response = self.transport.get(self.url)
+
+        self.assertEqual(response.content, b"[]")
+        self.assertEqual(self.session.get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'})
+        self.assertIsNotNone(self.transport.get_fresh(self.url))
+
+    def test_streamed_requests_bypass_the_cache(self):
+        self.session.get.return_value = _response(200, b"[]")
+        self.transport.get(self.url, stream=True)
+
+        self.assertTrue(self.session.get.call_args.kwargs["stream"])
+        self.assertIsNone(self.cache.get(self.url))
+
+if __name__ == "__main__":
+    unittest.main ()
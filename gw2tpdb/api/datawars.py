@@ -1,49 +1,327 @@
 import time
+import asyncio
 import logging
 import requests
 import json
 
-from ratelimit import limits, sleep_and_retry
+from collections import deque
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
-from typing import Optional, List, TypeVar, Callable
+from typing import Optional, List, TypeVar, Callable, Iterator
 from gw2tpdb.api.item import ItemEntry, item_json_to_dataclass
 from gw2tpdb.api.history import HistoryEntry, history_json_to_dataclass
 from gw2tpdb.api.url import build_history_request_url, build_items_request_url
-from gw2tpdb.api.endpoint import Endpoint
+from gw2tpdb.api.endpoint import Endpoint, datawars_origin
+from gw2tpdb.api.limiter import TokenBucket
+from gw2tpdb.api.retry import RetryPolicy, retry_after_seconds
+from gw2tpdb.api.cache import ResponseCache
+from gw2tpdb.api.stream import iter_json_array
+from gw2tpdb.metrics import Metrics
 
 T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
 deadline_seconds = 5
+default_pool_size = 4
+max_request_timings = 1000
+stream_chunk_bytes = 64 * 1024
 
-# Limit to 1 QPS to be kind to the non-profit API host.
-@sleep_and_retry
-@limits(calls=1, period=timedelta(seconds=1).total_seconds())
-def _datawars_get(url: str) -> Optional[requests.Response]:
-    """Make a request to the Datawars API and return the resulting JSON if successful."""
+# Marks the end of a streamed JSON array.
+_end = object()
 
-    try:
-        response = requests.get(url, timeout=deadline_seconds)
-        response.raise_for_status()
+# Limit to 1 QPS to be kind to the non-profit API host. Shared by the blocking
+# and asyncio clients so mixing them cannot exceed the budget.
+requests_per_second = 1 / timedelta(seconds=1).total_seconds()
+limiter = TokenBucket(rate=requests_per_second)
 
-        return response
-    except requests.exceptions.Timeout as e:
-        logger.error(f"Timed out (deadline={deadline_seconds} seconds) getting '{url}': {e}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error getting '{url}': {e}")
+retry_policy = RetryPolicy()
+
+# Request, cache, limiter and parse measurements; see `set_metrics`.
+metrics = Metrics()
+
+@dataclass
+class RequestTiming():
+    """Timing of a single request made through a Transport."""
+
+    url: str
+    status: Optional[int]
+    elapsed_seconds: float
+    bytes: int
+
+class Transport():
+    """Pooled keep-alive HTTP transport for Datawars requests.
+
+    Reuses TCP/TLS connections across requests and negotiates gzip/deflate.
+    Pass origin (e.g. "http://127.0.0.1:8000") to send requests meant for
+    the Datawars host to a local stand-in server instead. Pass cache to
+    serve repeated requests from disk (see `ResponseCache`). Streamed
+    requests bypass the cache, so reading them keeps memory flat; caching
+    them would mean holding the whole body."""
+
+    def __init__(self, pool_size: int = default_pool_size, timeout: float = deadline_seconds, origin: Optional[str] = None, session: Optional[requests.Session] = None, cache: Optional[ResponseCache] = None):
+        self.timeout = timeout
+        self.origin = origin
+        self.cache = cache
+        self.timings = deque(maxlen=max_request_timings)
+        self.session = session if session is not None else requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+
+    def get(self, url: str, stream: bool = False) -> requests.Response:
+        """GET url, record its timing, and return the response.
+
+        With stream = True the body is left unread; the caller must close the
+        response, and the recorded timing covers only the headers. The timing
+        is attached to the response as request_timing so the reader can add
+        the body's bytes to it (see `_iter_response_json_array`). Streamed
+        requests bypass the cache. Otherwise, with a cache, a stale cached
+        response is revalidated instead of downloaded again.
+
+        Raises requests.exceptions.RequestException on failure, including
+        non-2xx statuses."""
+
+        with metrics.stage("request"):
+            return self._get(url, stream)
+
+    def _get(self, url: str, stream: bool) -> requests.Response:
+        cached_opt = self.cache.get(url) if self.cache is not None and not stream else None
+        headers = cached_opt.validators() if cached_opt is not None else {}
+        cache_url = url
+        if self.origin is not None and url.startswith(datawars_origin):
+            url = self.origin + url[len(datawars_origin):]
+
+        started_at = time.perf_counter()
+        response = None
+        try:
+            response = self.session.get(url, timeout=self.timeout, stream=stream, headers=headers)
+            if response.status_code == 304 and cached_opt is not None:
+                self.cache.refresh(cache_url)
+                metrics.increment("cache_hits", kind="revalidated")
+                return cached_opt.to_response()
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError:
+                # Nobody reads the body of a failed request; return its connection to the pool.
+                response.close()
+                raise
+            if self.cache is not None and not stream:
+                self.cache.put(cache_url, response)
+            return response
+        finally:
+            # Streamed bodies are counted as they are read; Content-Length is absent when chunked.
+            response_bytes = 0 if response is None or stream else len(response.content)
+            status = None if response is None else response.status_code
+            timing = RequestTiming(
+                url=url,
+                status=status,
+                elapsed_seconds=time.perf_counter() - started_at,
+                bytes=response_bytes)
+            self.timings.append(timing)
+            if stream and response is not None:
+                response.request_timing = timing
+            metrics.increment("requests", status="error" if status is None else status)
+            metrics.increment("downloaded_bytes", response_bytes)
+
+    def get_fresh(self, url: str) -> Optional[requests.Response]:
+        """Return a cached response for url that is still within its TTL, or None."""
+
+        if self.cache is None:
+            return None
+        cached_opt = self.cache.get_fresh(url)
+        if cached_opt is None:
+            return None
+
+        return cached_opt.to_response()
+
+    def close(self) -> None:
+        """Close pooled connections."""
+
+        self.session.close()
+
+_transport = Transport()
+
+def get_transport() -> Transport:
+    """Return the transport used for Datawars requests."""
+
+    return _transport
+
+def set_transport(transport: Transport) -> Transport:
+    """Use TRANSPORT for Datawars requests and return the previous one."""
+
+    global _transport
+    previous_transport = _transport
+    _transport = transport
+
+    return previous_transport
+
+def set_limiter(new_limiter: TokenBucket) -> TokenBucket:
+    """Throttle Datawars requests with NEW_LIMITER and return the previous limiter.
+
+    Pass a FileTokenBucket to share one budget between processes."""
+
+    global limiter
+    previous_limiter = limiter
+    limiter = new_limiter
+
+    return previous_limiter
+
+def set_retry_policy(new_retry_policy: RetryPolicy) -> RetryPolicy:
+    """Retry failed Datawars requests according to NEW_RETRY_POLICY and return the previous policy."""
+
+    global retry_policy
+    previous_retry_policy = retry_policy
+    retry_policy = new_retry_policy
+
+    return previous_retry_policy
+
+def set_metrics(new_metrics: Metrics) -> Metrics:
+    """Record Datawars request measurements in NEW_METRICS and return the previous registry."""
+
+    global metrics
+    previous_metrics = metrics
+    metrics = new_metrics
+
+    return previous_metrics
+
+def _datawars_get(url: str, stream: bool = False) -> Optional[requests.Response]:
+    """Make a request to the Datawars API and return the response if successful.
+
+    Transient failures are retried according to `retry_policy`; every
+    attempt draws from the rate limiter. Fresh cached responses are
+    returned without waiting for the limiter, unless streaming."""
+
+    response_opt = None if stream else _transport.get_fresh(url)
+    if response_opt is not None:
+        metrics.increment("cache_hits", kind="fresh")
+        return response_opt
+
+    policy = retry_policy
+    for attempt in range(policy.max_attempts):
+        metrics.observe("limiter_wait_seconds", limiter.acquire())
+        response_opt, retry_delay_opt = _datawars_attempt(url, stream, attempt, policy)
+        if retry_delay_opt is None:
+            return response_opt
+        time.sleep(retry_delay_opt)
 
     return None
 
+async def _datawars_get_async(url: str) -> Optional[requests.Response]:
+    """Make a request to the Datawars API without blocking the event loop.
+
+    Retries and uses the cache like `_datawars_get`."""
+
+    response_opt = await asyncio.to_thread(_transport.get_fresh, url)
+    if response_opt is not None:
+        metrics.increment("cache_hits", kind="fresh")
+        return response_opt
+
+    policy = retry_policy
+    for attempt in range(policy.max_attempts):
+        metrics.observe("limiter_wait_seconds", await limiter.acquire_async())
+        response_opt, retry_delay_opt = await asyncio.to_thread(_datawars_attempt, url, False, attempt, policy)
+        if retry_delay_opt is None:
+            return response_opt
+        await asyncio.sleep(retry_delay_opt)
+
+    return None
+
+def _datawars_attempt(url: str, stream: bool, attempt: int, policy: RetryPolicy) -> tuple[Optional[requests.Response], Optional[float]]:
+    """Make one unthrottled request to the Datawars API.
+
+    Return (response, None) on success, (None, None) when the request should
+    not be retried, or (None, seconds to wait) before the next attempt."""
+
+    transport = _transport
+    try:
+        return transport.get(url, stream), None
+    except requests.exceptions.RequestException as e:
+        if isinstance(e, requests.exceptions.Timeout):
+            error = f"Timed out (deadline={transport.timeout} seconds)"
+        else:
+            error = "Error"
+        if attempt + 1 >= policy.max_attempts or not policy.should_retry(e):
+            logger.error("%s getting '%s': %s (attempt %d of %d, giving up)", error, url, e, attempt + 1, policy.max_attempts)
+            return None, None
+
+        retry_delay = policy.delay(attempt, retry_after_seconds(e.response))
+        metrics.increment("retries")
+        logger.warning("%s getting '%s': %s (attempt %d of %d, retrying in %.1f seconds)", error, url, e, attempt + 1, policy.max_attempts, retry_delay)
+
+        return None, retry_delay
+
 def _datawars_get_as_json(url: str) -> Optional[dict]:
     """Make a request to the Datawars API and parse response as json."""
 
+    response_opt = _datawars_get(url)
+    if response_opt is None:
+        return None
+    response = response_opt
+
     try:
-        return _datawars_get(url).json()
-    except Exception as e:
-        logger.error(f"Failed to parse JSON response for {url} : {e}")
+        with metrics.stage("parse"):
+            return response.json()
+    except ValueError as e:
+        logger.error("Failed to parse JSON response for %s : %s", url, e)
         return None
 
+def _iter_response_json_array(response: requests.Response) -> Iterator[dict]:
+    """Yield elements of the JSON array in a streamed response, then close it.
+
+    Bytes read from an unread body are added to downloaded_bytes and the
+    response's RequestTiming. Time spent parsing, excluding waiting on the
+    connection, is observed as one parse stage when the iterator finishes."""
+
+    timing_opt = getattr(response, "request_timing", None)
+    read_seconds = 0.0
+
+    def read():
+        nonlocal read_seconds
+        chunks = response.iter_content(chunk_size=stream_chunk_bytes)
+        while True:
+            started_at = time.perf_counter()
+            chunk = next(chunks, None)
+            read_seconds += time.perf_counter() - started_at
+            if chunk is None:
+                return
+            if timing_opt is not None:
+                timing_opt.bytes += len(chunk)
+                metrics.increment("downloaded_bytes", len(chunk))
+            yield chunk
+
+    with response:
+        elements = iter_json_array(read())
+        parse_seconds = 0.0
+        try:
+            while True:
+                started_at = time.perf_counter()
+                element = next(elements, _end)
+                parse_seconds += time.perf_counter() - started_at
+                if element is _end:
+                    return
+                yield element
+        finally:
+            metrics.observe("parse_seconds", max(parse_seconds - read_seconds, 0.0))
+
+def _datawars_get_as_json_stream(url: str) -> Optional[Iterator[dict]]:
+    """Make a request to the Datawars API and lazily parse the json array response.
+
+    The body is read and parsed in chunks as the iterator is consumed. The
+    iterator raises if the connection fails or the body is not valid JSON."""
+
+    response_opt = _datawars_get(url, stream=True)
+    if response_opt is None:
+        return None
+    response = response_opt
+
+    return _iter_response_json_array(response)
+
 def _datawars_get_as_dataclass_list(url: str, json_to_dataclass: Callable[dict, T]) -> Optional[List[T]]:
     """Make a request to the Datawars API and parse json response into dataclass."""
 
@@ -54,6 +332,33 @@ def _datawars_get_as_dataclass_list(url: str, json_to_dataclass: Callable[dict,
 
     return list(map(json_to_dataclass, json))
 
+async def _datawars_get_as_dataclass_list_async(url: str, json_to_dataclass: Callable[dict, T]) -> Optional[List[T]]:
+    """Make a request to the Datawars API without blocking the event loop and parse json response into dataclass."""
+
+    response_opt = await _datawars_get_async(url)
+    if response_opt is None:
+        return None
+    response = response_opt
+
+    try:
+        with metrics.stage("parse"):
+            json = response.json()
+    except Exception as e:
+        logger.error("Failed to parse JSON response for %s : %s", url, e)
+        return None
+
+    return list(map(json_to_dataclass, json))
+
+def _group_by_id(entries: List[HistoryEntry]) -> dict[int, List[HistoryEntry]]:
+    """Return ENTRIES grouped into lists by item ID."""
+
+    entries_dict = {}
+    for entry in entries:
+        if entry.id not in entries_dict:
+            entries_dict[entry.id] = []
+        entries_dict[entry.id].append(entry)
+    return entries_dict
+
 def get_items() -> Optional[List[ItemEntry]]:
     """Fetch items."""
 
@@ -72,14 +377,68 @@ def get_dailies(item_ids: List[int], start: Optional[datetime] = None, end: Opti
         return None
     entries = entries_opt
 
-    entries_dict = {}
-    for entry in entries:
-        if entry.id not in entries_dict:
-            entries_dict[entry.id] = []
-        entries_dict[entry.id].append(entry)
-    return entries_dict
+    return _group_by_id(entries)
+
+async def get_items_async() -> Optional[List[ItemEntry]]:
+    """Fetch items without blocking the event loop."""
+
+    return await _datawars_get_as_dataclass_list_async(build_items_request_url(), item_json_to_dataclass)
+
+async def get_dailies_async(item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[dict[int, List[HistoryEntry]]]:
+    """Fetch daily historic data for given ITEM_IDS without blocking the event loop."""
+
+    entries_opt = await _datawars_get_as_dataclass_list_async(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, item_ids, start, end), history_json_to_dataclass)
+    if entries_opt is None:
+        return None
+    entries = entries_opt
+
+    return _group_by_id(entries)
+
+def get_dailies_json(item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[List[dict]]:
+    """Fetch daily historic data for given ITEM_IDS as unconverted JSON records."""
+
+    return _datawars_get_as_json(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, item_ids, start, end))
+
+def iter_dailies_json(item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[Iterator[dict]]:
+    """Fetch daily historic data for given ITEM_IDS as a stream of unconverted JSON records.
+
+    Records are parsed as the body arrives, so memory stays flat no matter
+    how much history the response holds."""
+
+    return _datawars_get_as_json_stream(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, item_ids, start, end))
+
+def iter_dailies(item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[Iterator[HistoryEntry]]:
+    """Fetch daily historic data for given ITEM_IDS as a stream of entries.
+
+    Entries are parsed as the body arrives, so memory stays flat no matter
+    how much history the response holds."""
+
+    records_opt = iter_dailies_json(item_ids, start, end)
+    if records_opt is None:
+        return None
+    records = records_opt
+
+    return map(history_json_to_dataclass, records)
 
 def get_hourly(item_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[List[HistoryEntry]]:
     """Fetch hourly historic data for given ITEM_ID."""
 
-    return _datawars_get_as_json(build_history_request_url(Endpoint.HISTORY_HOURLY_JSON, item_id, start, end), history_json_to_dataclass)
+    return _datawars_get_as_dataclass_list(build_history_request_url(Endpoint.HISTORY_HOURLY_JSON, [item_id], start, end), history_json_to_dataclass)
+
+def get_hourlies(item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[dict[int, List[HistoryEntry]]]:
+    """Fetch hourly historic data for given ITEM_IDS."""
+
+    entries_opt = _datawars_get_as_dataclass_list(build_history_request_url(Endpoint.HISTORY_HOURLY_JSON, item_ids, start, end), history_json_to_dataclass)
+    if entries_opt is None:
+        return None
+    entries = entries_opt
+
+    return _group_by_id(entries)
+
+def iter_hourlies_json(item_ids: List[int], start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[Iterator[dict]]:
+    """Fetch hourly historic data for given ITEM_IDS as a stream of unconverted JSON records.
+
+    Records are parsed as the body arrives, so memory stays flat no matter
+    how much history the response holds."""
+
+    return _datawars_get_as_json_stream(build_history_request_url(Endpoint.HISTORY_HOURLY_JSON, item_ids, start, end))
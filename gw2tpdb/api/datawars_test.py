@@ -1,28 +1,176 @@
+import json
+import requests
+import threading
 import unittest
 
+from unittest import mock
 from datetime import datetime
-from gw2tpdb.api.datawars import build_request_url, Endpoint
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gw2tpdb.api import datawars
+from gw2tpdb.api.datawars import build_history_request_url, build_items_request_url, Endpoint
+from gw2tpdb.metrics import Metrics
 
-class BuildRequestUrlTest(unittest.TestCase):
-    def test_historic_daily(self):
-        self.assertEqual(build_request_url(Endpoint.HISTORIC_DAILY, 123),
-        "https://api.datawars2.ie/gw2/v2/historic/json?itemID=123")
+_body = json.dumps([{"itemID": item_id, "sell_price_avg": 100} for item_id in range(50)]).encode()
 
-    def test_historic_hourly(self):
-        self.assertEqual(build_request_url(Endpoint.HISTORIC_HOURLY, 456),
-        "https://api.datawars2.ie/gw2/v2/historic/hourly/json?itemID=456")
+class _ChunkedHandler(BaseHTTPRequestHandler):
+    """Answers every request with _body in chunked transfer encoding, without Content-Length."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(_body), 100):
+            chunk = _body[i:i + 100]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+def _serve(test: unittest.TestCase, handler: type) -> str:
+    """Serve HANDLER on a local port until TEST finishes and return its origin."""
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    """Answers /error with 500 and every other path with _body, recording each request's path and client port."""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.client_address[1]))
+        status, body = (500, b"{}") if self.path.startswith("/error") else (200, _body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        _RecordingHandler.requests = []
+        self.origin = _serve(self, _RecordingHandler)
+        self.transport = datawars.Transport(origin=self.origin)
+        self.addCleanup(self.transport.close)
+        self.addCleanup(datawars.set_metrics, datawars.set_metrics(Metrics()))
+
+    def test_rewrites_datawars_origin(self):
+        url = build_history_request_url(Endpoint.HISTORY_DAILY_JSON, [123])
+
+        self.assertEqual(self.transport.get(url).json(), json.loads(_body))
+        self.assertEqual(_RecordingHandler.requests[0][0], url[len(datawars.datawars_origin):])
+        self.assertEqual(self.transport.timings[-1].url, self.origin + url[len(datawars.datawars_origin):])
+
+    def test_leaves_other_origins(self):
+        self.transport.get(self.origin + "/other")
+
+        self.assertEqual(_RecordingHandler.requests[0][0], "/other")
+
+    def test_reuses_pooled_connection(self):
+        session = requests.Session()
+        transport = datawars.Transport(origin=self.origin, session=session)
+        self.addCleanup(transport.close)
+        transport.get(self.origin + "/a")
+        transport.get(self.origin + "/b")
+
+        self.assertIs(transport.session, session)
+        self.assertEqual(session.headers["Accept-Encoding"], "gzip, deflate")
+        self.assertEqual(len({port for _, port in _RecordingHandler.requests}), 1)
+
+    def test_records_status_and_bytes(self):
+        self.transport.get(self.origin + "/ok")
+
+        timing = self.transport.timings[-1]
+        self.assertEqual((timing.status, timing.bytes), (200, len(_body)))
+        self.assertGreater(timing.elapsed_seconds, 0)
+
+    def test_records_error_status(self):
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.transport.get(self.origin + "/error")
+
+        timing = self.transport.timings[-1]
+        self.assertEqual((timing.status, timing.bytes), (500, 2))
+        self.assertEqual(datawars.metrics.counter("requests", status=500), 1)
+
+    def test_closes_failed_streamed_responses(self):
+        with self.assertRaises(requests.exceptions.HTTPError) as raised:
+            self.transport.get(self.origin + "/error", stream=True)
+
+        self.assertTrue(raised.exception.response.raw.closed)
+
+    def test_records_connection_failure(self):
+        transport = datawars.Transport(origin="http://127.0.0.1:1")
+        self.addCleanup(transport.close)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            transport.get(build_items_request_url())
+
+        timing = transport.timings[-1]
+        self.assertEqual((timing.status, timing.bytes), (None, 0))
+        self.assertEqual(datawars.metrics.counter("requests", status="error"), 1)
+
+class StreamMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.transport = datawars.Transport(origin=_serve(self, _ChunkedHandler))
+        self.addCleanup(self.transport.close)
+        self.addCleanup(datawars.set_transport, datawars.set_transport(self.transport))
+        self.addCleanup(datawars.set_limiter, datawars.set_limiter(mock.Mock(**{"acquire.return_value": 0.0})))
+        self.metrics = Metrics()
+        self.addCleanup(datawars.set_metrics, datawars.set_metrics(self.metrics))
+
+    def test_counts_streamed_bytes_and_parse_time(self):
+        records = list(datawars.iter_dailies_json(list(range(50))))
+
+        self.assertEqual(len(records), 50)
+        self.assertEqual(self.metrics.counter("downloaded_bytes"), len(_body))
+        self.assertEqual(self.transport.timings[-1].bytes, len(_body))
+        self.assertEqual(self.metrics.histogram("parse_seconds").count, 1)
+
+    def test_counts_bytes_of_unstreamed_responses_once(self):
+        self.assertEqual(len(datawars.get_dailies_json(list(range(50)))), 50)
+
+        self.assertEqual(self.metrics.counter("downloaded_bytes"), len(_body))
+        self.assertEqual(self.transport.timings[-1].bytes, len(_body))
+
+class BuildHistoryRequestUrlTest(unittest.TestCase):
+    def test_history_daily(self):
+        self.assertEqual(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, [123]),
+        "https://api.datawars2.ie/gw2/v2/history/json?itemID=123")
+
+    def test_history_hourly(self):
+        self.assertEqual(build_history_request_url(Endpoint.HISTORY_HOURLY_JSON, [456]),
+        "https://api.datawars2.ie/gw2/v2/history/hourly/json?itemID=456")
+
+    def test_multiple_ids(self):
+        self.assertEqual(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, [123, 456]),
+        "https://api.datawars2.ie/gw2/v2/history/json?itemID=123%2C456")
 
     def test_with_start(self):
-        self.assertEqual(build_request_url(Endpoint.HISTORIC_DAILY, 123, start=datetime(2023, 4, 10)),
-        "https://api.datawars2.ie/gw2/v2/historic/json?itemID=123&start=2023-04-10T00%3A00%3A00Z")
+        self.assertEqual(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, [123], start=datetime(2023, 4, 10)),
+        "https://api.datawars2.ie/gw2/v2/history/json?itemID=123&start=2023-04-10T00%3A00%3A00Z")
 
     def test_with_end(self):
-        self.assertEqual(build_request_url(Endpoint.HISTORIC_DAILY, 123, end=datetime(2023, 4, 10)),
-        "https://api.datawars2.ie/gw2/v2/historic/json?itemID=123&end=2023-04-10T00%3A00%3A00Z")
+        self.assertEqual(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, [123], end=datetime(2023, 4, 10)),
+        "https://api.datawars2.ie/gw2/v2/history/json?itemID=123&end=2023-04-10T00%3A00%3A00Z")
 
     def test_with_start_and_end(self):
-        self.assertEqual(build_request_url(Endpoint.HISTORIC_DAILY, 123, start=datetime(2023, 4, 1), end=datetime(2023, 4, 2)),
-                         "https://api.datawars2.ie/gw2/v2/historic/json?itemID=123&start=2023-04-01T00%3A00%3A00Z&end=2023-04-02T00%3A00%3A00Z")
+        self.assertEqual(build_history_request_url(Endpoint.HISTORY_DAILY_JSON, [123], start=datetime(2023, 4, 1), end=datetime(2023, 4, 2)),
+                         "https://api.datawars2.ie/gw2/v2/history/json?itemID=123&start=2023-04-01T00%3A00%3A00Z&end=2023-04-02T00%3A00%3A00Z")
+
+class BuildItemsRequestUrlTest(unittest.TestCase):
+    def test_items(self):
+        self.assertEqual(build_items_request_url(), "https://api.datawars2.ie/gw2/v1/items/json")
 
 if __name__ == "__main__":
     unittest.main ()
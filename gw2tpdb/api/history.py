@@ -1,11 +1,13 @@
 import logging
+import functools
 
+from typing import List
 from datetime import datetime, timezone
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 
 # TODO: Rename utc_timestamp to utc_datetime
 
-@dataclass
+@dataclass(slots=True)
 class HistoryEntry():
     """Represents a single entry of history data."""
 
@@ -37,6 +39,9 @@ class HistoryEntry():
     sell_value: int
     utc_timestamp: int
 
+# Field names in HistoryEntry, tuple and history table column order.
+history_fields = tuple(field.name for field in fields(HistoryEntry))
+
 def history_json_to_dataclass(json: dict) -> HistoryEntry:
     """Return HisoryEntry object populated from JSON."""
 
@@ -69,6 +74,48 @@ def history_json_to_dataclass(json: dict) -> HistoryEntry:
         sell_value=json["sell_value"] if "sell_value" in json else 0,
         utc_timestamp=datetime.fromisoformat(json["date"]))
 
+@functools.lru_cache(maxsize=4096)
+def _date_to_timestamp(date: str) -> float:
+    """Return epoch seconds for a Datawars date string.
+
+    Cached because every row of a daily response shares one of a few dates."""
+
+    return datetime.fromisoformat(date).timestamp()
+
+def history_json_to_tuple(json: dict) -> tuple:
+    """Return the history table row for JSON without building a HistoryEntry.
+
+    Equivalent to history_entry_to_tuple(history_json_to_dataclass(json))."""
+
+    get = json.get
+    return (json["itemID"],
+        get("buy_delisted", 0),
+        get("buy_listed", 0),
+        get("buy_price_avg", 0),
+        get("buy_price_max", 0),
+        get("buy_price_min", 0),
+        get("buy_price_stdev", 0),
+        get("buy_quantity_avg", 0),
+        get("buy_quantity_max", 0),
+        get("buy_quantity_min", 0),
+        get("buy_quantity_stdev", 0),
+        get("buy_sold", 0),
+        get("buy_value", 0),
+        get("count", 0),
+        get("sell_delisted", 0),
+        get("sell_listed", 0),
+        get("sell_price_avg", 0),
+        get("sell_price_max", 0),
+        get("sell_price_min", 0),
+        get("sell_price_stdev", 0),
+        get("sell_quantity_avg", 0),
+        get("sell_quantity_max", 0),
+        get("sell_quantity_min", 0),
+        get("sell_quantity_stdev", 0),
+        get("sell_sold", 0),
+        get("sell_value", 0),
+        _date_to_timestamp(json["date"]))
+
 def row_to_history_entry(row: tuple) -> HistoryEntry:
     """Build and return a HistoryEntry from ROW."""
 
@@ -101,6 +148,17 @@ def row_to_history_entry(row: tuple) -> HistoryEntry:
         sell_value=row[25],
         utc_timestamp=datetime.fromtimestamp(row[26], tz=timezone.utc))
 
+def projected_row_to_history_entry(names: List[str], row: tuple) -> HistoryEntry:
+    """Build and return a HistoryEntry from a ROW holding only the NAMES columns.
+
+    Fields outside NAMES are None."""
+
+    values = dict.fromkeys(history_fields)
+    values.update(zip(names, row))
+    values["utc_timestamp"] = datetime.fromtimestamp(values["utc_timestamp"], tz=timezone.utc)
+
+    return HistoryEntry(**values)
+
 def history_entry_to_tuple(history_entry: HistoryEntry) -> tuple:
     """Return given HistoryEntry as a tuple."""
 
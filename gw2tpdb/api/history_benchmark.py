@@ -0,0 +1,42 @@
+"""Compare JSON-to-row conversion throughput.
+
+Usage: python -m gw2tpdb.api.history_benchmark [row_count]"""
+
+import sys
+import time
+
+from datetime import datetime, timezone, timedelta
+from gw2tpdb.api.history import history_fields, history_json_to_dataclass, history_json_to_tuple, history_entry_to_tuple
+
+def synthetic_daily_json(row_count: int, item_count: int = 100) -> list[dict]:
+    """Return ROW_COUNT daily JSON records spread over ITEM_COUNT items."""
+
+    first_day = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    records = []
+    for i in range(row_count):
+        record = {name: i % 1000 for name in history_fields[1:-1]}
+        record["itemID"] = i % item_count
+        record["date"] = (first_day + timedelta(days=i // item_count)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        records.append(record)
+
+    return records
+
+def rows_per_second(convert, records: list[dict]) -> float:
+    """Return how many records CONVERT turns into rows per second."""
+
+    started_at = time.perf_counter()
+    for record in records:
+        convert(record)
+
+    return len(records) / (time.perf_counter() - started_at)
+
+def main(row_count: int = 200000) -> None:
+    records = synthetic_daily_json(row_count)
+    dataclass_rate = rows_per_second(lambda record: history_entry_to_tuple(history_json_to_dataclass(record)), records)
+    tuple_rate = rows_per_second(history_json_to_tuple, records)
+
+    print(f"history_json_to_dataclass + history_entry_to_tuple: {dataclass_rate:,.0f} rows/sec")
+    print(f"history_json_to_tuple: {tuple_rate:,.0f} rows/sec ({tuple_rate / dataclass_rate:.1f}x)")
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
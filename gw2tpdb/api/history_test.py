@@ -0,0 +1,15 @@
+import unittest
+
+from gw2tpdb.api.history import history_fields, history_json_to_dataclass, history_json_to_tuple, history_entry_to_tuple
+
+class HistoryJsonToTupleTest(unittest.TestCase):
+    def test_matches_dataclass_path(self):
+        full = {name: i for i, name in enumerate(history_fields[1:-1])}
+        full.update({"itemID": 19721, "date": "2024-01-02T00:00:00.000Z", "buy_price_stdev": 1.5})
+        sparse = {"itemID": 24, "date": "2024-01-03T00:00:00.000Z", "sell_price_avg": None}
+
+        for json in (full, sparse):
+            self.assertEqual(history_json_to_tuple(json), history_entry_to_tuple(history_json_to_dataclass(json)))
+
+if __name__ == "__main__":
+    unittest.main ()
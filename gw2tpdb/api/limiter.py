@@ -0,0 +1,98 @@
+import time
+import fcntl
+import asyncio
+import threading
+
+from typing import Callable
+
+class TokenBucket():
+    """Token bucket rate limiter shared by blocking and asyncio callers.
+
+    Each acquire reserves the next token under a lock and then waits until
+    that token is due, so callers are served in order without busy-waiting
+    and sync and async callers draw from the same budget."""
+
+    def __init__(self, rate: float, capacity: float = 1, clock: Callable[[], float] = time.monotonic):
+        """Allow RATE acquisitions per second with bursts of up to CAPACITY."""
+
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens / self._rate
+
+    def acquire(self) -> float:
+        """Block until a token is available and return the time spent waiting."""
+
+        wait_seconds = self._reserve()
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+        return wait_seconds
+
+    async def acquire_async(self) -> float:
+        """Wait without blocking the event loop until a token is available.
+
+        Return the time spent waiting."""
+
+        wait_seconds = self._reserve()
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+
+        return wait_seconds
+
+class FileTokenBucket(TokenBucket):
+    """Token bucket shared by every process that opens the same state file.
+
+    The bucket's state lives in a small file that is read and rewritten
+    under an exclusive `flock`, so sync workers in separate processes (or
+    separate daily, hourly and items jobs) stay within one combined budget.
+    Requires a POSIX system."""
+
+    def __init__(self, path: str, rate: float, capacity: float = 1, clock: Callable[[], float] = time.time):
+        """Allow RATE acquisitions per second with bursts of up to CAPACITY across all processes using PATH.
+
+        CLOCK must agree between processes, so it defaults to wall-clock time."""
+
+        super().__init__(rate, capacity, clock=clock)
+        self.path = path
+
+    def _reserve(self) -> float:
+        """Take a token from the shared state file and return how many seconds to wait before using it."""
+
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                state = f.read().split()
+                now = self._clock()
+                if len(state) == 2:
+                    tokens, updated_at = float(state[0]), float(state[1])
+                else:
+                    tokens, updated_at = self._capacity, now
+                tokens = min(self._capacity, tokens + max(now - updated_at, 0) * self._rate) - 1
+                f.seek(0)
+                f.truncate()
+                f.write(f"{tokens!r} {now!r}")
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        if tokens >= 0:
+            return 0.0
+
+        return -tokens / self._rate
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from gw2tpdb.api.limiter import TokenBucket, FileTokenBucket
+
+class _FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TokenBucketTest(unittest.TestCase):
+    def test_waits_for_next_token(self):
+        clock = _FakeClock()
+        bucket = TokenBucket(rate=2, clock=clock)
+
+        self.assertEqual(bucket._reserve(), 0.0)
+        self.assertEqual(bucket._reserve(), 0.5)
+        self.assertEqual(bucket._reserve(), 1.0)
+
+class FileTokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "limiter")
+        self.clock = _FakeClock()
+
+    def test_buckets_on_one_file_share_the_budget(self):
+        first = FileTokenBucket(self.path, rate=1, clock=self.clock)
+        second = FileTokenBucket(self.path, rate=1, clock=self.clock)
+
+        self.assertEqual(first._reserve(), 0.0)
+        self.assertEqual(second._reserve(), 1.0)
+        self.assertEqual(first._reserve(), 2.0)
+
+    def test_refills_over_time(self):
+        bucket = FileTokenBucket(self.path, rate=1, clock=self.clock)
+        bucket._reserve()
+
+        self.clock.now += 1
+        self.assertEqual(bucket._reserve(), 0.0)
+
+if __name__ == "__main__":
+    unittest.main ()
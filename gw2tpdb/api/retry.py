@@ -0,0 +1,69 @@
+import random
+import requests
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+# Rate limiting and transient server errors; other statuses fail immediately.
+retry_statuses = (429, 500, 502, 503, 504)
+
+@dataclass
+class RetryPolicy():
+    """When and how long to wait before retrying a failed request.
+
+    Timeouts, connection errors and RETRY_STATUSES are retried up to
+    max_attempts requests in total. Delays grow exponentially from
+    base_delay_seconds up to max_delay_seconds with full jitter, so
+    concurrent workers don't retry in lockstep. A Retry-After header
+    overrides the computed delay, still capped at max_delay_seconds."""
+
+    max_attempts: int = 4
+    base_delay_seconds: float = 1
+    max_delay_seconds: float = 60
+    retry_statuses: tuple = retry_statuses
+    # Returns a uniform sample in [0, 1); replaceable for deterministic tests.
+    jitter: Callable[[], float] = random.random
+
+    def should_retry(self, error: requests.exceptions.RequestException) -> bool:
+        """Return whether ERROR is worth another attempt."""
+
+        if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+            return True
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            return error.response.status_code in self.retry_statuses
+
+        return False
+
+    def delay(self, attempt: int, retry_after_seconds: Optional[float] = None) -> float:
+        """Return the seconds to wait after failed attempt number ATTEMPT (starting at 0)."""
+
+        if retry_after_seconds is not None:
+            return min(max(retry_after_seconds, 0), self.max_delay_seconds)
+
+        return self.jitter() * min(self.base_delay_seconds * 2 ** attempt, self.max_delay_seconds)
+
+def retry_after_seconds(response: Optional[requests.Response], now: Optional[datetime] = None) -> Optional[float]:
+    """Return the delay requested by RESPONSE's Retry-After header, if any.
+
+    The header is either a number of seconds or an HTTP date."""
+
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+
+    return (retry_at - (now or datetime.now(timezone.utc))).total_seconds()
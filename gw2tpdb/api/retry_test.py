@@ -0,0 +1,107 @@
+import unittest
+import requests
+
+from unittest import mock
+from datetime import datetime, timezone
+from gw2tpdb.api import datawars
+from gw2tpdb.api.retry import RetryPolicy, retry_after_seconds
+from gw2tpdb.metrics import Metrics
+
+def _response(status_code: int, headers: dict = {}) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    return response
+
+def _http_error(status_code: int, headers: dict = {}) -> requests.exceptions.HTTPError:
+    return requests.exceptions.HTTPError(response=_response(status_code, headers))
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_retries_transient_failures_only(self):
+        policy = RetryPolicy()
+
+        self.assertTrue(policy.should_retry(requests.exceptions.ConnectTimeout()))
+        self.assertTrue(policy.should_retry(requests.exceptions.ConnectionError()))
+        self.assertTrue(policy.should_retry(_http_error(429)))
+        self.assertTrue(policy.should_retry(_http_error(503)))
+        self.assertFalse(policy.should_retry(_http_error(404)))
+
+    def test_exponential_delay_with_cap(self):
+        policy = RetryPolicy(base_delay_seconds=1, max_delay_seconds=5, jitter=lambda: 1.0)
+
+        self.assertEqual([policy.delay(attempt) for attempt in range(5)], [1, 2, 4, 5, 5])
+
+    def test_retry_after_overrides_delay(self):
+        policy = RetryPolicy(max_delay_seconds=60, jitter=lambda: 0.0)
+
+        self.assertEqual(policy.delay(0, retry_after_seconds=30), 30)
+        self.assertEqual(policy.delay(0, retry_after_seconds=600), 60)
+
+    def test_retry_after_header(self):
+        now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        self.assertEqual(retry_after_seconds(_response(429, {"Retry-After": "7"})), 7)
+        self.assertEqual(retry_after_seconds(_response(503, {"Retry-After": "Mon, 01 Jan 2024 00:00:30 GMT"}), now=now), 30)
+        self.assertIsNone(retry_after_seconds(_response(503)))
+        self.assertIsNone(retry_after_seconds(_response(503, {"Retry-After": "soon"})))
+
+class _FakeTransport():
+    timeout = 5
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.urls = []
+
+    def get_fresh(self, url):
+        return None
+
+    def get(self, url, stream=False):
+        self.urls.append(url)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+class DatawarsGetRetryTest(unittest.TestCase):
+    def setUp(self):
+        previous_limiter = datawars.set_limiter(mock.Mock(**{"acquire.return_value": 0.0}))
+        self.addCleanup(datawars.set_limiter, previous_limiter)
+        previous_policy = datawars.set_retry_policy(RetryPolicy(max_attempts=3, jitter=lambda: 0.0))
+        self.addCleanup(datawars.set_retry_policy, previous_policy)
+        self.metrics = Metrics()
+        previous_metrics = datawars.set_metrics(self.metrics)
+        self.addCleanup(datawars.set_metrics, previous_metrics)
+        sleep_patch = mock.patch("gw2tpdb.api.datawars.time.sleep")
+        self.sleep = sleep_patch.start()
+        self.addCleanup(sleep_patch.stop)
+
+    def _use_transport(self, transport):
+        previous_transport = datawars.set_transport(transport)
+        self.addCleanup(datawars.set_transport, previous_transport)
+
+    def test_retries_until_success(self):
+        ok = _response(200)
+        transport = _FakeTransport([_http_error(429, {"Retry-After": "2"}), requests.exceptions.ReadTimeout(), ok])
+        self._use_transport(transport)
+
+        self.assertIs(datawars._datawars_get("https://example.test"), ok)
+        self.assertEqual(len(transport.urls), 3)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [2, 0.0])
+        self.assertEqual(self.metrics.counter("retries"), 2)
+        self.assertEqual(self.metrics.histogram("limiter_wait_seconds").count, 3)
+
+    def test_gives_up_after_max_attempts(self):
+        self._use_transport(_FakeTransport([_http_error(500)] * 3))
+
+        self.assertIsNone(datawars._datawars_get("https://example.test"))
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_does_not_retry_client_errors(self):
+        transport = _FakeTransport([_http_error(404)])
+        self._use_transport(transport)
+
+        self.assertIsNone(datawars._datawars_get_as_json("https://example.test"))
+        self.assertEqual(len(transport.urls), 1)
+
+if __name__ == "__main__":
+    unittest.main ()
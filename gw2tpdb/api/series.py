@@ -0,0 +1,114 @@
+from array import array
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional
+from gw2tpdb.api.history import HistoryEntry, history_fields
+
+# Columns that may hold fractions. Every other column is stored as 64-bit
+# integers unless a value in it turns out not to be one.
+_float_fields = frozenset(name for name in history_fields if name.endswith("_stdev"))
+
+def _column_array(name: str, values: Iterable) -> array:
+    """Return VALUES packed into an array of the narrowest fitting type."""
+
+    values = [0 if value is None else value for value in values]
+    if name not in _float_fields:
+        try:
+            return array("q", values)
+        except TypeError:
+            pass
+
+    return array("d", values)
+
+class HistorySeries():
+    """Columnar history for one item.
+
+    Each column is an `array` of 64-bit integers ("q") or doubles ("d").
+    utc_timestamp holds epoch seconds rather than datetimes. Columns are
+    ordered by utc_timestamp."""
+
+    __slots__ = ("id", "columns")
+
+    def __init__(self, id: int, columns: dict[str, array]):
+        self.id = id
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, id: int, rows: List[tuple], names: Iterable[str] = history_fields) -> "HistorySeries":
+        """Build a series from ROWS whose values are in NAMES order."""
+
+        columns = zip(*rows) if len(rows) > 0 else [() for _ in names]
+        return cls(id, {name: _column_array(name, values) for name, values in zip(names, columns)})
+
+    def __len__(self) -> int:
+        return len(self.columns["utc_timestamp"])
+
+    def __getitem__(self, index: int) -> "HistoryRow":
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("HistorySeries index out of range")
+
+        return HistoryRow(self, index)
+
+    def __iter__(self) -> Iterator["HistoryRow"]:
+        for index in range(len(self)):
+            yield HistoryRow(self, index)
+
+    def column(self, name: str) -> array:
+        """Return the column called NAME."""
+
+        return self.columns[name]
+
+    def to_numpy(self) -> dict:
+        """Return each column as a NumPy array sharing the column's memory.
+
+        Requires numpy."""
+
+        try:
+            import numpy
+        except ImportError as e:
+            raise ImportError("HistorySeries.to_numpy requires numpy") from e
+
+        return {name: numpy.frombuffer(column, dtype=numpy.int64 if column.typecode == "q" else numpy.float64)
+                for name, column in self.columns.items()}
+
+    def to_entries(self) -> List[HistoryEntry]:
+        """Return the series as HistoryEntry objects.
+
+        Only valid when the series holds every column."""
+
+        return [row.to_entry() for row in self]
+
+class HistoryRow():
+    """Lazy view of one row of a HistorySeries.
+
+    Attributes are read from the series' columns on access, so iterating a
+    series does not copy it. utc_timestamp is returned as a UTC datetime."""
+
+    __slots__ = ("_series", "_index")
+
+    def __init__(self, series: HistorySeries, index: int):
+        self._series = series
+        self._index = index
+
+    def __getattr__(self, name: str):
+        if name == "id":
+            return self._series.id
+
+        try:
+            column = self._series.columns[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        if name == "utc_timestamp":
+            return datetime.fromtimestamp(column[self._index], tz=timezone.utc)
+
+        return column[self._index]
+
+    def __repr__(self) -> str:
+        return f"HistoryRow(id={self._series.id}, utc_timestamp={self.utc_timestamp.isoformat()})"
+
+    def to_entry(self) -> HistoryEntry:
+        """Return this row as a HistoryEntry."""
+
+        return HistoryEntry(*[getattr(self, name) for name in history_fields])
@@ -0,0 +1,80 @@
+import json
+import codecs
+
+from typing import Any, Iterable, Iterator
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+def _skip_whitespace(buffer: str, position: int) -> int:
+    """Return the index of the first non-whitespace character at or after POSITION."""
+
+    while position < len(buffer) and buffer[position] in _whitespace:
+        position += 1
+
+    return position
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Yield the elements of a UTF-8 JSON array as its bytes arrive in CHUNKS.
+
+    Only the unparsed tail of the body is held in memory, so a response of
+    any size is parsed with memory bounded by its largest element.
+
+    Raises ValueError when the body is not a JSON array."""
+
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    # One of: "start" (before "["), "first" (element or "]"), "next" (element after ","), "done".
+    state = "start"
+    chunk_iterator = iter(chunks)
+
+    while True:
+        chunk = next(chunk_iterator, None)
+        final = chunk is None
+        buffer = buffer[position:] + text_decoder.decode(b"" if final else chunk, final=final)
+        position = 0
+
+        while True:
+            position = _skip_whitespace(buffer, position)
+            if position == len(buffer):
+                break
+
+            if state == "start":
+                if buffer[position] != "[":
+                    raise ValueError(f"Expected a JSON array but found '{buffer[position]}'")
+                state = "first"
+                position += 1
+                continue
+
+            if state == "done":
+                raise ValueError("Unexpected data after end of JSON array")
+
+            if state == "first" and buffer[position] == "]":
+                state = "done"
+                position += 1
+                continue
+
+            try:
+                element, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+            separator_position = _skip_whitespace(buffer, end)
+            if separator_position == len(buffer) or buffer[separator_position] not in ",]":
+                # A number cut off at the end of the chunk decodes early (e.g. "12" of "123" or "1" of "1.5").
+                if not final:
+                    break
+                if separator_position == len(buffer):
+                    raise ValueError("JSON array is not terminated")
+                raise ValueError(f"Expected ',' or ']' but found '{buffer[separator_position]}'")
+
+            state = "done" if buffer[separator_position] == "]" else "next"
+            position = separator_position + 1
+            yield element
+
+        if final:
+            if state != "done":
+                raise ValueError("JSON array is not terminated")
+            return
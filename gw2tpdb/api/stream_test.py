@@ -0,0 +1,28 @@
+import json
+import unittest
+
+from gw2tpdb.api.stream import iter_json_array
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+class IterJsonArrayTest(unittest.TestCase):
+    def test_matches_json_loads_for_every_chunk_size(self):
+        elements = [{"itemID": 1, "name": "Glob of Ectoplasm ☃"}, 12345, "a,]b", [1, [2]], None, 1.5e3, {}]
+        data = json.dumps(elements).encode("utf-8")
+        for size in range(1, len(data) + 1):
+            self.assertEqual(list(iter_json_array(_chunks(data, size))), elements, size)
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_array([b" [ ", b" ] "])), [])
+
+    def test_rejects_non_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"a": 1}']))
+
+    def test_rejects_truncated_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[{"a": 1}, {"a"']))
+
+if __name__ == "__main__":
+    unittest.main ()
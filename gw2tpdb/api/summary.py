@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+from dataclasses import dataclass
+
+@dataclass(slots=True)
+class ItemSummary():
+    """Latest prices and recent aggregates for one item."""
+
+    id: int
+    utc_timestamp: datetime
+    buy_price: int
+    sell_price: int
+    buy_sold_7d: int
+    sell_sold_7d: int
+    buy_price_avg_30d: float
+    sell_price_avg_30d: float
+
+def row_to_item_summary(row: tuple) -> ItemSummary:
+    """Build and return an ItemSummary from ROW."""
+
+    return ItemSummary(
+        id=row[0],
+        utc_timestamp=datetime.fromtimestamp(row[1], tz=timezone.utc),
+        buy_price=row[2],
+        sell_price=row[3],
+        buy_sold_7d=row[4],
+        sell_sold_7d=row[5],
+        buy_price_avg_30d=row[6],
+        sell_price_avg_30d=row[7])
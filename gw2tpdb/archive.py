@@ -0,0 +1,292 @@
+"""Cold storage for old history rows.
+
+History older than a cutoff is moved out of SQLite into one file per table
+and calendar month. A partition holds blocks of whole items' rows in
+(id, utc_timestamp) order; each block stores its columns one after another,
+integers delta-encoded from the previous row, and is zlib-compressed on its
+own so a read only decompresses the blocks of the items it asks for.
+
+Partition layout:
+    magic | block ... | header JSON | header offset (u64) | header length (u64) | magic
+
+The header lists the column names and, per block, its first and last item
+ID, row count, offset and length. Partitions are indexed by the
+archive_partitions table."""
+
+import os
+import sys
+import zlib
+import json
+import heapq
+import bisect
+import struct
+import sqlite3
+import logging
+import functools
+
+from array import array
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+partition_magic = b"GW2A"
+partition_suffix = ".gw2a"
+footer_format = "<QQ4s"
+
+# Rows per compressed block, rounded up to whole items.
+block_rows = 4096
+
+# Rows this close to their item's latest row stay in SQLite, because item
+# summaries are computed from up to 30 days of daily history and syncs and
+# rollups only rewrite recent days.
+hot_window_seconds = 30 * 24 * 60 * 60
+
+# Per-column encodings within a block.
+_delta_encoding = 0
+_float_encoding = 1
+
+def month_start(timestamp: int) -> int:
+    """Return the start of the UTC calendar month containing TIMESTAMP."""
+
+    day = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return int(day.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+def next_month_start(timestamp: int) -> int:
+    """Return the start of the UTC calendar month after the one containing TIMESTAMP."""
+
+    day = datetime.fromtimestamp(month_start(timestamp), tz=timezone.utc)
+    if day.month == 12:
+        return int(day.replace(year=day.year + 1, month=1).timestamp())
+    return int(day.replace(month=day.month + 1).timestamp())
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+def _encode_column(values: List) -> bytes:
+    """Return one column of a block: encoding, null mask flag, optional mask, then values."""
+
+    nulls = bytes(value is None for value in values)
+    has_nulls = any(nulls)
+    if has_nulls:
+        values = [0 if value is None else value for value in values]
+
+    if all(isinstance(value, int) for value in values):
+        deltas = array("q", values)
+        for i in range(len(deltas) - 1, 0, -1):
+            deltas[i] -= deltas[i - 1]
+        payload = bytes([_delta_encoding, has_nulls])
+        body = _little_endian(deltas)
+    else:
+        payload = bytes([_float_encoding, has_nulls])
+        body = _little_endian(array("d", values))
+
+    return payload + (nulls if has_nulls else b"") + body
+
+def _decode_column(data: bytes, offset: int, row_count: int) -> tuple[List, int]:
+    """Return a column decoded from DATA at OFFSET and the offset after it."""
+
+    encoding, has_nulls = data[offset], data[offset + 1]
+    offset += 2
+    nulls = None
+    if has_nulls:
+        nulls = data[offset:offset + row_count]
+        offset += row_count
+
+    body = data[offset:offset + 8 * row_count]
+    offset += 8 * row_count
+    if encoding == _delta_encoding:
+        values = _from_little_endian("q", body)
+        for i in range(1, len(values)):
+            values[i] += values[i - 1]
+    else:
+        values = _from_little_endian("d", body)
+    values = values.tolist()
+
+    if nulls is not None:
+        values = [None if null else value for value, null in zip(values, nulls)]
+
+    return values, offset
+
+def _encode_block(rows: List[tuple]) -> bytes:
+    return zlib.compress(b"".join(_encode_column(list(column)) for column in zip(*rows)))
+
+def _decode_block(data: bytes, row_count: int, column_count: int) -> List[tuple]:
+    data = zlib.decompress(data)
+    columns = []
+    offset = 0
+    for _ in range(column_count):
+        column, offset = _decode_column(data, offset, row_count)
+        columns.append(column)
+
+    return list(zip(*columns))
+
+def _item_blocks(rows: Iterable[tuple]) -> Iterator[List[tuple]]:
+    """Group ROWS (sorted by id) into lists of about block_rows rows without splitting an item."""
+
+    block = []
+    for row in rows:
+        if len(block) >= block_rows and row[0] != block[-1][0]:
+            yield block
+            block = []
+        block.append(row)
+    if len(block) > 0:
+        yield block
+
+def write_partition(path: str, names: List[str], rows: Iterable[tuple]) -> tuple[int, Optional[int], Optional[int]]:
+    """Write ROWS, sorted by (id, utc_timestamp), as a partition at PATH.
+
+    Replaces PATH atomically. Return the row count and the first and last
+    item IDs."""
+
+    blocks = []
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(partition_magic)
+        for block in _item_blocks(rows):
+            data = _encode_block(block)
+            blocks.append([block[0][0], block[-1][0], len(block), f.tell(), len(data)])
+            f.write(data)
+        header = json.dumps({"columns": names, "blocks": blocks}).encode()
+        header_offset = f.tell()
+        f.write(header)
+        f.write(struct.pack(footer_format, header_offset, len(header), partition_magic))
+    os.replace(temporary_path, path)
+
+    row_count = sum(block[2] for block in blocks)
+    if row_count == 0:
+        return 0, None, None
+    return row_count, blocks[0][0], blocks[-1][1]
+
+@functools.lru_cache(maxsize=256)
+def _read_header(path: str, modified_at: float) -> dict:
+    with open(path, "rb") as f:
+        f.seek(-struct.calcsize(footer_format), os.SEEK_END)
+        header_offset, header_length, magic = struct.unpack(footer_format, f.read(struct.calcsize(footer_format)))
+        if magic != partition_magic:
+            raise ValueError(f"Not an archive partition: '{path}'")
+        f.seek(header_offset)
+        return json.loads(f.read(header_length))
+
+def read_partition(path: str, item_ids: Optional[List[int]] = None) -> Iterator[tuple]:
+    """Yield the rows of the partition at PATH in (id, utc_timestamp) order.
+
+    With item_ids (sorted), only blocks that may hold those items are
+    decompressed, and only their rows are yielded."""
+
+    header = _read_header(path, os.path.getmtime(path))
+    blocks = header["blocks"]
+    column_count = len(header["columns"])
+    if item_ids is None:
+        wanted_blocks = range(len(blocks))
+    else:
+        last_ids = [block[1] for block in blocks]
+        wanted_blocks = sorted({bisect.bisect_left(last_ids, item_id) for item_id in item_ids} - {len(blocks)})
+        item_id_set = set(item_ids)
+
+    with open(path, "rb") as f:
+        for index in wanted_blocks:
+            first_id, last_id, row_count, offset, length = blocks[index]
+            f.seek(offset)
+            rows = _decode_block(f.read(length), row_count, column_count)
+            if item_ids is None:
+                yield from rows
+            else:
+                yield from (row for row in rows if row[0] in item_id_set)
+
+def _deduplicated(rows: Iterable[tuple]) -> Iterator[tuple]:
+    """Yield ROWS, sorted by (id, utc_timestamp), keeping the last of rows with the same key."""
+
+    previous = None
+    for row in rows:
+        if previous is not None and (previous[0], previous[-1]) != (row[0], row[-1]):
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+def merge_rows(archived_rows: Iterable[tuple], hot_rows: Iterable[tuple]) -> Iterator[tuple]:
+    """Merge two (id, utc_timestamp)-ordered row streams, preferring hot rows on duplicate keys."""
+
+    return _deduplicated(heapq.merge(archived_rows, hot_rows, key=lambda row: (row[0], row[-1])))
+
+def archive(conn: sqlite3.Connection, directory: str, table_name: str, names: List[str], before: int) -> int:
+    """Move rows of table_name older than the month containing BEFORE into partitions under DIRECTORY.
+
+    Rows within hot_window_seconds of their item's most recent row stay in
+    table_name so freshness checks and summaries keep working from SQLite
+    alone, even for items that stopped trading long ago. Rows already archived for a
+    month are merged with the newly archived ones. Does not commit. Return
+    the number of rows moved."""
+
+    os.makedirs(directory, exist_ok=True)
+    cutoff = month_start(before)
+    columns = ", ".join(names)
+    not_latest = f"utc_timestamp <= (SELECT MAX(utc_timestamp) FROM {table_name} m WHERE m.id = h.id) - {hot_window_seconds}"
+    cursor = conn.cursor()
+    month_starts = [row[0] for row in cursor.execute(
+        f"SELECT DISTINCT CAST(strftime('%s', utc_timestamp, 'unixepoch', 'start of month') AS INTEGER) FROM {table_name} h WHERE utc_timestamp < ? AND {not_latest} ORDER BY 1",
+        (cutoff,)).fetchall()]
+
+    moved_row_count = 0
+    for start in month_starts:
+        end = next_month_start(start)
+        month = datetime.fromtimestamp(start, tz=timezone.utc).strftime("%Y-%m")
+        file_name = f"{table_name}-{month}{partition_suffix}"
+        path = os.path.join(directory, file_name)
+
+        where = f"utc_timestamp >= ? AND utc_timestamp < ? AND {not_latest}"
+        hot_rows = conn.cursor().execute(f"SELECT {columns} FROM {table_name} h WHERE {where} ORDER BY id, utc_timestamp", (start, end))
+        archived_rows = read_partition(path) if os.path.exists(path) else iter(())
+        row_count, min_id, max_id = write_partition(path, names, merge_rows(archived_rows, hot_rows))
+
+        moved = cursor.execute(f"DELETE FROM {table_name} AS h WHERE {where}", (start, end)).rowcount
+        cursor.execute("INSERT OR REPLACE INTO archive_partitions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (table_name, start, end, file_name, row_count, min_id, max_id, os.path.getsize(path)))
+        moved_row_count += moved
+        logger.debug("Archived %s rows of %s for %s (%s rows in partition)", moved, table_name, month, row_count)
+
+    return moved_row_count
+
+def iter_archived_rows(conn: sqlite3.Connection, directory: str, table_name: str, item_ids: List[int], start: Optional[float], end: Optional[float], names: List[str]) -> Iterator[tuple]:
+    """Yield archived rows of table_name for item_ids with start <= utc_timestamp < end in (id, utc_timestamp) order.
+
+    Rows are projected onto NAMES. Partitions are read lazily and merged, so
+    only one block per partition is held in memory."""
+
+    conditions = ["table_name = ?"]
+    parameters = [table_name]
+    if start is not None:
+        conditions.append("end > ?")
+        parameters.append(start)
+    if end is not None:
+        conditions.append("start < ?")
+        parameters.append(end)
+    partitions = conn.cursor().execute(f"SELECT path, min_id, max_id FROM archive_partitions WHERE {' AND '.join(conditions)} ORDER BY start", parameters).fetchall()
+    if len(partitions) == 0:
+        return iter(())
+
+    def partition_rows(full_path: str, partition_item_ids: List[int]) -> Iterator[tuple]:
+        indexes = [_read_header(full_path, os.path.getmtime(full_path))["columns"].index(name) for name in names]
+        for row in read_partition(full_path, partition_item_ids):
+            if (start is None or row[-1] >= start) and (end is None or row[-1] < end):
+                yield tuple(row[i] for i in indexes)
+
+    item_ids = sorted(set(item_ids))
+    partition_iterators = []
+    for path, min_id, max_id in partitions:
+        partition_item_ids = item_ids[bisect.bisect_left(item_ids, min_id):bisect.bisect_right(item_ids, max_id)]
+        if len(partition_item_ids) > 0:
+            partition_iterators.append(partition_rows(os.path.join(directory, path), partition_item_ids))
+
+    return heapq.merge(*partition_iterators, key=lambda row: (row[0], row[-1]))
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from gw2tpdb import archive
+
+class PartitionTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "partition")
+
+    def test_round_trip(self):
+        rows = [(item_id, price, None if day % 3 == 0 else price * 1.5, 1704067200 + day * 86400)
+                for item_id in (1, 2, 5) for day, price in enumerate((100, 90, 120, 7))]
+        rows.append((6, 1.25, 0.5, 1704067200.0))
+
+        self.assertEqual(archive.write_partition(self.path, ["id", "price", "stdev", "utc_timestamp"], rows), (len(rows), 1, 6))
+        self.assertEqual(list(archive.read_partition(self.path)), rows)
+
+    def test_reads_only_requested_items(self):
+        rows = [(item_id, 1704067200 + day * 86400) for item_id in range(100) for day in range(50)]
+        archive.write_partition(self.path, ["id", "utc_timestamp"], rows)
+
+        self.assertEqual(list(archive.read_partition(self.path, [3, 97])), [row for row in rows if row[0] in (3, 97)])
+
+    def test_merge_prefers_hot_rows(self):
+        archived = [(1, "archived", 10), (1, "archived", 20), (2, "archived", 10)]
+        hot = [(1, "hot", 20), (1, "hot", 30)]
+
+        self.assertEqual(list(archive.merge_rows(archived, hot)), [(1, "archived", 10), (1, "hot", 20), (1, "hot", 30), (2, "archived", 10)])
+
+    def test_month_boundaries(self):
+        self.assertEqual(archive.month_start(1705000000), 1704067200)
+        self.assertEqual(archive.next_month_start(1701388800), 1704067200)
+
+if __name__ == "__main__":
+    unittest.main ()
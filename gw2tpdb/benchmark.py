@@ -0,0 +1,335 @@
+"""Throughput benchmarks against a local Datawars stand-in server.
+
+Runs each benchmark in a fresh process, so peak RSS is per benchmark, and
+appends the results with the current commit to a JSON Lines file. The
+previous run with the same configuration is printed alongside for
+comparison.
+
+Usage: python -m gw2tpdb.benchmark [--items N] [--days N] [--latency-ms N] [--output PATH]"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import urlsplit, parse_qs
+from gw2tpdb import Gw2TpDb
+from gw2tpdb.api import datawars
+from gw2tpdb.api.endpoint import Endpoint
+from gw2tpdb.api.history import history_fields, history_json_to_dataclass, history_json_to_tuple, history_entry_to_tuple
+from gw2tpdb.api.history_benchmark import synthetic_daily_json, rows_per_second
+from gw2tpdb.api.limiter import TokenBucket
+from gw2tpdb.api.url import datawars_date_format
+from gw2tpdb.metrics import Metrics
+
+benchmark_names = ("converters", "backfill", "update_dailies", "get_dailies")
+default_results_path = "benchmark-results.jsonl"
+
+# Dates as Datawars sends them: 2020-03-01T00:00:00.000Z
+record_date_format = "%Y-%m-%dT%H:%M:%S.000Z"
+
+@dataclass
+class BenchmarkConfig():
+    """Size of the synthetic data set and how it is exercised."""
+
+    item_count: int = 200
+    # Rows per item served by the daily and hourly endpoints.
+    days: int = 365
+    hours: int = 24 * 14
+    # Added to every stand-in server response.
+    latency_seconds: float = 0
+    # Datawars requests per second; far above the real API's budget.
+    rate: float = 1000
+    # Days removed from the newest end of the backfilled data for update_dailies to fetch again.
+    update_days: int = 3
+    read_repeats: int = 5
+    converter_rows: int = 200000
+
+def _path(endpoint: Endpoint) -> str:
+    return urlsplit(endpoint).path
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency_seconds > 0:
+            time.sleep(server.latency_seconds)
+
+        parts = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        if parts.path == _path(Endpoint.ITEMS_JSON):
+            body = server.items_body()
+        elif parts.path in (_path(Endpoint.HISTORY_DAILY_JSON), _path(Endpoint.HISTORY_HOURLY_JSON)):
+            hourly = parts.path == _path(Endpoint.HISTORY_HOURLY_JSON)
+            body = server.history_body(hourly, [int(item_id) for item_id in query["itemID"].split(",")],
+                                       _parse_date(query.get("start")), _parse_date(query.get("end")))
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    return datetime.strptime(value, datawars_date_format).replace(tzinfo=timezone.utc).timestamp()
+
+class StandInServer(ThreadingHTTPServer):
+    """Local HTTP server answering Datawars requests with synthetic data.
+
+    Every item ID has CONFIG.days daily rows ending today and CONFIG.hours
+    hourly rows ending this hour, filtered by the start and end parameters
+    like the real API. Route requests to it with
+    `datawars.Transport(origin=server.origin)`. Use as a context manager to
+    serve from a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, config: BenchmarkConfig = BenchmarkConfig(), now: Optional[datetime] = None):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.latency_seconds = config.latency_seconds
+        self.item_count = config.item_count
+        self.request_count = 0
+        self.lock = threading.Lock()
+        now = now if now is not None else datetime.now(timezone.utc)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        self._daily_dates = [today - timedelta(days=day) for day in reversed(range(config.days))]
+        self._hourly_dates = [now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hour) for hour in reversed(range(config.hours))]
+        self._records = {}
+
+    @property
+    def origin(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def items_body(self) -> bytes:
+        return json.dumps([{"id": item_id, "name": f"Item {item_id}"} for item_id in range(1, self.item_count + 1)]).encode()
+
+    def history_body(self, hourly: bool, item_ids: List[int], start: Optional[float], end: Optional[float]) -> bytes:
+        """Return the JSON array of ITEM_IDS' rows with start <= date < end."""
+
+        fragments = []
+        for item_id in item_ids:
+            for timestamp, fragment in self._item_records(hourly, item_id):
+                if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                    fragments.append(fragment)
+
+        return b"[" + b",".join(fragments) + b"]"
+
+    def _item_records(self, hourly: bool, item_id: int) -> List[tuple[float, bytes]]:
+        """Return an item's (timestamp, encoded record) pairs, rendering them on first use."""
+
+        key = (hourly, item_id)
+        with self.lock:
+            records = self._records.get(key)
+        if records is not None:
+            return records
+
+        records = []
+        for i, date in enumerate(self._hourly_dates if hourly else self._daily_dates):
+            record = {name: (item_id * 31 + i * 7 + j) % 1000 for j, name in enumerate(history_fields[1:-1])}
+            record["itemID"] = item_id
+            record["date"] = date.strftime(record_date_format)
+            records.append((date.timestamp(), json.dumps(record).encode()))
+        with self.lock:
+            self._records[key] = records
+
+        return records
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+def _peak_rss_bytes() -> int:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+def _stage_seconds(metrics: Metrics, *stages: str) -> float:
+    """Return the total time METRICS recorded for STAGES."""
+
+    histograms = [metrics.histogram(f"{stage}_seconds") for stage in stages]
+    return sum(histogram.sum for histogram in histograms if histogram is not None)
+
+def _daily_row_count(tpdb: Gw2TpDb) -> int:
+    return tpdb._execute("SELECT COUNT(*) FROM daily_history")[0][0]
+
+def _run_benchmark(name: str, config: BenchmarkConfig, origin: str, database_path: str) -> dict:
+    """Run benchmark NAME in this (fresh) process and return its measurements."""
+
+    datawars.set_transport(datawars.Transport(origin=origin))
+    datawars.set_limiter(TokenBucket(rate=config.rate))
+    metrics = Metrics()
+    datawars.set_metrics(metrics)
+    item_ids = list(range(1, config.item_count + 1))
+
+    if name == "converters":
+        records = synthetic_daily_json(config.converter_rows)
+        started_at = time.perf_counter()
+        dataclass_rate = rows_per_second(lambda record: history_entry_to_tuple(history_json_to_dataclass(record)), records)
+        tuple_rate = rows_per_second(history_json_to_tuple, records)
+        return {
+            "seconds": time.perf_counter() - started_at,
+            "rows": 2 * len(records),
+            "dataclass_rows_per_second": dataclass_rate,
+            "tuple_rows_per_second": tuple_rate,
+            "peak_rss_bytes": _peak_rss_bytes(),
+        }
+
+    tpdb = Gw2TpDb(database_path, metrics=metrics)
+    if name == "backfill":
+        started_at = time.perf_counter()
+        success = tpdb.backfill_dailies(item_ids)
+        seconds = time.perf_counter() - started_at
+        rows = _daily_row_count(tpdb)
+    elif name == "update_dailies":
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=config.update_days)).timestamp()
+        with tpdb._transaction():
+            tpdb.conn.execute("DELETE FROM daily_history WHERE utc_timestamp > ?", (cutoff,))
+        rows_before = _daily_row_count(tpdb)
+        started_at = time.perf_counter()
+        success = tpdb.update_dailies(item_ids)
+        seconds = time.perf_counter() - started_at
+        rows = _daily_row_count(tpdb) - rows_before
+    elif name == "get_dailies":
+        started_at = time.perf_counter()
+        rows = 0
+        for _ in range(config.read_repeats):
+            rows += sum(len(entries) for entries in tpdb.get_dailies(item_ids).values())
+        seconds = time.perf_counter() - started_at
+        success = True
+    else:
+        raise ValueError(f"Unknown benchmark '{name}'. Expected one of {benchmark_names}.")
+
+    return {
+        "success": success,
+        "seconds": seconds,
+        "rows": rows,
+        "rows_per_second": rows / seconds if seconds > 0 else None,
+        "sqlite_write_seconds": _stage_seconds(metrics, "write", "commit"),
+        "parse_seconds": _stage_seconds(metrics, "parse", "convert"),
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+def _commit() -> Optional[str]:
+    """Return the checked-out commit of this source tree, if it is a git checkout."""
+
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def run_benchmarks(config: BenchmarkConfig = BenchmarkConfig(), names: tuple = benchmark_names) -> dict:
+    """Run the named benchmarks, in order, against a stand-in server and return the run's record.
+
+    Later benchmarks use the database left by earlier ones: update_dailies
+    and get_dailies expect backfill to have run first."""
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, StandInServer(config) as server:
+        database_path = os.path.join(directory, "benchmark.sqlite")
+        for name in names:
+            requests_before = server.request_count
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(_run_benchmark, name, config, server.origin, database_path).result()
+            if name != "converters":
+                result["requests"] = server.request_count - requests_before
+                result["requests_per_second"] = result["requests"] / result["seconds"] if result["seconds"] > 0 else None
+            results[name] = result
+
+    return {
+        "commit": _commit(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "config": asdict(config),
+        "results": results,
+    }
+
+def load_runs(path: str) -> List[dict]:
+    """Return the runs recorded in the JSON Lines file at PATH, oldest first."""
+
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def save_run(path: str, run: dict) -> None:
+    """Append RUN to the JSON Lines file at PATH."""
+
+    with open(path, "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+def previous_run(runs: List[dict], run: dict) -> Optional[dict]:
+    """Return the most recent of RUNS with RUN's configuration, or None."""
+
+    for candidate in reversed(runs):
+        if candidate["config"] == run["config"]:
+            return candidate
+    return None
+
+def format_run(run: dict, baseline: Optional[dict] = None) -> str:
+    """Return a table of RUN's results, with the change from BASELINE's where available."""
+
+    lines = []
+    for name, result in run["results"].items():
+        baseline_result = baseline["results"].get(name, {}) if baseline is not None else {}
+        for metric in ("rows_per_second", "dataclass_rows_per_second", "tuple_rows_per_second", "requests_per_second", "sqlite_write_seconds", "parse_seconds", "peak_rss_bytes"):
+            value = result.get(metric)
+            if value is None:
+                continue
+            precision = 3 if metric.endswith("seconds") else 1
+            line = f"{name:<16}{metric:<28}{value:>16,.{precision}f}"
+            baseline_value = baseline_result.get(metric)
+            if baseline_value:
+                line += f"  {(value - baseline_value) / baseline_value:+.1%} vs {(baseline['commit'] or 'unknown')[:10]}"
+            lines.append(line)
+
+    return "\n".join(lines)
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark gw2tpdb against a local Datawars stand-in server.")
+    defaults = BenchmarkConfig()
+    parser.add_argument("--items", type=int, default=defaults.item_count)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_seconds * 1000)
+    parser.add_argument("--output", default=default_results_path, help="JSON Lines file the run is appended to")
+    parser.add_argument("benchmarks", nargs="*", help=f"any of {', '.join(benchmark_names)}; all by default")
+    options = parser.parse_args(arguments)
+    unknown_names = set(options.benchmarks) - set(benchmark_names)
+    if len(unknown_names) > 0:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown_names))}")
+
+    config = BenchmarkConfig(item_count=options.items, days=options.days, latency_seconds=options.latency_ms / 1000)
+    run = run_benchmarks(config, tuple(options.benchmarks) or benchmark_names)
+    baseline = previous_run(load_runs(options.output), run)
+    save_run(options.output, run)
+    print(format_run(run, baseline))
+
+if __name__ == "__main__":
+    main()
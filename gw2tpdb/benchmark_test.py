@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+import requests
+
+from datetime import datetime, timezone
+from gw2tpdb import benchmark
+from gw2tpdb.benchmark import BenchmarkConfig, StandInServer
+
+class StandInServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(BenchmarkConfig(item_count=3, days=5, hours=6), now=datetime(2024, 1, 10, 12, 30, tzinfo=timezone.utc))
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def test_daily_filtered_by_start(self):
+        records = requests.get(f"{self.server.origin}/gw2/v2/history/json?itemID=1,2&start=2024-01-09T00:00:00Z").json()
+
+        self.assertEqual([(record["itemID"], record["date"]) for record in records],
+                         [(1, "2024-01-09T00:00:00.000Z"), (1, "2024-01-10T00:00:00.000Z"), (2, "2024-01-09T00:00:00.000Z"), (2, "2024-01-10T00:00:00.000Z")])
+
+    def test_hourly_and_items(self):
+        self.assertEqual(len(requests.get(f"{self.server.origin}/gw2/v2/history/hourly/json?itemID=3").json()), 6)
+        self.assertEqual([item["id"] for item in requests.get(f"{self.server.origin}/gw2/v1/items/json").json()], [1, 2, 3])
+        self.assertEqual(self.server.request_count, 2)
+
+class RunBenchmarksTest(unittest.TestCase):
+    def test_records_every_benchmark(self):
+        config = BenchmarkConfig(item_count=4, days=10, converter_rows=100, read_repeats=1)
+        run = benchmark.run_benchmarks(config)
+
+        self.assertEqual(list(run["results"]), list(benchmark.benchmark_names))
+        self.assertEqual(run["results"]["backfill"]["rows"], 40)
+        self.assertEqual(run["results"]["update_dailies"]["rows"], 4 * config.update_days)
+        self.assertEqual(run["results"]["get_dailies"]["rows"], 40)
+        self.assertTrue(all(result.get("success", True) for result in run["results"].values()))
+
+    def test_compares_with_previous_run_of_same_config(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "results.jsonl")
+        older = {"commit": "a" * 40, "config": {"item_count": 1}, "results": {"get_dailies": {"rows_per_second": 100.0}}}
+        other = {"commit": "b" * 40, "config": {"item_count": 2}, "results": {"get_dailies": {"rows_per_second": 50.0}}}
+        benchmark.save_run(path, older)
+        benchmark.save_run(path, other)
+        current = {"commit": "c" * 40, "config": {"item_count": 1}, "results": {"get_dailies": {"rows_per_second": 150.0}}}
+
+        baseline = benchmark.previous_run(benchmark.load_runs(path), current)
+
+        self.assertEqual(baseline, older)
+        self.assertIn("+50.0% vs aaaaaaaaaa", benchmark.format_run(current, baseline))
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -0,0 +1,124 @@
+import os
+import logging
+import tempfile
+import multiprocessing
+
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import date
+from typing import List, Optional
+from gw2tpdb import Gw2TpDb
+from gw2tpdb.api import datawars
+from gw2tpdb.api.history import history_json_to_tuple
+from gw2tpdb.api.limiter import FileTokenBucket
+
+logger = logging.getLogger(__name__)
+
+default_process_count = 4
+
+# Every process syncing against the same state file shares one request budget.
+default_limiter_path = os.path.join(tempfile.gettempdir(), "gw2tpdb-datawars.limiter")
+
+def use_shared_limiter(limiter_path: str = default_limiter_path, rate: float = datawars.requests_per_second) -> None:
+    """Throttle this process's Datawars requests with the token bucket at LIMITER_PATH.
+
+    Call it in each independent sync process (daily, hourly, items) so their
+    combined request rate stays within RATE requests per second."""
+
+    datawars.set_limiter(FileTokenBucket(limiter_path, rate))
+
+def _init_worker(limiter_path: str, rate: float, origin: Optional[str]) -> None:
+    use_shared_limiter(limiter_path, rate)
+    datawars.set_transport(datawars.Transport(pool_size=1, origin=origin))
+
+def _fetch_daily_rows(item_ids: List[int], start: Optional[date]) -> Optional[List[tuple]]:
+    """Download and convert daily history for ITEM_IDS in a worker process.
+
+    Return None when the download fails."""
+
+    records_opt = datawars.get_dailies_json(item_ids, start=start)
+    if records_opt is None:
+        return None
+
+    return list(map(history_json_to_tuple, records_opt))
+
+def sync_dailies(tpdb: Gw2TpDb,
+                 item_ids: List[int],
+                 process_count: int = default_process_count,
+                 chunk_size: int = 20,
+                 limiter_path: str = default_limiter_path,
+                 rate: float = datawars.requests_per_second,
+                 origin: Optional[str] = None) -> bool:
+    """Download and write missing daily data for each ID in item_ids using a pool of worker processes.
+
+    Requests are planned like `Gw2TpDb.update_dailies_async` and spread over
+    PROCESS_COUNT workers, which download and convert responses to rows in
+    parallel while drawing from the shared token bucket at LIMITER_PATH, so
+    the total request rate stays at RATE. This process stays the only
+    writer: each shard's rows are written through TPDB's connection and
+    committed as soon as the shard completes, so the write lock is only
+    held while writing and readers never wait on a download. ORIGIN
+    redirects worker requests (see `datawars.Transport`).
+
+    Like `Gw2TpDb.update_dailies`, each shard commits together with its
+    sync_journal entry, so `Gw2TpDb.resume_sync` can finish an interrupted
+    run. Shards that failed are retried through the workers once the others
+    are written, bisecting their IDs and dead-lettering those that keep
+    failing.
+
+    Return false when any item failed to download; rows from the other
+    requests are still written.
+
+    Idempotent."""
+
+    jobs, most_recent_local_timestamps = tpdb._daily_jobs(item_ids, chunk_size)
+    if len(jobs) == 0:
+        return True
+    run_id = tpdb._start_sync_run("daily_history", jobs)
+
+    def rows_to_write(rows: List[tuple]) -> List[tuple]:
+        tpdb._observe_remote_daily_rows(rows)
+        return list(tpdb._rows_newer_than(rows, most_recent_local_timestamps))
+
+    max_in_flight = process_count * 2
+    executor = ProcessPoolExecutor(max_workers=process_count,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker,
+                                   initargs=(limiter_path, rate, origin))
+    with executor, tpdb.metrics.stage("sync_run"):
+        pending_jobs = iter(enumerate(jobs))
+        in_flight: dict[Future, tuple] = {}
+        failed_jobs = []
+        while True:
+            # Bound the submitted jobs so finished rows cannot pile up faster than they are written.
+            for job in pending_jobs:
+                _, (chunk, start) = job
+                in_flight[executor.submit(_fetch_daily_rows, chunk, start)] = job
+                if len(in_flight) >= max_in_flight:
+                    break
+            if len(in_flight) == 0:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                index, (chunk, _) = job
+                rows_opt = future.result()
+                if rows_opt is None:
+                    logger.error("Daily history data download returned None. Cannot update %s item IDs starting at %s.", len(chunk), chunk[0])
+                    failed_jobs.append(job)
+                    continue
+                tpdb._write_sync_chunk("daily_history", run_id, index, chunk, rows_to_write(rows_opt))
+
+        def download_chunk(chunk: List[int], start: Optional[date]) -> Optional[List[tuple]]:
+            rows_opt = executor.submit(_fetch_daily_rows, chunk, start).result()
+            return None if rows_opt is None else rows_to_write(rows_opt)
+
+        if len(failed_jobs) > 0:
+            logger.debug("Retrying %s failed daily history requests", len(failed_jobs))
+            tpdb._sync_chunks("daily_history",
+                              [job for _, job in failed_jobs],
+                              download_chunk,
+                              lambda index, succeeded: tpdb._checkpoint_sync(run_id, failed_jobs[index][0], succeeded))
+        logger.debug("Synced daily history for %s item IDs in %s requests across %s processes", len(item_ids), len(jobs), process_count)
+
+    return tpdb._finish_sync_run(run_id)
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timezone
+from gw2tpdb import Gw2TpDb
+from gw2tpdb import coordinator
+
+def _day(day: int) -> datetime:
+    return datetime(2024, 1, day, tzinfo=timezone.utc)
+
+class _DailyHandler(BaseHTTPRequestHandler):
+    failing_item_id = 3
+
+    def do_GET(self):
+        item_ids = list(map(int, parse_qs(urlparse(self.path).query)["itemID"][0].split(",")))
+        if self.failing_item_id in item_ids:
+            self.send_error(404)
+            return
+        body = json.dumps([{"itemID": item_id, "sell_price_avg": 100, "date": _day(day).isoformat()}
+                           for item_id in item_ids for day in (1, 2, 3)]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class SyncDailiesTest(unittest.TestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _DailyHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.origin = f"http://127.0.0.1:{server.server_address[1]}"
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.limiter_path = os.path.join(directory.name, "limiter")
+        self.db = Gw2TpDb(":memory:")
+
+    def test_single_writer_collects_every_shard(self):
+        self.db._write_daily_rows([(1,) + (0,) * 25 + (int(_day(1).timestamp()),)])
+        self.db._remote_daily_watermark.set(_day(3))
+
+        self.assertTrue(coordinator.sync_dailies(self.db, [1, 2, 4, 5], process_count=2, chunk_size=1,
+                                                 limiter_path=self.limiter_path, rate=100, origin=self.origin))
+
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([1, 2, 4, 5]), {item_id: _day(3) for item_id in (1, 2, 4, 5)})
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM daily_history")[0][0], 12)
+
+    def test_failed_shards_are_bisected_and_journaled(self):
+        self.db._remote_daily_watermark.set(_day(3))
+
+        self.assertFalse(coordinator.sync_dailies(self.db, [1, 2, 3, 4], process_count=2, chunk_size=2,
+                                                  limiter_path=self.limiter_path, rate=100, origin=self.origin))
+
+        self.assertEqual(self.db.get_dead_letters(), {3: 1})
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([1, 2, 3, 4]), {1: _day(3), 2: _day(3), 3: None, 4: _day(3)})
+        self.assertEqual(self.db._execute("SELECT failed_chunk_count FROM sync_runs WHERE finished_at IS NOT NULL"), [(1,)])
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM sync_journal")[0][0], 0)
+
+if __name__ == "__main__":
+    unittest.main ()
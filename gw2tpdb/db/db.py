@@ -1,6 +1,48 @@
 import os
 import sqlite3
 
+from typing import Optional
+from dataclasses import dataclass
+
+journal_modes = ("delete", "truncate", "persist", "memory", "wal", "off")
+synchronous_modes = ("off", "normal", "full", "extra")
+
+@dataclass
+class IngestionProfile():
+    """SQLite settings for a connection that bulk-writes history.
+
+    The defaults trade a little durability for write throughput: WAL lets
+    readers query while a large update commits, and synchronous=NORMAL is
+    safe against application crashes in WAL mode (only a power loss can
+    lose the last commits)."""
+
+    journal_mode: str = "wal"
+    synchronous: str = "normal"
+    # Negative values are KiB, positive values are pages (see PRAGMA cache_size).
+    cache_size: int = -64 * 1024
+    mmap_size: int = 256 * 1024 * 1024
+    busy_timeout_ms: int = 5000
+
+def apply_profile(conn: sqlite3.Connection, profile: IngestionProfile) -> None:
+    """Apply PROFILE's pragmas to CONN.
+
+    Raises ValueError for unknown journal or synchronous modes."""
+
+    journal_mode = profile.journal_mode.lower()
+    if journal_mode not in journal_modes:
+        raise ValueError(f"Unknown journal_mode '{profile.journal_mode}'. Expected one of {journal_modes}.")
+
+    synchronous = profile.synchronous.lower()
+    if synchronous not in synchronous_modes:
+        raise ValueError(f"Unknown synchronous mode '{profile.synchronous}'. Expected one of {synchronous_modes}.")
+
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+    cursor.execute(f"PRAGMA synchronous = {synchronous}")
+    cursor.execute(f"PRAGMA cache_size = {int(profile.cache_size)}")
+    cursor.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+    cursor.execute(f"PRAGMA busy_timeout = {int(profile.busy_timeout_ms)}")
+
 def create_tables(conn: sqlite3.Connection):
     """Create a new SQLite database at db_path.
 
@@ -11,9 +53,33 @@ def create_tables(conn: sqlite3.Connection):
         conn.cursor().executescript(schema)
         conn.commit()
 
-def connect(db_path: str):
+def connect(db_path: str, profile: Optional[IngestionProfile] = None):
     should_create_tables = not os.path.exists(db_path)
     conn = sqlite3.connect(db_path)
+    if profile is not None:
+        apply_profile(conn, profile)
     create_tables(conn)
 
     return conn
+
+def connect_read_only(db_path: str, profile: Optional[IngestionProfile] = None) -> sqlite3.Connection:
+    """Open an existing database at db_path for reading only.
+
+    Skips the schema script, so the database must have been created by
+    `connect`. The connection may be used from any thread, one at a time.
+    In WAL mode its reads never block, and are never blocked by, a writer
+    in another connection or process. Only PROFILE's cache, mmap and busy
+    timeout settings are applied, since the journal mode belongs to the
+    writer.
+
+    Raises sqlite3.OperationalError when db_path does not exist."""
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA query_only = 1")
+    if profile is not None:
+        cursor.execute(f"PRAGMA cache_size = {int(profile.cache_size)}")
+        cursor.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+        cursor.execute(f"PRAGMA busy_timeout = {int(profile.busy_timeout_ms)}")
+
+    return conn
@@ -0,0 +1,28 @@
+import os
+import tempfile
+import unittest
+
+from gw2tpdb.db import db
+
+class ConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "tp.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_applies_ingestion_profile(self):
+        conn = db.connect(self.path, db.IngestionProfile(synchronous="off", cache_size=-1024))
+
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 0)
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -1024)
+        conn.close()
+
+    def test_rejects_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            db.connect(self.path, db.IngestionProfile(journal_mode="wal; DROP TABLE items"))
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -71,3 +71,133 @@ CREATE TABLE IF NOT EXISTS items (
   PRIMARY KEY (id),
   UNIQUE(id)
 );
+
+-- Item IDs already reached by an in-progress backfill. Cleared for the
+-- backfill's item IDs when it returns, whether or not every batch succeeded.
+CREATE TABLE IF NOT EXISTS backfill_progress (
+  id INTEGER NOT NULL,
+  row_count INTEGER NOT NULL,
+
+  PRIMARY KEY (id)
+);
+
+-- Days whose hourly_history rows changed since they were last rolled up
+-- into daily_history. utc_timestamp is the start of the day.
+CREATE TABLE IF NOT EXISTS rollup_pending (
+  id INTEGER NOT NULL,
+  utc_timestamp INTEGER NOT NULL,
+
+  PRIMARY KEY (id, utc_timestamp)
+);
+
+CREATE TRIGGER IF NOT EXISTS hourly_history_rollup_insert AFTER INSERT ON hourly_history
+BEGIN
+  INSERT OR IGNORE INTO rollup_pending VALUES (NEW.id, CAST(NEW.utc_timestamp AS INTEGER) - CAST(NEW.utc_timestamp AS INTEGER) % 86400);
+END;
+
+CREATE TRIGGER IF NOT EXISTS hourly_history_rollup_update AFTER UPDATE ON hourly_history
+BEGIN
+  INSERT OR IGNORE INTO rollup_pending VALUES (NEW.id, CAST(NEW.utc_timestamp AS INTEGER) - CAST(NEW.utc_timestamp AS INTEGER) % 86400);
+END;
+
+-- Latest indicators per item, written by analytics.write_item_metrics.
+-- utc_timestamp is the day the indicators describe; computed_at is when
+-- they were computed.
+CREATE TABLE IF NOT EXISTS item_metrics (
+  id INTEGER NOT NULL,
+  utc_timestamp INTEGER NOT NULL,
+  buy_price REAL,
+  sell_price REAL,
+  sell_price_sma REAL,
+  volatility REAL,
+  spread REAL,
+  spread_pct REAL,
+  flip_margin REAL,
+  flip_margin_pct REAL,
+  volume REAL,
+  volume_rank INTEGER,
+  computed_at INTEGER NOT NULL,
+
+  PRIMARY KEY (id)
+);
+
+-- Latest prices and recent aggregates per item, refreshed whenever the
+-- item's daily_history rows are written. utc_timestamp is the item's most
+-- recent day; the 7- and 30-day windows end on it.
+CREATE TABLE IF NOT EXISTS item_summary (
+  id INTEGER NOT NULL,
+  utc_timestamp INTEGER NOT NULL,
+  buy_price INTEGER,
+  sell_price INTEGER,
+  buy_sold_7d INTEGER,
+  sell_sold_7d INTEGER,
+  buy_price_avg_30d REAL,
+  sell_price_avg_30d REAL,
+
+  PRIMARY KEY (id)
+);
+
+-- Item IDs whose history kept failing to download, by history table. Retried
+-- by the next sync of that table and removed once they succeed.
+CREATE TABLE IF NOT EXISTS dead_letters (
+  table_name TEXT NOT NULL,
+  id INTEGER NOT NULL,
+  attempts INTEGER NOT NULL,
+  last_failed_at INTEGER NOT NULL,
+
+  PRIMARY KEY (table_name, id)
+);
+
+-- One row per update_dailies or update_hourlies run. finished_at is NULL
+-- until every chunk has been attempted; see Gw2TpDb.resume_sync. Only the
+-- latest kept_sync_runs finished runs of each table are kept.
+CREATE TABLE IF NOT EXISTS sync_runs (
+  run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  table_name TEXT NOT NULL,
+  started_at INTEGER NOT NULL,
+  finished_at INTEGER,
+  failed_chunk_count INTEGER
+);
+
+-- The planned requests of unfinished sync runs. Each chunk's status is
+-- updated in the transaction that writes its rows. Entries are deleted when
+-- their run finishes.
+CREATE TABLE IF NOT EXISTS sync_journal (
+  run_id INTEGER NOT NULL,
+  chunk INTEGER NOT NULL,
+  -- Comma-separated item IDs.
+  item_ids TEXT NOT NULL,
+  -- Requested window start as epoch seconds; NULL for full history.
+  start INTEGER,
+  -- 'pending', 'done' or 'failed'.
+  status TEXT NOT NULL,
+
+  PRIMARY KEY (run_id, chunk)
+);
+
+-- Hash of the item catalog as of the last sync_items, so an unchanged
+-- catalog is not compared item by item. Holds at most one row.
+CREATE TABLE IF NOT EXISTS catalog_version (
+  id INTEGER NOT NULL CHECK (id = 0),
+  hash TEXT NOT NULL,
+  item_count INTEGER NOT NULL,
+  synced_at INTEGER NOT NULL,
+
+  PRIMARY KEY (id)
+);
+
+-- Monthly partitions of history moved out of SQLite by
+-- Gw2TpDb.archive_dailies. start and end bound the month in epoch seconds;
+-- path is relative to the archive directory.
+CREATE TABLE IF NOT EXISTS archive_partitions (
+  table_name TEXT NOT NULL,
+  start INTEGER NOT NULL,
+  end INTEGER NOT NULL,
+  path TEXT NOT NULL,
+  row_count INTEGER NOT NULL,
+  min_id INTEGER,
+  max_id INTEGER,
+  bytes INTEGER NOT NULL,
+
+  PRIMARY KEY (table_name, start)
+);
@@ -0,0 +1,594 @@
+import asyncio
+import tempfile
+import unittest
+import gw2tpdb
+
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timezone, timedelta
+from gw2tpdb import Gw2TpDb
+from gw2tpdb.read_cache import ReadCache
+from gw2tpdb.metrics import Metrics
+from gw2tpdb import archive
+from gw2tpdb.api.history import HistoryEntry, history_fields, history_entry_to_tuple
+from gw2tpdb.api.item import ItemEntry
+
+def _entry(item_id: int, utc_timestamp: datetime, price: int = 100) -> HistoryEntry:
+    """Return a HistoryEntry with PRICE in every price field."""
+
+    return HistoryEntry(item_id, 0, 0, price, price, price, 0.0, 0, 0, 0, 0.0, 0, 0, 1,
+                        0, 0, price, price, price, 0.0, 0, 0, 0, 0.0, 0, 0, utc_timestamp)
+
+def _day(day: int) -> datetime:
+    return datetime(2024, 1, day, tzinfo=timezone.utc)
+
+class MostRecentLocalDailyTimestampsTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+
+    def test_empty(self):
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([1, 2]), {1: None, 2: None})
+
+    def test_mixed(self):
+        self.db._write_daily([_entry(1, _day(1)), _entry(1, _day(3)), _entry(2, _day(2))])
+
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([1, 2, 3]),
+                         {1: _day(3), 2: _day(2), 3: None})
+
+    def test_more_ids_than_query_variables(self):
+        self.db._write_daily([_entry(item_id, _day(1)) for item_id in range(2000)])
+
+        timestamps = self.db._most_recent_local_daily_timestamps(list(range(2500)))
+
+        self.assertEqual(len(timestamps), 2500)
+        self.assertEqual(timestamps[1999], _day(1))
+        self.assertIsNone(timestamps[2000])
+
+class InsertManyTest(unittest.TestCase):
+    def test_overlapping_rows_update_in_place(self):
+        db = Gw2TpDb(":memory:")
+        db._write_daily([_entry(1, _day(1), price=1), _entry(1, _day(2), price=2)])
+        db._write_daily([_entry(1, _day(2), price=3), _entry(1, _day(3), price=4)])
+
+        self.assertEqual(db._execute("SELECT sell_price_avg FROM daily_history ORDER BY utc_timestamp"), [(1,), (3,), (4,)])
+
+    def test_transaction_rolls_back_on_error(self):
+        db = Gw2TpDb(":memory:")
+        with self.assertRaises(RuntimeError):
+            with db._transaction():
+                db._write_daily([_entry(1, _day(1))], commit=False)
+                raise RuntimeError()
+
+        self.assertEqual(db._execute("SELECT COUNT(*) FROM daily_history"), [(0,)])
+
+class BackfillDailiesTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.requests = []
+
+    def _fake_iter_dailies(self, rows_per_item: int, failing_ids: set = set()):
+        def iter_dailies(item_ids, start=None, end=None):
+            self.requests.append(list(item_ids))
+            if failing_ids.intersection(item_ids):
+                return None
+            return iter([_entry_json(item_id, day) for item_id in item_ids for day in range(1, rows_per_item + 1)])
+        return iter_dailies
+
+    def test_adapts_batch_size_to_rows_per_item(self):
+        with mock.patch("gw2tpdb.iter_dailies_json", self._fake_iter_dailies(rows_per_item=10)):
+            self.assertTrue(self.db.backfill_dailies(list(range(100)), target_rows_per_request=200))
+
+        self.assertEqual([len(batch) for batch in self.requests], [10, 20, 20, 20, 20, 10])
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM daily_history")[0][0], 1000)
+        self.assertEqual(self.db._backfill_progress_ids(), set())
+
+    def test_resumes_after_failure(self):
+        with mock.patch("gw2tpdb.iter_dailies_json", self._fake_iter_dailies(rows_per_item=1, failing_ids={7})):
+            self.assertFalse(self.db.backfill_dailies(list(range(10))))
+
+        self.assertEqual(self.db._backfill_progress_ids(), set())
+
+        self.requests = []
+        with mock.patch("gw2tpdb.iter_dailies_json", self._fake_iter_dailies(rows_per_item=1)):
+            self.assertTrue(self.db.backfill_dailies(list(range(10))))
+
+        self.assertEqual(self.requests, [[7]])
+
+    def test_recovered_batches_count_as_success(self):
+        iter_dailies = self._fake_iter_dailies(rows_per_item=1)
+        def iter_small_dailies(item_ids, start=None, end=None):
+            # Large responses time out.
+            return None if len(item_ids) > 5 else iter_dailies(item_ids, start, end)
+
+        with mock.patch("gw2tpdb.iter_dailies_json", iter_small_dailies):
+            self.assertTrue(self.db.backfill_dailies(list(range(10))))
+
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM daily_history")[0][0], 10)
+        self.assertEqual(self.db.get_dead_letters(), {})
+
+    def test_skips_reached_ids_once_after_interruption(self):
+        # An interrupted backfill reached item 3, which has no history.
+        self.db.conn.execute("INSERT INTO backfill_progress VALUES (3, 0)")
+        self.db.conn.commit()
+
+        with mock.patch("gw2tpdb.iter_dailies_json", self._fake_iter_dailies(rows_per_item=0)):
+            self.assertTrue(self.db.backfill_dailies([3, 4]))
+            self.assertEqual(self.db._backfill_progress_ids(), set())
+            self.assertTrue(self.db.backfill_dailies([3, 4]))
+
+        self.assertEqual(self.requests, [[4], [3, 4]])
+
+class GetDailiesColumnarTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.db._write_daily([_entry(2, _day(2), price=5), _entry(1, _day(1)), _entry(2, _day(1), price=7)])
+
+    def test_matches_get_dailies(self):
+        series = self.db.get_dailies_columnar([1, 2, 3])
+
+        self.assertEqual(sorted(series), [1, 2])
+        self.assertEqual(list(series[2].column("sell_price_avg")), [7, 5])
+        self.assertEqual(list(series[2].column("utc_timestamp")), [int(_day(1).timestamp()), int(_day(2).timestamp())])
+        for item_id, entries in self.db.get_dailies([1, 2]).items():
+            self.assertEqual(series[item_id].to_entries(), sorted(entries, key=lambda entry: entry.utc_timestamp))
+
+    def test_row_views(self):
+        row = self.db.get_dailies_columnar([2])[2][-1]
+
+        self.assertEqual(row.id, 2)
+        self.assertEqual(row.sell_price_avg, 5)
+        self.assertEqual(row.utc_timestamp, _day(2))
+
+class GetDailiesTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.db._write_daily([_entry(item_id, _day(day), price=day) for item_id in (1, 2, 3) for day in range(1, 6)])
+
+    def test_range(self):
+        dailies = self.db.get_dailies([2, 1, 9], start=_day(2), end=datetime(2024, 1, 4))
+
+        self.assertEqual(list(dailies), [1, 2])
+        self.assertEqual([entry.utc_timestamp for entry in dailies[1]], [_day(2), _day(3)])
+
+    def test_columns(self):
+        entries = self.db.get_daily(3, start=_day(5).date(), columns=["sell_price_avg"])
+
+        self.assertEqual(len(entries), 1)
+        self.assertEqual((entries[0].id, entries[0].sell_price_avg, entries[0].buy_price_avg, entries[0].utc_timestamp), (3, 5, None, _day(5)))
+        self.assertEqual(self.db.get_dailies_columnar([3], columns=["buy_sold"])[3].columns.keys(), {"id", "buy_sold", "utc_timestamp"})
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            self.db.get_daily(1, columns=["1; DROP TABLE items"])
+
+class UpdateHourliesTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.requests = []
+
+    def _fake_iter_hourlies(self, item_ids, start=None, end=None):
+        self.requests.append((list(item_ids), start))
+        return iter([{"itemID": item_id, "sell_price_avg": hour, "date": (_day(1) + timedelta(hours=hour)).isoformat()}
+                     for item_id in item_ids for hour in range(24)])
+
+    def test_incremental(self):
+        self.db._write_history_rows("hourly_history", [(1,) + (0,) * 25 + ((_day(1) + timedelta(hours=20)).timestamp(),)])
+
+        with mock.patch("gw2tpdb.iter_hourlies_json", self._fake_iter_hourlies):
+            self.assertTrue(self.db.update_hourlies([1, 2, 3], chunk_size=1))
+
+        self.assertEqual(self.requests, [([2], None), ([3], None), ([1], _day(1) + timedelta(hours=21))])
+        hourlies = self.db.get_hourlies([1, 2], start=_day(1) + timedelta(hours=20), columns=["sell_price_avg"])
+        self.assertEqual([entry.sell_price_avg for entry in hourlies[1]], [0, 21, 22, 23])
+        self.assertEqual(len(hourlies[2]), 4)
+
+class RollupTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+
+    def _hour(self, hour: int, count: int, price_avg: int, price_stdev: float, sold: int) -> tuple:
+        values = dict.fromkeys(history_fields, 0)
+        values.update(id=1, count=count, sell_price_avg=price_avg, sell_price_stdev=price_stdev,
+                      sell_price_min=price_avg - 1, sell_price_max=price_avg + 1, sell_sold=sold,
+                      utc_timestamp=(_day(1) + timedelta(hours=hour)).timestamp())
+        return tuple(values.values())
+
+    def test_rollup_and_validate(self):
+        self.db._write_history_rows("hourly_history", [self._hour(0, 1, 10, 0.0, 5), self._hour(1, 3, 20, 2.0, 7)])
+
+        self.assertEqual(self.db.rollup_hourlies(), 1)
+        self.assertEqual(self.db.rollup_hourlies(), 0)
+        daily = self.db.get_daily(1)[0]
+        self.assertEqual((daily.utc_timestamp, daily.count, daily.sell_sold), (_day(1), 4, 12))
+        self.assertEqual((daily.sell_price_min, daily.sell_price_max, daily.sell_price_avg), (9, 21, 18))
+        # Samples: one at 10 and three averaging 20 with stdev 2.
+        self.assertAlmostEqual(daily.sell_price_stdev, ((1 * 100 + 3 * (4 + 400)) / 4 - 17.5 ** 2) ** 0.5)
+        self.assertEqual(self.db.validate_rollup(), [])
+
+        self.db._write_daily([_entry(1, _day(1), price=30)])
+        mismatches = self.db.validate_rollup(item_ids=[1])
+        self.assertIn("sell_price_avg", [mismatch.column for mismatch in mismatches])
+
+        self.db._write_history_rows("hourly_history", [self._hour(2, 1, 10, 0.0, 1)])
+        self.assertEqual(self.db.rollup_hourlies(), 1)
+        self.assertEqual(self.db.get_daily(1)[0].sell_sold, 13)
+
+class SummariesTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+
+    def test_maintained_on_write(self):
+        self.db._write_daily([_entry(1, _day(day), price=day) for day in range(1, 11)])
+        self.db._write_daily([_entry(1, _day(11), price=50), _entry(2, _day(3), price=7)])
+
+        summaries = self.db.get_summaries()
+        self.assertEqual(sorted(summaries), [1, 2])
+        self.assertEqual((summaries[1].utc_timestamp, summaries[1].sell_price), (_day(11), 50))
+        self.assertAlmostEqual(summaries[1].sell_price_avg_30d, (sum(range(1, 11)) + 50) / 11)
+        self.assertEqual(self.db.get_summaries([2])[2].buy_price, 7)
+
+    def test_rebuild(self):
+        self.db._write_daily([_entry(1, _day(1)), _entry(2, _day(2))])
+        expected = self.db.get_summaries()
+        self.db._execute("DELETE FROM item_summary")
+
+        self.assertEqual(self.db.rebuild_summaries(), 2)
+        self.assertEqual(self.db.get_summaries(), expected)
+
+class _FakeResponse():
+    def __init__(self, json):
+        self._json = json
+
+    def json(self):
+        return self._json
+
+def _entry_json(item_id: int, day: int) -> dict:
+    return {"itemID": item_id, "sell_price_avg": 100, "date": _day(day).isoformat()}
+
+class UpdateDailiesAsyncTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.urls = []
+
+    async def _fake_get_async(self, url):
+        self.urls.append(url)
+        item_ids = map(int, parse_qs(urlparse(url).query)["itemID"][0].split(","))
+        return _FakeResponse([_entry_json(item_id, day) for item_id in item_ids for day in (1, 2, 3)])
+
+    def test_writes_only_new_rows(self):
+        self.db._write_daily([_entry(1, _day(1)), _entry(1, _day(2))])
+        self.db._remote_daily_watermark.set(_day(3))
+
+        with mock.patch("gw2tpdb._datawars_get_async", self._fake_get_async):
+            self.assertTrue(asyncio.run(self.db.update_dailies_async([1, 2], chunk_size=1)))
+
+        self.assertEqual(len(self.urls), 2)
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([1, 2]), {1: _day(3), 2: _day(3)})
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM daily_history")[0][0], 6)
+
+    def test_bisects_failed_chunks_and_finishes_run(self):
+        self.db._write_daily([_entry(item_id, _day(1)) for item_id in range(4)])
+        self.db._remote_daily_watermark.set(_day(3))
+
+        async def get_async(url):
+            return None if "3" in parse_qs(urlparse(url).query)["itemID"][0].split(",") else await self._fake_get_async(url)
+
+        def get_dailies_json(item_ids, start=None, end=None):
+            return None if 3 in item_ids else [_entry_json(item_id, day) for item_id in item_ids for day in (2, 3)]
+
+        with mock.patch("gw2tpdb._datawars_get_async", get_async), mock.patch("gw2tpdb.get_dailies_json", get_dailies_json):
+            self.assertFalse(asyncio.run(self.db.update_dailies_async(list(range(4)), chunk_size=2)))
+
+        self.assertEqual(self.db.get_dead_letters(), {3: 1})
+        self.assertEqual(self.db._most_recent_local_daily_timestamps(list(range(4))), {0: _day(3), 1: _day(3), 2: _day(3), 3: _day(1)})
+        self.assertEqual(self.db._execute("SELECT failed_chunk_count FROM sync_runs WHERE finished_at IS NOT NULL"), [(1,)])
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM sync_journal")[0][0], 0)
+
+class DeadLettersTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.db._write_daily([_entry(item_id, _day(1)) for item_id in range(12)])
+        self.db._remote_daily_watermark.set(_day(3))
+        self.requests = []
+
+    def _fake_get_dailies_json(self, bad_item_ids):
+        def get_dailies_json(item_ids, start=None, end=None):
+            self.requests.append(list(item_ids))
+            if any(item_id in bad_item_ids for item_id in item_ids):
+                return None
+            return [_entry_json(item_id, day) for item_id in item_ids for day in (2, 3)]
+        return get_dailies_json
+
+    def test_bisects_to_failing_ids(self):
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json({5})):
+            self.assertFalse(self.db.update_dailies(list(range(8)), chunk_size=8))
+
+        self.assertEqual(self.requests, [list(range(8)), [0, 1, 2, 3], [4, 5, 6, 7], [4, 5], [4], [5], [6, 7]])
+        self.assertEqual(self.db.get_dead_letters(), {5: 1})
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([4, 5]), {4: _day(3), 5: _day(1)})
+
+    def _fail_before(self, seconds: int) -> None:
+        self.db.conn.execute("UPDATE dead_letters SET last_failed_at = last_failed_at - ?", (seconds,))
+        self.db.conn.commit()
+
+    def test_retries_dead_letters_after_backoff(self):
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json({5})):
+            self.db.update_dailies([5])
+        self.requests = []
+
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json(set())):
+            self.assertTrue(self.db.update_dailies([0]))
+            self._fail_before(gw2tpdb.dead_letter_backoff_seconds)
+            self.assertTrue(self.db.update_dailies([1]))
+
+        self.assertEqual(self.requests, [[0], [1, 5]])
+        self.assertEqual(self.db.get_dead_letters(), {})
+
+    def test_backoff_doubles_until_attempts_run_out(self):
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json({5})):
+            self.db.update_dailies([5])
+            self.db.update_dailies([5])
+            self._fail_before(gw2tpdb.dead_letter_backoff_seconds)
+            self.assertEqual(self.db._with_dead_letters("daily_history", [0]), [0])
+            self._fail_before(gw2tpdb.dead_letter_backoff_seconds)
+            self.assertEqual(self.db._with_dead_letters("daily_history", [0]), [0, 5])
+
+            self.db.conn.execute("UPDATE dead_letters SET attempts = ?", (gw2tpdb.max_dead_letter_attempts,))
+            self._fail_before(365 * 24 * 60 * 60)
+            self.assertEqual(self.db._with_dead_letters("daily_history", [0]), [0])
+
+    def test_auto_update_reads_do_not_retry_dead_letters(self):
+        db = Gw2TpDb(":memory:", auto_update=True)
+        db._write_daily([_entry(item_id, _day(1)) for item_id in range(2)])
+        db._remote_daily_watermark.set(_day(3))
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json({1})):
+            db.update_dailies([1])
+            db.conn.execute("UPDATE dead_letters SET last_failed_at = 0")
+            db.conn.commit()
+            self.requests = []
+            db.get_dailies([0])
+
+        self.assertEqual(self.requests, [[0]])
+
+    def test_downloads_outside_the_write_transaction(self):
+        in_transaction = []
+        get_dailies_json = self._fake_get_dailies_json({5})
+        def recording_get_dailies_json(item_ids, start=None, end=None):
+            in_transaction.append(self.db.conn.in_transaction)
+            return get_dailies_json(item_ids, start, end)
+
+        with mock.patch("gw2tpdb.get_dailies_json", recording_get_dailies_json):
+            self.db.update_dailies(list(range(8)), chunk_size=8)
+
+        self.assertEqual(in_transaction, [False] * 7)
+
+    def test_stops_requesting_after_consecutive_failures(self):
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json(set(range(12)))):
+            self.assertFalse(self.db.update_dailies(list(range(12)), chunk_size=1))
+
+        self.assertEqual(len(self.requests), gw2tpdb.max_consecutive_failures)
+        self.assertEqual(set(self.db.get_dead_letters()), set(range(12)))
+
+class SyncMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.db = Gw2TpDb(":memory:", metrics=self.metrics)
+        self.db._write_daily([_entry(item_id, _day(1)) for item_id in range(8)])
+        self.db._remote_daily_watermark.set(_day(3))
+
+    def test_counts_chunks_rows_and_stages(self):
+        def get_dailies_json(item_ids, start=None, end=None):
+            if 5 in item_ids:
+                return None
+            return [_entry_json(item_id, day) for item_id in item_ids for day in (2, 3)]
+
+        with mock.patch("gw2tpdb.get_dailies_json", get_dailies_json):
+            self.db.update_dailies(list(range(8)), chunk_size=8)
+
+        self.assertEqual(self.metrics.counter("chunks", outcome="succeeded", table="daily_history"), 3)
+        self.assertEqual(self.metrics.counter("chunks", outcome="failed", table="daily_history"), 4)
+        self.assertEqual(self.metrics.counter("dead_lettered", table="daily_history"), 1)
+        self.assertEqual(self.metrics.counter("rows_written", table="daily_history"), 8 + 7 * 2)
+        self.assertEqual(self.metrics.histogram("sync_chunk_seconds").count, 7)
+        self.assertEqual(self.metrics.histogram("sync_run_seconds").count, 1)
+        self.assertIn('gw2tpdb_chunks_total{outcome="failed",table="daily_history"} 4', self.metrics.to_prometheus())
+
+    def test_counts_skipped_chunks(self):
+        self.db._write_daily([_entry(item_id, _day(3)) for item_id in range(8)])
+
+        self.assertTrue(self.db.update_dailies(list(range(8)), chunk_size=4))
+
+        self.assertEqual(self.metrics.counter("chunks", outcome="skipped", table="daily_history"), 2)
+
+class ResumeSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+        self.db._write_daily([_entry(item_id, _day(1)) for item_id in range(6)])
+        self.db._remote_daily_watermark.set(_day(3))
+        self.requests = []
+
+    def _fake_get_dailies_json(self, crash_on_request=None):
+        def get_dailies_json(item_ids, start=None, end=None):
+            self.requests.append(list(item_ids))
+            if len(self.requests) == crash_on_request:
+                raise KeyboardInterrupt()
+            return [_entry_json(item_id, day) for item_id in item_ids for day in (2, 3)]
+        return get_dailies_json
+
+    def test_resumes_after_last_committed_chunk(self):
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json(crash_on_request=2)):
+            with self.assertRaises(KeyboardInterrupt):
+                self.db.update_dailies(list(range(6)), chunk_size=2)
+
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([0, 1, 2]), {0: _day(3), 1: _day(3), 2: _day(1)})
+        self.assertEqual(self.db._execute("SELECT chunk, status FROM sync_journal ORDER BY chunk"), [(0, "done"), (1, "pending"), (2, "pending")])
+
+        self.requests = []
+        with mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json()):
+            self.assertTrue(self.db.resume_sync())
+
+        self.assertEqual(self.requests, [[2, 3], [4, 5]])
+        self.assertEqual(set(self.db._most_recent_local_daily_timestamps(list(range(6))).values()), {_day(3)})
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM sync_journal")[0][0], 0)
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM sync_runs WHERE finished_at IS NULL")[0][0], 0)
+
+    def test_up_to_date_reads_start_no_run(self):
+        db = Gw2TpDb(":memory:", auto_update=True)
+        db._write_daily([_entry(1, _day(3))])
+        db._remote_daily_watermark.set(_day(3))
+        for _ in range(5):
+            db.get_dailies([1])
+
+        self.assertEqual(db._execute("SELECT COUNT(*) FROM sync_runs")[0][0], 0)
+
+    def test_prunes_old_finished_runs(self):
+        with mock.patch("gw2tpdb.kept_sync_runs", 2), mock.patch("gw2tpdb.get_dailies_json", self._fake_get_dailies_json()):
+            for day in (3, 4, 5):
+                self.db._remote_daily_watermark.set(_day(day))
+                self.db.update_dailies([0])
+
+        self.assertEqual(self.db._execute("SELECT run_id FROM sync_runs ORDER BY run_id"), [(2,), (3,)])
+
+        self.requests = []
+        self.assertTrue(self.db.resume_sync())
+        self.assertEqual(self.requests, [])
+
+class SyncItemsTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Gw2TpDb(":memory:")
+
+    def _sync(self, items):
+        with mock.patch("gw2tpdb.get_items", return_value=[ItemEntry(item_id, name) for item_id, name in items]):
+            return self.db.sync_items()
+
+    def test_writes_only_new_and_renamed_items(self):
+        self.assertFalse(self.db._items_table_populated())
+        self.assertEqual(self._sync([(1, "Glob of Ectoplasm"), (2, "Mystic Coin")]), 2)
+        self.assertTrue(self.db._items_table_populated())
+
+        self.assertEqual(self._sync([(1, "Glob of Ectoplasm"), (2, "Mystic Coins"), (3, "Amalgamated Gemstone")]), 2)
+        self.assertEqual(self.db._execute("SELECT id, name FROM items ORDER BY id"),
+                         [(1, "Glob of Ectoplasm"), (2, "Mystic Coins"), (3, "Amalgamated Gemstone")])
+
+    def test_unchanged_catalog_is_not_rewritten(self):
+        self._sync([(1, "Glob of Ectoplasm")])
+
+        with mock.patch.object(self.db, "_insert_many") as insert_many:
+            self.assertEqual(self._sync([(1, "Glob of Ectoplasm")]), 0)
+        insert_many.assert_not_called()
+
+    def test_download_failure(self):
+        with mock.patch("gw2tpdb.get_items", return_value=None):
+            self.assertIsNone(self.db.sync_items())
+            self.assertFalse(self.db.populate_items())
+
+class ReadCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ReadCache(max_entries=10)
+        self.db = Gw2TpDb(":memory:", read_cache=self.cache)
+        self.db._write_daily([_entry(1, _day(1)), _entry(2, _day(1))])
+
+    def test_repeated_reads_hit_the_cache(self):
+        self.assertEqual(len(self.db.get_daily(1)), 1)
+        with mock.patch.object(self.db, "_select_history") as select_history:
+            self.assertEqual(len(self.db.get_daily(1)), 1)
+            self.assertEqual(list(self.db.get_dailies([1])), [1])
+        select_history.assert_not_called()
+
+    def test_writes_invalidate_only_their_items(self):
+        self.db.get_dailies([1, 2])
+        self.db._write_daily([_entry(1, _day(2))])
+
+        self.assertEqual(len(self.db.get_daily(1)), 2)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(len(self.db.get_daily(2)), 1)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_modifying_returned_entries_does_not_change_the_cache(self):
+        self.db.get_daily(1)[0].sell_price_avg = -1
+        self.db.get_dailies([1])[1][0].sell_price_avg = -2
+
+        self.assertEqual(self.db.get_daily(1)[0].sell_price_avg, 100)
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_ranges_are_cached_separately(self):
+        self.db._write_daily([_entry(1, _day(2))])
+
+        self.assertEqual(len(self.db.get_daily(1, start=_day(2))), 1)
+        self.assertEqual(len(self.db.get_daily(1)), 2)
+
+class ArchiveDailiesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db = Gw2TpDb(":memory:", archive_directory=directory.name)
+        first_day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.db._write_daily([_entry(item_id, first_day + timedelta(days=day), price=100 + day)
+                              for item_id in (1, 2) for day in range(90)])
+        self.db._write_daily([_entry(3, first_day)])
+        self.expected = {item_id: self.db.get_daily(item_id) for item_id in (1, 2, 3)}
+
+    def test_reads_are_unchanged(self):
+        moved = self.db.archive_dailies(datetime(2024, 3, 15, tzinfo=timezone.utc))
+
+        self.assertEqual(moved, 2 * 60)
+        self.assertEqual(self.db._execute("SELECT COUNT(*) FROM daily_history")[0][0], 2 * 30 + 1)
+        self.assertEqual({item_id: self.db.get_daily(item_id) for item_id in (1, 2, 3)}, self.expected)
+        self.assertEqual(self.db.get_dailies([1, 3], start=datetime(2024, 1, 31), end=datetime(2024, 3, 2), columns=["sell_price_avg"])[1],
+                         [entry for entry in self.db.get_daily(1, columns=["sell_price_avg"]) if datetime(2024, 1, 31, tzinfo=timezone.utc) <= entry.utc_timestamp < datetime(2024, 3, 2, tzinfo=timezone.utc)])
+
+    def test_keeps_latest_row_in_database(self):
+        self.db.archive_dailies(datetime(2024, 6, 1, tzinfo=timezone.utc))
+
+        self.assertEqual(self.db._most_recent_local_daily_timestamps([1, 3]), {1: datetime(2024, 3, 30, tzinfo=timezone.utc), 3: datetime(2024, 1, 1, tzinfo=timezone.utc)})
+        self.assertEqual(self.db.get_daily(1), self.expected[1])
+
+    def test_summaries_are_unchanged(self):
+        summaries = self.db.get_summaries()
+        self.db.archive_dailies(datetime(2024, 6, 15, tzinfo=timezone.utc))
+        self.db.rebuild_summaries()
+
+        self.assertEqual(self.db.get_summaries(), summaries)
+
+    def test_archiving_again_merges_partitions(self):
+        self.db.archive_dailies(datetime(2024, 2, 1, tzinfo=timezone.utc))
+        self.db._write_daily([_entry(4, datetime(2024, month, 1, tzinfo=timezone.utc)) for month in (1, 3)])
+        self.db.archive_dailies(datetime(2024, 2, 1, tzinfo=timezone.utc))
+
+        self.assertEqual(self.db._execute("SELECT row_count FROM archive_partitions"), [(2 * 31 + 1,)])
+        self.assertEqual(len(self.db.get_daily(4)), 2)
+        self.assertEqual(self.db.get_daily(1), self.expected[1])
+
+class ArchiveHourliesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db = Gw2TpDb(":memory:", archive_directory=directory.name)
+        first_hour = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.db._write_history_rows("hourly_history", [history_entry_to_tuple(_entry(item_id, first_hour + timedelta(hours=6 * quarter), price=100 + quarter))
+                                                       for item_id in (1, 2) for quarter in range(4 * 90)])
+        self.expected = self.db.get_hourlies([1, 2])
+
+    def test_reads_are_unchanged(self):
+        moved = self.db.archive_hourlies(datetime(2024, 3, 15, tzinfo=timezone.utc))
+
+        self.assertEqual(moved, 2 * 4 * 60)
+        self.assertEqual(self.db._execute("SELECT DISTINCT table_name FROM archive_partitions"), [("hourly_history",)])
+        self.assertEqual(self.db.get_hourlies([1, 2]), self.expected)
+        self.assertEqual(self.db.get_hourly(2, start=datetime(2024, 1, 31), end=datetime(2024, 2, 2)),
+                         [entry for entry in self.expected[2] if datetime(2024, 1, 31, tzinfo=timezone.utc) <= entry.utc_timestamp < datetime(2024, 2, 2, tzinfo=timezone.utc)])
+
+    def test_archived_rows_are_merged_lazily(self):
+        # One block per item, so each monthly partition holds two blocks.
+        with mock.patch("gw2tpdb.archive.block_rows", 1):
+            self.db.archive_hourlies(datetime(2024, 3, 15, tzinfo=timezone.utc))
+
+        with mock.patch("gw2tpdb.archive._decode_block", wraps=archive._decode_block) as decode_block:
+            rows = archive.iter_archived_rows(self.db.conn, self.db._archive_directory, "hourly_history", [1, 2], None, None, list(history_fields))
+            self.assertEqual(next(rows)[-1], int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()))
+
+        # Only item 1's block of each monthly partition, not item 2's.
+        self.assertEqual(decode_block.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main ()
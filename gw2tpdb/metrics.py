@@ -0,0 +1,196 @@
+"""Counters, histograms and stage timings for sync runs.
+
+`Metrics` collects labelled counters and histograms. `Metrics.stage` times
+a named stage (request, parse, convert, write, commit, sync_chunk, ...)
+into a `<stage>_seconds` histogram and runs the optional stage hook around
+it, e.g. a `StageProfiler`. Read the results with `Metrics.report` or
+`Metrics.to_prometheus`."""
+
+import time
+import bisect
+import pstats
+import cProfile
+import threading
+import contextlib
+
+from typing import Callable, ContextManager, Iterable, Iterator, Optional
+
+# Upper bounds in seconds, from a fast SQLite write to a slow retried request.
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+report_quantiles = (0.5, 0.95, 0.99)
+
+StageHook = Callable[[str], ContextManager]
+
+class Histogram():
+    """Counts of observed values per bucket, with their count and sum."""
+
+    def __init__(self, buckets: Iterable[float] = default_buckets):
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket plus one for values above the largest bound.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the upper bound of the bucket holding quantile Q, or None without observations.
+
+        Values above the largest bucket report infinity."""
+
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return float("inf")
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+
+def _format_key(key: tuple, extra_labels: tuple = ()) -> str:
+    name, labels = key
+    labels = labels + extra_labels
+    if len(labels) == 0:
+        return name
+    return name + "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}"
+
+class Metrics():
+    """Thread-safe registry of labelled counters and histograms.
+
+    Pass stage_hook, a callable taking a stage name and returning a context
+    manager, to run code such as a profiler or tracing span around every
+    `stage`."""
+
+    def __init__(self, buckets: Iterable[float] = default_buckets, stage_hook: Optional[StageHook] = None):
+        self.buckets = tuple(buckets)
+        self.stage_hook = stage_hook
+        self._counters: dict[tuple, float] = {}
+        self._histograms: dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the body into the `<name>_seconds` histogram, inside the stage hook if one is set."""
+
+        with self.stage_hook(name) if self.stage_hook is not None else contextlib.nullcontext():
+            started_at = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe(f"{name}_seconds", time.perf_counter() - started_at)
+
+    def counter(self, name: str, **labels) -> float:
+        """Return the value of a counter, 0 when it was never incremented."""
+
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(_key(name, labels))
+
+    def report(self) -> dict:
+        """Return every counter and a summary of every histogram, keyed by `name{label="value"}`."""
+
+        with self._lock:
+            counters = {_format_key(key): value for key, value in sorted(self._counters.items())}
+            histograms = {}
+            for key, histogram in sorted(self._histograms.items()):
+                summary = {"count": histogram.count, "sum": histogram.sum, "mean": histogram.sum / histogram.count}
+                for q in report_quantiles:
+                    summary[f"p{round(q * 100)}"] = histogram.quantile(q)
+                histograms[_format_key(key)] = summary
+
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self, prefix: str = "gw2tpdb") -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+
+        lines = []
+        with self._lock:
+            names = sorted({key[0] for key in self._counters})
+            for name in names:
+                metric_name = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric_name} counter")
+                for key, value in sorted(self._counters.items()):
+                    if key[0] == name:
+                        lines.append(f"{_format_key((metric_name, key[1]))} {value:g}")
+
+            names = sorted({key[0] for key in self._histograms})
+            for name in names:
+                metric_name = f"{prefix}_{name}"
+                lines.append(f"# TYPE {metric_name} histogram")
+                for key, histogram in sorted(self._histograms.items()):
+                    if key[0] != name:
+                        continue
+                    cumulative_count = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative_count += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{_format_key((f'{metric_name}_bucket', key[1]), (('le', le),))} {cumulative_count}")
+                    lines.append(f"{_format_key((f'{metric_name}_sum', key[1]))} {histogram.sum:g}")
+                    lines.append(f"{_format_key((f'{metric_name}_count', key[1]))} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+class StageProfiler():
+    """Stage hook that runs cProfile while the selected stages run.
+
+    Only profiles the thread that created it; nested stages are profiled
+    once. Pass stages to profile only those, e.g. {"write", "commit"}.
+
+        profiler = StageProfiler({"sync_run"})
+        metrics.stage_hook = profiler
+        ...
+        profiler.stats().print_stats(20)"""
+
+    def __init__(self, stages: Optional[Iterable[str]] = None):
+        self.stages = None if stages is None else set(stages)
+        self.profile = cProfile.Profile()
+        self._thread_id = threading.get_ident()
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def __call__(self, stage: str) -> Iterator[None]:
+        if (self.stages is not None and stage not in self.stages) or threading.get_ident() != self._thread_id:
+            yield
+            return
+
+        self._depth += 1
+        if self._depth == 1:
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.profile.disable()
+
+    def stats(self, sort_by: str = "cumulative") -> pstats.Stats:
+        return pstats.Stats(self.profile).sort_stats(sort_by)
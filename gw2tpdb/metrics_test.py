@@ -0,0 +1,65 @@
+import unittest
+
+from gw2tpdb.metrics import Histogram, Metrics, StageProfiler
+
+class HistogramTest(unittest.TestCase):
+    def test_quantiles_report_bucket_bounds(self):
+        histogram = Histogram(buckets=(0.1, 1, 10))
+        for value in (0.05, 0.5, 0.5, 5, 50):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 1)
+        self.assertEqual(histogram.quantile(0.99), float("inf"))
+        self.assertIsNone(Histogram().quantile(0.5))
+
+class MetricsTest(unittest.TestCase):
+    def test_report(self):
+        metrics = Metrics(buckets=(1, 10))
+        metrics.increment("requests", status=200)
+        metrics.increment("requests", status=200)
+        metrics.increment("downloaded_bytes", 512)
+        metrics.observe("request_seconds", 2)
+
+        report = metrics.report()
+
+        self.assertEqual(report["counters"], {"downloaded_bytes": 512, 'requests{status="200"}': 2})
+        self.assertEqual(report["histograms"]["request_seconds"], {"count": 1, "sum": 2, "mean": 2, "p50": 10, "p95": 10, "p99": 10})
+
+    def test_prometheus_text(self):
+        metrics = Metrics(buckets=(1, 10))
+        metrics.increment("rows_written", 3, table="daily_history")
+        metrics.observe("commit_seconds", 0.5)
+
+        self.assertEqual(metrics.to_prometheus().splitlines(), [
+            "# TYPE gw2tpdb_rows_written_total counter",
+            'gw2tpdb_rows_written_total{table="daily_history"} 3',
+            "# TYPE gw2tpdb_commit_seconds histogram",
+            'gw2tpdb_commit_seconds_bucket{le="1"} 1',
+            'gw2tpdb_commit_seconds_bucket{le="10"} 1',
+            'gw2tpdb_commit_seconds_bucket{le="+Inf"} 1',
+            "gw2tpdb_commit_seconds_sum 0.5",
+            "gw2tpdb_commit_seconds_count 1",
+        ])
+
+    def test_stage_runs_inside_hook_and_records_failures(self):
+        entered = []
+        profiler = StageProfiler({"write"})
+
+        def hook(stage):
+            entered.append(stage)
+            return profiler(stage)
+
+        metrics = Metrics(stage_hook=hook)
+        with metrics.stage("write"):
+            sum(range(1000))
+        with self.assertRaises(ValueError), metrics.stage("parse"):
+            raise ValueError()
+
+        self.assertEqual(entered, ["write", "parse"])
+        self.assertEqual(metrics.histogram("write_seconds").count, 1)
+        self.assertEqual(metrics.histogram("parse_seconds").count, 1)
+        self.assertGreater(profiler.stats().total_calls, 0)
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+from typing import Any, Awaitable, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+default_queue_size = 4
+
+# Marks the end of a stage's output.
+_done = object()
+
+async def run_pipeline(jobs: Iterable[T],
+                       fetch: Callable[[T], Awaitable[Optional[Any]]],
+                       parse: Callable[[T, Any], R],
+                       write: Callable[[T, R], None],
+                       queue_size: int = default_queue_size,
+                       fetch_concurrency: int = 1,
+                       on_failure: Optional[Callable[[T], None]] = None) -> bool:
+    """Run fetch, parse and write for each job as overlapping stages.
+
+    - fetch: coroutine returning a response for the job, or None on failure.
+    - parse: blocking conversion of the response; runs in a worker thread.
+    - write: blocking write of the parsed result; runs on the event loop's
+      thread so it can use a SQLite connection created there.
+
+    Stages are connected by bounded queues of QUEUE_SIZE so a slow writer
+    throttles fetching instead of buffering every response in memory.
+    on_failure, when given, is called with each job that failed to fetch or
+    parse once the pipeline has drained.
+
+    An exception raised by write (or fetch) cancels the other stages and
+    is propagated.
+
+    Return false when any job failed to fetch or parse."""
+
+    job_iterator = iter(jobs)
+    fetched = asyncio.Queue(maxsize=queue_size)
+    parsed = asyncio.Queue(maxsize=queue_size)
+    failures = []
+    running_fetchers = fetch_concurrency
+
+    async def fetch_stage():
+        nonlocal running_fetchers
+        # Fetchers share one job iterator, so each job is fetched exactly once.
+        for job in job_iterator:
+            response = await fetch(job)
+            if response is None:
+                failures.append(job)
+                continue
+            await fetched.put((job, response))
+        running_fetchers -= 1
+        if running_fetchers == 0:
+            await fetched.put(_done)
+
+    async def parse_stage():
+        while True:
+            item = await fetched.get()
+            if item is _done:
+                break
+            job, response = item
+            try:
+                result = await asyncio.to_thread(parse, job, response)
+            except Exception as e:
+                logger.error("Failed to parse a response: %s", e)
+                failures.append(job)
+                continue
+            await parsed.put((job, result))
+        await parsed.put(_done)
+
+    async def write_stage():
+        while True:
+            item = await parsed.get()
+            if item is _done:
+                break
+            job, result = item
+            write(job, result)
+
+    try:
+        # The task group cancels the other stages when one raises, instead of
+        # leaving them fetching or waiting on their queues forever.
+        async with asyncio.TaskGroup() as stages:
+            for _ in range(fetch_concurrency):
+                stages.create_task(fetch_stage())
+            stages.create_task(parse_stage())
+            stages.create_task(write_stage())
+    except ExceptionGroup as e:
+        raise e.exceptions[0]
+
+    if on_failure is not None:
+        for job in failures:
+            on_failure(job)
+
+    if len(failures) > 0:
+        logger.error("Pipeline failed for %s jobs", len(failures))
+        return False
+
+    return True
@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+
+from gw2tpdb.pipeline import run_pipeline
+
+class RunPipelineTest(unittest.TestCase):
+    def test_writes_every_job_in_order(self):
+        written = []
+
+        async def fetch(job):
+            return job * 10
+
+        result = asyncio.run(run_pipeline(range(5), fetch, lambda job, response: response + 1, lambda job, result: written.append(result)))
+
+        self.assertTrue(result)
+        self.assertEqual(written, [1, 11, 21, 31, 41])
+
+    def test_reports_failed_jobs(self):
+        failed = []
+
+        async def fetch(job):
+            return None if job == 2 else job
+
+        def parse(job, response):
+            if job == 3:
+                raise ValueError("bad body")
+            return response
+
+        result = asyncio.run(run_pipeline(range(5), fetch, parse, lambda job, result: None, on_failure=failed.append))
+
+        self.assertFalse(result)
+        self.assertEqual(sorted(failed), [2, 3])
+
+    def test_write_error_cancels_other_stages(self):
+        async def fetch(job):
+            return job
+
+        def write(job, result):
+            raise RuntimeError("disk full")
+
+        async def run():
+            with self.assertRaises(RuntimeError):
+                await run_pipeline(range(1000), fetch, lambda job, response: response, write, queue_size=1)
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+        self.assertEqual(asyncio.run(run()), [])
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -0,0 +1,91 @@
+import sys
+import logging
+import threading
+
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+default_max_entries = 1024
+
+def estimate_bytes(entries: List[Any]) -> int:
+    """Estimate the memory held by a list of same-shaped objects from its first element."""
+
+    if len(entries) == 0:
+        return sys.getsizeof(entries)
+    first = entries[0]
+    fields = getattr(first, "__slots__", None) or getattr(first, "__dict__", {})
+    entry_bytes = sys.getsizeof(first) + sum(sys.getsizeof(getattr(first, name)) for name in fields)
+
+    return sys.getsizeof(entries) + len(entries) * entry_bytes
+
+class ReadCache():
+    """Bounded LRU cache of query results, invalidated by item ID.
+
+    Bounded by entry count, estimated bytes (see `estimate_bytes`), or both;
+    the least recently used entries are dropped first. Values are stored
+    and returned as is; `Gw2TpDb` copies the entries it hands out."""
+
+    def __init__(self, max_entries: Optional[int] = default_max_entries, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._keys_by_item_id: dict[int, set] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value cached under KEY, or None."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def put(self, key: Hashable, item_id: int, value: Any, size: int) -> None:
+        """Cache VALUE under KEY as data of ITEM_ID taking SIZE bytes."""
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, item_id, size)
+            self._keys_by_item_id.setdefault(item_id, set()).add(key)
+            self._bytes += size
+            while len(self._entries) > 0 and ((self.max_entries is not None and len(self._entries) > self.max_entries)
+                                              or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, item_ids: Iterable[int]) -> None:
+        """Drop every entry of the given item IDs."""
+
+        with self._lock:
+            for item_id in set(item_ids):
+                for key in list(self._keys_by_item_id.get(item_id, ())):
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_item_id.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, item_id, size = entry
+        self._bytes -= size
+        keys = self._keys_by_item_id[item_id]
+        keys.discard(key)
+        if len(keys) == 0:
+            del self._keys_by_item_id[item_id]
@@ -0,0 +1,37 @@
+import unittest
+
+from gw2tpdb.read_cache import ReadCache
+
+class ReadCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used_entries(self):
+        cache = ReadCache(max_entries=2)
+        cache.put("a", 1, "A", 1)
+        cache.put("b", 2, "B", 1)
+        cache.get("a")
+        cache.put("c", 3, "C", 1)
+
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "C")
+
+    def test_bounded_by_bytes(self):
+        cache = ReadCache(max_entries=None, max_bytes=100)
+        cache.put("a", 1, "A", 60)
+        cache.put("b", 2, "B", 60)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidate_by_item_id(self):
+        cache = ReadCache()
+        cache.put(("daily_history", 1, None), 1, "all", 1)
+        cache.put(("daily_history", 1, 0), 1, "recent", 1)
+        cache.put(("daily_history", 2, None), 2, "other", 1)
+
+        cache.invalidate([1])
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(("daily_history", 2, None)), "other")
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -0,0 +1,143 @@
+import math
+import sqlite3
+import logging
+
+from dataclasses import dataclass
+from typing import List, Optional
+from gw2tpdb.api.history import history_fields
+
+logger = logging.getLogger(__name__)
+
+seconds_per_day = 86400
+
+# Relative difference below which a computed and a downloaded value match.
+default_tolerance = 0.01
+
+# Item IDs bound per validation query, under SQLite's bound-variable limit.
+max_validate_ids = 900
+
+@dataclass
+class RollupMismatch():
+    """A daily value computed from hourly data that differs from the downloaded one."""
+
+    id: int
+    utc_timestamp: int
+    column: str
+    computed: float
+    downloaded: float
+
+def _sqrt(value: Optional[float]) -> Optional[float]:
+    if value is None:
+        return None
+
+    # Pooled variance can come out slightly negative from rounding.
+    return math.sqrt(max(value, 0))
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    """Register the SQL functions used by rollup queries on CONN."""
+
+    conn.create_function("rollup_sqrt", 1, _sqrt, deterministic=True)
+
+def _weighted_mean(name: str) -> str:
+    """Return SQL for the count-weighted mean of hourly column NAME."""
+
+    return f"COALESCE(SUM(h.{name} * 1.0 * h.count) / NULLIF(SUM(h.count), 0), AVG(h.{name}))"
+
+def _aggregate(name: str) -> str:
+    """Return SQL deriving daily column NAME from hourly rows aliased h."""
+
+    if name == "id":
+        return "h.id"
+    if name == "utc_timestamp":
+        return f"CAST(h.utc_timestamp AS INTEGER) - CAST(h.utc_timestamp AS INTEGER) % {seconds_per_day}"
+    if name == "count" or name.endswith(("_delisted", "_listed", "_sold", "_value")):
+        return f"SUM(h.{name})"
+    if name.endswith("_min"):
+        return f"MIN(h.{name})"
+    if name.endswith("_max"):
+        return f"MAX(h.{name})"
+    if name.endswith("_avg"):
+        return f"ROUND({_weighted_mean(name)})"
+    if name.endswith("_stdev"):
+        # Pooled standard deviation: E[x^2] over all samples minus the squared overall mean.
+        avg = name[:-len("_stdev")] + "_avg"
+        second_moment = f"SUM(h.count * (h.{name} * h.{name} + h.{avg} * 1.0 * h.{avg})) / NULLIF(SUM(h.count), 0)"
+        return f"COALESCE(rollup_sqrt({second_moment} - {_weighted_mean(avg)} * {_weighted_mean(avg)}), 0)"
+
+    raise ValueError(f"No rollup defined for history column '{name}'")
+
+def _select_daily_from_hourly(where: str) -> str:
+    """Return SQL selecting daily_history-shaped rows from hourly rows matching WHERE."""
+
+    day = _aggregate("utc_timestamp")
+    return f"SELECT {', '.join(f'{_aggregate(name)} AS {name}' for name in history_fields)} FROM hourly_history h WHERE {where} GROUP BY h.id, {day}"
+
+def rollup(conn: sqlite3.Connection, complete_before: int) -> int:
+    """Recompute daily_history rows for pending days that end at or before complete_before.
+
+    Days that are still filling up stay pending so they are recomputed once
+    their last hour arrives. Does not commit. Return the number of days
+    recomputed."""
+
+    register_functions(conn)
+    cursor = conn.cursor()
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_batch (id INTEGER NOT NULL, utc_timestamp INTEGER NOT NULL, PRIMARY KEY (id, utc_timestamp))")
+    cursor.execute("DELETE FROM rollup_batch")
+    cursor.execute("INSERT INTO rollup_batch SELECT id, utc_timestamp FROM rollup_pending WHERE utc_timestamp + ? <= ?", (seconds_per_day, complete_before))
+    day_count = cursor.execute("SELECT COUNT(*) FROM rollup_batch").fetchone()[0]
+    if day_count == 0:
+        return 0
+
+    where = f"EXISTS (SELECT 1 FROM rollup_batch b WHERE b.id = h.id AND h.utc_timestamp >= b.utc_timestamp AND h.utc_timestamp < b.utc_timestamp + {seconds_per_day})"
+    updates = ", ".join(f"{name} = excluded.{name}" for name in history_fields if name not in ("id", "utc_timestamp"))
+    cursor.execute(f"INSERT INTO daily_history {_select_daily_from_hourly(where)} ON CONFLICT(id, utc_timestamp) DO UPDATE SET {updates}")
+    cursor.execute("DELETE FROM rollup_pending WHERE (id, utc_timestamp) IN (SELECT id, utc_timestamp FROM rollup_batch)")
+    logger.debug("Rolled up %s days of hourly history", day_count)
+
+    return day_count
+
+def batch_item_ids(conn: sqlite3.Connection) -> List[int]:
+    """Return the IDs of items recomputed by the last `rollup` on CONN."""
+
+    return [row[0] for row in conn.cursor().execute("SELECT DISTINCT id FROM temp.rollup_batch")]
+
+def validate(conn: sqlite3.Connection, item_ids: Optional[List[int]] = None, start: Optional[int] = None, end: Optional[int] = None, tolerance: float = default_tolerance) -> List[RollupMismatch]:
+    """Compare daily rows computed from hourly data with the daily rows in daily_history.
+
+    Only days present in both are compared, optionally limited to item_ids
+    and to days with start <= utc_timestamp < end (epoch seconds). Run it
+    before `rollup` overwrites downloaded days. Return every value whose
+    relative difference exceeds tolerance."""
+
+    register_functions(conn)
+    if item_ids is not None and len(item_ids) > max_validate_ids:
+        return [mismatch
+                for i in range(0, len(item_ids), max_validate_ids)
+                for mismatch in validate(conn, item_ids[i:i + max_validate_ids], start, end, tolerance)]
+
+    conditions = ["1"]
+    parameters = []
+    if item_ids is not None:
+        conditions.append(f"h.id IN ({','.join('?' * len(item_ids))})")
+        parameters += list(item_ids)
+    if start is not None:
+        conditions.append("h.utc_timestamp >= ?")
+        parameters.append(start)
+    if end is not None:
+        conditions.append("h.utc_timestamp < ?")
+        parameters.append(end)
+
+    computed_columns = ", ".join(f"c.{name}" for name in history_fields)
+    downloaded_columns = ", ".join(f"d.{name}" for name in history_fields)
+    rows = conn.cursor().execute(f"SELECT {computed_columns}, {downloaded_columns} FROM ({_select_daily_from_hourly(' AND '.join(conditions))}) c JOIN daily_history d ON d.id = c.id AND d.utc_timestamp = c.utc_timestamp ORDER BY c.id, c.utc_timestamp", parameters)
+
+    mismatches = []
+    field_count = len(history_fields)
+    for row in rows:
+        for i, name in enumerate(history_fields[1:-1], start=1):
+            computed = row[i] or 0
+            downloaded = row[field_count + i] or 0
+            if abs(computed - downloaded) > tolerance * max(abs(computed), abs(downloaded), 1):
+                mismatches.append(RollupMismatch(row[0], row[field_count - 1], name, computed, downloaded))
+
+    return mismatches
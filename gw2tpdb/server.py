@@ -0,0 +1,261 @@
+"""Read-only JSON query server over a gw2tpdb database.
+
+Lets several tools share one database: lookups are answered from a fixed
+pool of read-only connections while a separate process syncs the database.
+Run that writer with `db.IngestionProfile()` so the database is in WAL
+mode; then reads and the sync never block each other. Responses are cached
+until the writer commits.
+
+Endpoints, with comma-separated item IDs and ISO-8601 start/end (UTC when
+naive):
+    GET /daily?id=19721,19976&start=2024-01-01&end=2024-02-01&columns=sell_price_avg
+    GET /hourly?id=19721&start=2024-01-01
+    GET /summaries[?id=19721,19976]
+
+Responses map item IDs to their entries, with utc_timestamp in epoch seconds.
+
+Usage: python -m gw2tpdb.server database_path [port]"""
+
+import sys
+import json
+import queue
+import logging
+import threading
+import contextlib
+
+from collections import OrderedDict
+
+from dataclasses import fields
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Hashable, Iterator, List, Optional
+from urllib.parse import urlsplit, parse_qs
+from gw2tpdb import Gw2TpDb
+from gw2tpdb.db import db
+from gw2tpdb.api.history import history_fields
+from gw2tpdb.api.summary import ItemSummary
+
+logger = logging.getLogger(__name__)
+
+default_port = 8732
+default_pool_size = 4
+default_cache_bytes = 64 * 1024 * 1024
+# Bounds the work a single request can ask of a pooled connection.
+max_ids_per_request = 5000
+
+def _timestamp(value: datetime) -> int:
+    return int(value.timestamp())
+
+def _history_json(entries: dict, columns: Optional[List[str]]) -> dict:
+    names = history_fields if columns is None else [name for name in history_fields if name in ("id", "utc_timestamp") or name in columns]
+    return {item_id: [{name: _timestamp(entry.utc_timestamp) if name == "utc_timestamp" else getattr(entry, name) for name in names}
+                      for entry in item_entries]
+            for item_id, item_entries in entries.items()}
+
+def _summary_json(summaries: dict[int, ItemSummary]) -> dict:
+    names = [field.name for field in fields(ItemSummary)]
+    return {item_id: {name: _timestamp(summary.utc_timestamp) if name == "utc_timestamp" else getattr(summary, name) for name in names}
+            for item_id, summary in summaries.items()}
+
+def _parse_ids(query: dict, required: bool) -> Optional[List[int]]:
+    values = [value for values in query.get("id", []) for value in values.split(",") if value != ""]
+    if len(values) == 0:
+        if required:
+            raise ValueError("id is required")
+        return None
+    if len(values) > max_ids_per_request:
+        raise ValueError(f"At most {max_ids_per_request} IDs per request")
+
+    return [int(value) for value in values]
+
+def _parse_datetime(query: dict, name: str) -> Optional[datetime]:
+    values = query.get(name)
+    if values is None:
+        return None
+    return datetime.fromisoformat(values[-1])
+
+def _parse_columns(query: dict) -> Optional[List[str]]:
+    values = query.get("columns")
+    if values is None:
+        return None
+    return [column for value in values for column in value.split(",") if column != ""]
+
+class _ResponseCache():
+    """Thread-safe LRU of response bodies bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bodies: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._bodies.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous_body = self._bodies.pop(key, None)
+            if previous_body is not None:
+                self._bytes -= len(previous_body)
+            self._bodies[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted_body = self._bodies.popitem(last=False)
+                self._bytes -= len(evicted_body)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bodies.clear()
+            self._bytes = 0
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path not in self.server.routes:
+            self._send(404, json.dumps({"error": f"Unknown path '{parts.path}'"}).encode())
+            return
+        try:
+            body = self.server.query(parts.path, parse_qs(parts.query))
+        except ValueError as e:
+            self._send(400, json.dumps({"error": str(e)}).encode())
+            return
+        except Exception as e:
+            logger.exception("Failed to answer '%s'", self.path)
+            self._send(500, json.dumps({"error": str(e)}).encode())
+            return
+        self._send(200, body)
+
+    def _send(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+class QueryServer(ThreadingHTTPServer):
+    """HTTP server answering read-only queries from a pool of connections.
+
+    Each request borrows one of POOL_SIZE read-only `Gw2TpDb` handles, and
+    waits for one when all are busy. Responses are cached by request in up
+    to cache_bytes; the cache is dropped once per commit by another
+    connection, as seen by PRAGMA data_version on one extra read-only
+    connection shared by all requests. Use as a context manager to serve
+    from a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, database_path: str, port: int = default_port, pool_size: int = default_pool_size, cache_bytes: int = default_cache_bytes, host: str = "127.0.0.1"):
+        self.cache = _ResponseCache(cache_bytes)
+        self._idle = queue.Queue()
+        self._generation = 0
+        self._lock = threading.Lock()
+        for _ in range(pool_size):
+            self._idle.put(Gw2TpDb(database_path, ingestion_profile=db.IngestionProfile(), read_only=True))
+        # data_version counts commits per connection, so one connection watches for all of them.
+        self._watcher = Gw2TpDb(database_path, ingestion_profile=db.IngestionProfile(), read_only=True)
+        self._data_version = self._watcher._execute("PRAGMA data_version")[0][0]
+        self.routes = {
+            "/daily": self._daily,
+            "/hourly": self._hourly,
+            "/summaries": self._summaries,
+        }
+        super().__init__((host, port), _QueryHandler)
+
+    def query(self, path: str, query: dict) -> bytes:
+        """Return the JSON response body for PATH with parsed QUERY parameters.
+
+        Raises KeyError for unknown paths and ValueError for invalid parameters."""
+
+        route = self.routes[path]
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        with self._borrow() as tpdb:
+            generation = self._refresh_generation()
+            body_opt = self.cache.get((generation, key))
+            if body_opt is not None:
+                return body_opt
+            body = json.dumps(route(tpdb, query)).encode()
+        self.cache.put((generation, key), body)
+
+        return body
+
+    def _daily(self, tpdb: Gw2TpDb, query: dict) -> dict:
+        columns = _parse_columns(query)
+        return _history_json(tpdb.get_dailies(_parse_ids(query, required=True), _parse_datetime(query, "start"), _parse_datetime(query, "end"), columns), columns)
+
+    def _hourly(self, tpdb: Gw2TpDb, query: dict) -> dict:
+        columns = _parse_columns(query)
+        return _history_json(tpdb.get_hourlies(_parse_ids(query, required=True), _parse_datetime(query, "start"), _parse_datetime(query, "end"), columns), columns)
+
+    def _summaries(self, tpdb: Gw2TpDb, query: dict) -> dict:
+        return _summary_json(tpdb.get_summaries(_parse_ids(query, required=False)))
+
+    @contextlib.contextmanager
+    def _borrow(self) -> Iterator[Gw2TpDb]:
+        tpdb = self._idle.get()
+        try:
+            yield tpdb
+        finally:
+            self._idle.put(tpdb)
+
+    def _refresh_generation(self) -> int:
+        """Return the cache generation, starting a new one if the database was committed to since the last check.
+
+        Called before each read, and pooled connections read the latest
+        commit, so a response read before a commit is cached under an older
+        generation and can never be served after it."""
+
+        with self._lock:
+            data_version = self._watcher._execute("PRAGMA data_version")[0][0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._generation += 1
+                self.cache.clear()
+                logger.debug("Database changed; starting response cache generation %s", self._generation)
+            return self._generation
+
+    def server_close(self) -> None:
+        super().server_close()
+        while not self._idle.empty():
+            self._idle.get().close()
+        self._watcher.close()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+def main(database_path: str, port: int = default_port) -> None:
+    server = QueryServer(database_path, port)
+    with server._borrow() as tpdb:
+        journal_mode = tpdb._execute("PRAGMA journal_mode")[0][0]
+    if journal_mode != "wal":
+        logger.warning("%s is in %s journal mode; syncs will block reads until it is opened with db.IngestionProfile() (WAL)", database_path, journal_mode)
+    print(f"Serving {database_path} on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        raise SystemExit(__doc__)
+    main(sys.argv[1], *map(int, sys.argv[2:]))
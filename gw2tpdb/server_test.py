@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import requests
+
+from datetime import datetime, timezone
+from gw2tpdb import Gw2TpDb
+from gw2tpdb.db import db
+from gw2tpdb.server import QueryServer, _ResponseCache
+from gw2tpdb.api.history import history_fields
+
+def _row(item_id: int, day: int, price: int = 100) -> tuple:
+    values = [price] * (len(history_fields) - 2)
+    return (item_id, *values, int(datetime(2024, 1, day, tzinfo=timezone.utc).timestamp()))
+
+class ReadOnlyGw2TpDbTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "tp.sqlite")
+        with Gw2TpDb(self.path) as writer:
+            writer._write_daily_rows([_row(1, 1)])
+
+    def test_reads_without_writing(self):
+        with Gw2TpDb(self.path, read_only=True) as reader:
+            self.assertEqual(len(reader.get_daily(1)), 1)
+            with self.assertRaises(sqlite3.OperationalError):
+                reader._write_daily_rows([_row(1, 2)])
+
+    def test_close_is_idempotent(self):
+        reader = Gw2TpDb(self.path, read_only=True)
+        reader.close()
+        reader.close()
+
+class QueryServerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "tp.sqlite")
+        self.writer = Gw2TpDb(path, ingestion_profile=db.IngestionProfile())
+        self.addCleanup(self.writer.close)
+        self.writer._write_daily_rows([_row(1, 1), _row(1, 2), _row(2, 1)])
+
+        server = QueryServer(path, port=0, pool_size=2)
+        server.__enter__()
+        self.addCleanup(server.__exit__)
+        self.server = server
+        self.origin = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def _get(self, path: str) -> requests.Response:
+        return requests.get(f"{self.origin}{path}")
+
+    def test_daily_batches_ids(self):
+        response = self._get("/daily?id=1,2,3&start=2024-01-02&columns=sell_price_avg")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"1": [{"id": 1, "sell_price_avg": 100, "utc_timestamp": _row(1, 2)[-1]}]})
+
+    def test_summaries(self):
+        summaries = self._get("/summaries").json()
+
+        self.assertEqual(list(summaries), ["1", "2"])
+        self.assertEqual(summaries["1"]["utc_timestamp"], _row(1, 2)[-1])
+
+    def test_cached_until_writer_commits(self):
+        self.assertEqual(len(self._get("/daily?id=1").json()["1"]), 2)
+        self.assertEqual(len(self._get("/daily?id=1").json()["1"]), 2)
+        self.assertEqual(self.server.cache.hits, 1)
+
+        self.writer._write_daily_rows([_row(1, 3)])
+
+        self.assertEqual(len(self._get("/daily?id=1").json()["1"]), 3)
+
+    def test_each_commit_clears_the_cache_once(self):
+        self.writer._write_daily_rows([_row(1, 3)])
+        # Consecutive requests borrow different pooled connections.
+        for _ in range(3):
+            self._get("/daily?id=1")
+
+        self.assertEqual(self.server.cache.hits, 2)
+
+    def test_errors(self):
+        self.assertEqual(self._get("/daily").status_code, 400)
+        self.assertEqual(self._get("/daily?id=x").status_code, 400)
+        self.assertEqual(self._get("/daily?id=1&columns=bogus").status_code, 400)
+        self.assertEqual(self._get("/unknown").status_code, 404)
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used_by_bytes(self):
+        cache = _ResponseCache(max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        cache.get("a")
+        cache.put("c", b"1234")
+
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (b"1234", None, b"1234"))
+
+    def test_skips_bodies_larger_than_the_cache(self):
+        cache = _ResponseCache(max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"x" * 11)
+
+        self.assertEqual((cache.get("a"), cache.get("b")), (b"1234", None))
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -0,0 +1,313 @@
+"""Columnar snapshots of a gw2tpdb database for seeding new replicas.
+
+A snapshot is a directory with a manifest.json and, per table, one NumPy
+`.npy` file per column (written without NumPy). Integer columns are int64,
+REAL columns float64, and TEXT columns an int64 offsets array plus the
+UTF-8 bytes they index. A column with NULLs also has a uint8 `.null.npy`
+mask. Rows are written in primary key order so importing appends to the
+table's B-trees instead of splitting pages all over them.
+
+Usage: python -m gw2tpdb.snapshot export|import database_path snapshot_directory"""
+
+import os
+import ast
+import sys
+import json
+import mmap
+import sqlite3
+import logging
+
+from array import array
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+snapshot_format = 1
+default_tables = ("items", "daily_history", "hourly_history")
+manifest_name = "manifest.json"
+chunk_rows = 50000
+
+npy_magic = b"\x93NUMPY\x01\x00"
+# Headers are padded to a fixed size so the row count can be filled in after streaming.
+npy_header_bytes = 128
+_descrs = {"q": "<i8", "d": "<f8", "B": "|u1"}
+_typecodes = {descr: typecode for typecode, descr in _descrs.items()}
+
+def _npy_header(typecode: str, length: int) -> bytes:
+    header = repr({"descr": _descrs[typecode], "fortran_order": False, "shape": (length,)}).encode("latin1")
+    padding = npy_header_bytes - len(npy_magic) - 2 - len(header) - 1
+    return npy_magic + (npy_header_bytes - len(npy_magic) - 2).to_bytes(2, "little") + header + b" " * padding + b"\n"
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder != "little" and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+class _NpyWriter():
+    """Streams a one-dimensional .npy file."""
+
+    def __init__(self, path: str, typecode: str):
+        self.path = path
+        self.typecode = typecode
+        self.length = 0
+        self._file = open(path, "wb")
+        self._file.write(_npy_header(typecode, 0))
+
+    def append(self, values: array) -> None:
+        self._file.write(_to_bytes(values))
+        self.length += len(values)
+
+    def close(self) -> None:
+        self._file.seek(0)
+        self._file.write(_npy_header(self.typecode, self.length))
+        self._file.close()
+
+    def retype(self, typecode: str, convert) -> None:
+        """Rewrite the values written so far as TYPECODE, applying CONVERT to each."""
+
+        self._file.close()
+        with open(self.path, "rb") as f:
+            f.seek(npy_header_bytes)
+            written = array(self.typecode)
+            written.frombytes(f.read())
+        if sys.byteorder != "little" and written.itemsize > 1:
+            written.byteswap()
+        values = array(typecode, map(convert, written))
+        self.__init__(self.path, typecode)
+        self.append(values)
+
+class _ColumnWriter():
+    """Streams one table column, with a null mask when the column has NULLs."""
+
+    def __init__(self, directory: str, table_name: str, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.has_nulls = False
+        prefix = os.path.join(directory, table_name, name)
+        self._mask = _NpyWriter(f"{prefix}.null.npy", "B")
+        if kind == "text":
+            self._values = _NpyWriter(f"{prefix}.offsets.npy", "q")
+            self._values.append(array("q", [0]))
+            self._text = open(f"{prefix}.utf8", "wb")
+            self._text_bytes = 0
+        else:
+            self._values = _NpyWriter(f"{prefix}.npy", "q" if kind == "int64" else "d")
+
+    def append(self, values: List) -> None:
+        nulls = bytes(value is None for value in values)
+        self.has_nulls = self.has_nulls or any(nulls)
+        self._mask.append(array("B", nulls))
+
+        if self.kind == "text":
+            offsets = array("q")
+            for value in values:
+                encoded = b"" if value is None else str(value).encode()
+                self._text.write(encoded)
+                self._text_bytes += len(encoded)
+                offsets.append(self._text_bytes)
+            self._values.append(offsets)
+            return
+
+        values = [0 if value is None else value for value in values]
+        if self.kind == "int64":
+            if all(isinstance(value, int) or float(value).is_integer() for value in values):
+                self._values.append(array("q", map(int, values)))
+                return
+            # An INTEGER column holding fractions; store it as doubles instead.
+            logger.debug("Storing column %s as float64", self.name)
+            self.kind = "float64"
+            self._values.retype("d", float)
+        self._values.append(array("d", values))
+
+    def close(self) -> dict:
+        self._values.close()
+        self._mask.close()
+        if self.kind == "text":
+            self._text.close()
+        if not self.has_nulls:
+            os.remove(self._mask.path)
+
+        return {"name": self.name, "kind": self.kind, "nullable": self.has_nulls}
+
+def read_npy(path: str) -> Sequence:
+    """Return the values of a one-dimensional little-endian .npy file.
+
+    On little-endian hosts the file is memory-mapped rather than read."""
+
+    with open(path, "rb") as f:
+        prefix = f.read(10)
+        if prefix[:6] != npy_magic[:6]:
+            raise ValueError(f"Not a .npy file: '{path}'")
+        header_length = int.from_bytes(prefix[8:10], "little")
+        header = ast.literal_eval(f.read(header_length).decode("latin1"))
+        typecode = _typecodes.get(header["descr"])
+        if typecode is None or header["fortran_order"] or len(header["shape"]) != 1:
+            raise ValueError(f"Unsupported .npy layout in '{path}': {header}")
+        offset = 10 + header_length
+        length = header["shape"][0]
+        if length == 0:
+            return array(typecode)
+
+        if sys.byteorder == "little":
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(mapped)[offset:offset + length * array(typecode).itemsize].cast(typecode)
+
+        f.seek(offset)
+        values = array(typecode)
+        values.fromfile(f, length)
+        if values.itemsize > 1:
+            values.byteswap()
+        return values
+
+def _column_kinds(conn: sqlite3.Connection, table_name: str) -> dict[str, str]:
+    """Return the snapshot kind of each column of table_name, from its declared type."""
+
+    kinds = {}
+    for _, name, declared_type, *_ in conn.execute(f"PRAGMA table_info({table_name})"):
+        declared_type = declared_type.upper()
+        if "INT" in declared_type:
+            kinds[name] = "int64"
+        elif "REAL" in declared_type or "FLOA" in declared_type or "DOUB" in declared_type:
+            kinds[name] = "float64"
+        else:
+            kinds[name] = "text"
+
+    return kinds
+
+def _primary_key(conn: sqlite3.Connection, table_name: str) -> List[str]:
+    columns = [(pk, name) for _, name, _, _, _, pk in conn.execute(f"PRAGMA table_info({table_name})") if pk > 0]
+    return [name for _, name in sorted(columns)]
+
+def export_table(conn: sqlite3.Connection, directory: str, table_name: str, rows: Optional[Iterable[tuple]] = None) -> dict:
+    """Write table_name's rows, in primary key order, to DIRECTORY/table_name/.
+
+    Pass ROWS, in the table's column order, to export them instead of
+    querying the table. Return the table's manifest entry."""
+
+    kinds = _column_kinds(conn, table_name)
+    names = list(kinds)
+    os.makedirs(os.path.join(directory, table_name), exist_ok=True)
+    if rows is None:
+        rows = conn.cursor().execute(f"SELECT {', '.join(names)} FROM {table_name} ORDER BY {', '.join(_primary_key(conn, table_name))}")
+    rows = iter(rows)
+
+    writers = [_ColumnWriter(directory, table_name, name, kinds[name]) for name in names]
+    row_count = 0
+    while True:
+        chunk = [row for _, row in zip(range(chunk_rows), rows)]
+        if len(chunk) == 0:
+            break
+        for writer, values in zip(writers, zip(*chunk)):
+            writer.append(list(values))
+        row_count += len(chunk)
+    columns = [writer.close() for writer in writers]
+    logger.debug("Exported %s rows of %s", row_count, table_name)
+
+    return {"row_count": row_count, "columns": columns}
+
+def export_snapshot(conn: sqlite3.Connection, directory: str, tables: dict[str, Optional[Iterable[tuple]]]) -> dict:
+    """Write a snapshot of TABLES to DIRECTORY and return its manifest.
+
+    TABLES maps table names to their rows, or to None to read the table."""
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = {
+        "format": snapshot_format,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "tables": {table_name: export_table(conn, directory, table_name, rows) for table_name, rows in tables.items()},
+    }
+    with open(os.path.join(directory, manifest_name), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+def read_manifest(directory: str) -> dict:
+    """Return the manifest of the snapshot in DIRECTORY.
+
+    Raises ValueError for snapshots of an unknown format."""
+
+    with open(os.path.join(directory, manifest_name)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != snapshot_format:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')} in '{directory}'")
+
+    return manifest
+
+def _iter_table_rows(directory: str, table_name: str, table: dict) -> Iterator[List[tuple]]:
+    """Yield the rows of a snapshot table in lists of up to chunk_rows."""
+
+    prefix = os.path.join(directory, table_name)
+    columns = []
+    for column in table["columns"]:
+        path = os.path.join(prefix, column["name"])
+        nulls = read_npy(f"{path}.null.npy") if column["nullable"] else None
+        if column["kind"] == "text":
+            with open(f"{path}.utf8", "rb") as f:
+                text = f.read()
+            columns.append((read_npy(f"{path}.offsets.npy"), nulls, text))
+        else:
+            columns.append((read_npy(f"{path}.npy"), nulls, None))
+
+    for start in range(0, table["row_count"], chunk_rows):
+        end = min(start + chunk_rows, table["row_count"])
+        values = []
+        for column_values, nulls, text in columns:
+            if text is not None:
+                offsets = column_values[start:end + 1].tolist()
+                column = [text[offsets[i]:offsets[i + 1]].decode() for i in range(end - start)]
+            else:
+                column = column_values[start:end].tolist()
+            if nulls is not None:
+                column = [None if null else value for value, null in zip(column, nulls[start:end].tolist())]
+            values.append(column)
+        yield list(zip(*values))
+
+def import_snapshot(conn: sqlite3.Connection, directory: str, tables: Optional[List[str]] = None) -> dict[str, int]:
+    """Bulk-load the snapshot in DIRECTORY into CONN's tables, replacing rows with the same primary key.
+
+    Column files are memory-mapped and inserted in chunks. The tables'
+    secondary indexes and triggers are dropped while loading and recreated
+    afterwards, so they are built once and history triggers don't fire for
+    every loaded row. Does not commit. Return the rows loaded per table."""
+
+    manifest = read_manifest(directory)
+    row_counts = {}
+    for table_name, table in manifest["tables"].items():
+        if tables is not None and table_name not in tables:
+            continue
+
+        dependents = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL", (table_name,)).fetchall()
+        for object_type, name, _ in dependents:
+            conn.execute(f"DROP {object_type.upper()} {name}")
+
+        names = [column["name"] for column in table["columns"]]
+        statement = f"INSERT OR REPLACE INTO {table_name} ({', '.join(names)}) VALUES ({','.join('?' * len(names))})"
+        for rows in _iter_table_rows(directory, table_name, table):
+            conn.executemany(statement, rows)
+
+        for _, _, sql in dependents:
+            conn.execute(sql)
+        row_counts[table_name] = table["row_count"]
+        logger.debug("Imported %s rows of %s", table["row_count"], table_name)
+
+    return row_counts
+
+def main(command: str, database_path: str, directory: str) -> None:
+    from gw2tpdb import Gw2TpDb
+
+    tpdb = Gw2TpDb(database_path)
+    if command == "export":
+        manifest = tpdb.export_snapshot(directory)
+        print(", ".join(f"{table_name}: {table['row_count']:,} rows" for table_name, table in manifest["tables"].items()))
+    elif command == "import":
+        row_counts = tpdb.import_snapshot(directory)
+        print(", ".join(f"{table_name}: {row_count:,} rows" for table_name, row_count in row_counts.items()))
+    else:
+        raise SystemExit(__doc__)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        raise SystemExit(__doc__)
+    main(*sys.argv[1:])
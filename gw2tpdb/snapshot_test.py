@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+from datetime import datetime, timezone, timedelta
+from gw2tpdb import Gw2TpDb
+from gw2tpdb import snapshot
+from gw2tpdb.db import db
+from gw2tpdb.api.history import history_fields
+
+def _row(item_id: int, utc_timestamp: datetime, price) -> tuple:
+    values = [price] * (len(history_fields) - 2)
+    values[history_fields.index("buy_price_stdev") - 1] = None
+    return (item_id, *values, int(utc_timestamp.timestamp()))
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, "snapshot")
+        self.source = Gw2TpDb(":memory:")
+        first_day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.source._insert_many("items", [(19721, "Glob of Ectoplasm"), (19976, "Mystic Coin — ☆")])
+        self.source._write_daily_rows([_row(item_id, first_day + timedelta(days=day), 100 + day) for item_id in (19721, 19976) for day in range(10)])
+        self.source._write_daily_rows([_row(19721, first_day + timedelta(days=10), 110.5)])
+        self.source._write_history_rows("hourly_history", [_row(19721, first_day + timedelta(hours=hour), 100) for hour in range(24)])
+
+    def _table(self, tpdb, table_name):
+        return tpdb._execute(f"SELECT * FROM {table_name} ORDER BY 1, {'name' if table_name == 'items' else 'utc_timestamp'}")
+
+    def test_export_reads_one_database_state(self):
+        database_path = os.path.join(os.path.dirname(self.directory), "source.db")
+        source = Gw2TpDb(database_path, ingestion_profile=db.IngestionProfile())
+        self.addCleanup(source.close)
+        source._insert_many("items", [(19721, "Glob of Ectoplasm")])
+        source._write_daily_rows([_row(19721, datetime(2024, 1, 1, tzinfo=timezone.utc), 100)])
+        writer = Gw2TpDb(database_path, ingestion_profile=db.IngestionProfile())
+        self.addCleanup(writer.close)
+
+        export_table = snapshot.export_table
+        def export_table_then_write(conn, directory, table_name, rows=None):
+            table = export_table(conn, directory, table_name, rows)
+            if table_name == "items":
+                writer._write_daily_rows([_row(19721, datetime(2024, 1, 2, tzinfo=timezone.utc), 100)])
+            return table
+
+        with mock.patch("gw2tpdb.snapshot.export_table", export_table_then_write):
+            manifest = source.export_snapshot(self.directory)
+
+        self.assertEqual(manifest["tables"]["daily_history"]["row_count"], 1)
+        self.assertEqual(source._execute("SELECT COUNT(*) FROM daily_history")[0][0], 2)
+
+    def test_round_trip(self):
+        manifest = self.source.export_snapshot(self.directory)
+        target = Gw2TpDb(":memory:")
+        row_counts = target.import_snapshot(self.directory)
+
+        self.assertEqual(row_counts, {"items": 2, "daily_history": 21, "hourly_history": 24})
+        self.assertEqual(manifest["tables"]["daily_history"]["columns"][history_fields.index("buy_price_avg")]["kind"], "float64")
+        for table_name in snapshot.default_tables:
+            self.assertEqual(self._table(target, table_name), self._table(self.source, table_name))
+        self.assertEqual(target.get_summaries(), self.source.get_summaries())
+
+    def test_import_restores_triggers_without_firing_them(self):
+        self.source.export_snapshot(self.directory)
+        target = Gw2TpDb(":memory:")
+        target.import_snapshot(self.directory)
+
+        self.assertEqual(target._execute("SELECT COUNT(*) FROM rollup_pending")[0][0], 0)
+        self.assertEqual(target._execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'hourly_history'")[0][0], 2)
+
+    def test_columns_are_npy_files(self):
+        self.source.export_snapshot(self.directory)
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest("numpy is not installed")
+
+        timestamps = np.load(os.path.join(self.directory, "daily_history", "utc_timestamp.npy"))
+        self.assertEqual(timestamps.dtype, np.int64)
+        self.assertEqual(list(timestamps), [row[-1] for row in self._table(self.source, "daily_history")])
+
+if __name__ == "__main__":
+    unittest.main ()
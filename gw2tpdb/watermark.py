@@ -0,0 +1,64 @@
+from typing import Callable, Iterable, Optional
+from datetime import datetime, timezone, timedelta
+
+default_ttl = timedelta(hours=1)
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _start_of_day(timestamp: datetime) -> datetime:
+    """Return midnight UTC of the day containing TIMESTAMP."""
+
+    return timestamp.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+class RemoteWatermark():
+    """Cache of the most recent timestamp available from the server.
+
+    A cached value expires after ttl or at the next UTC midnight, whichever
+    comes first, because the server publishes a new day's data after the
+    rollover."""
+
+    def __init__(self, ttl: timedelta = default_ttl, now: Callable[[], datetime] = _utc_now):
+        self._ttl = ttl
+        self._now = now
+        self._timestamp = None
+        self._expires_at = None
+
+    def get(self) -> Optional[datetime]:
+        """Return the cached timestamp, or None when absent or expired."""
+
+        if self._expires_at is None or self._now() >= self._expires_at:
+            return None
+
+        return self._timestamp
+
+    def set(self, timestamp: datetime) -> None:
+        """Cache TIMESTAMP as the most recent remote timestamp."""
+
+        now = self._now()
+        self._timestamp = timestamp
+        self._expires_at = min(now + self._ttl, _start_of_day(now) + timedelta(days=1))
+
+    def observe(self, timestamps: Iterable[datetime]) -> None:
+        """Update the cache from timestamps seen in any downloaded response.
+
+        A response only proves the server has data up to its newest
+        timestamp, so it raises a cached value but only seeds an empty cache
+        when it already reaches today, the newest day that can exist."""
+
+        newest = max(timestamps, default=None)
+        if newest is None:
+            return
+
+        cached = self.get()
+        if cached is None:
+            if newest >= _start_of_day(self._now()):
+                self.set(newest)
+        elif newest > cached:
+            self._timestamp = newest
+
+    def clear(self) -> None:
+        """Forget the cached timestamp."""
+
+        self._timestamp = None
+        self._expires_at = None
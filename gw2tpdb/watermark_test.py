@@ -0,0 +1,36 @@
+import unittest
+
+from datetime import datetime, timezone, timedelta
+from gw2tpdb.watermark import RemoteWatermark
+
+class RemoteWatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2024, 1, 2, 12, tzinfo=timezone.utc)
+        self.watermark = RemoteWatermark(ttl=timedelta(hours=6), now=lambda: self.now)
+
+    def test_expires_after_ttl(self):
+        self.watermark.set(datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.now += timedelta(hours=5)
+        self.assertEqual(self.watermark.get(), datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.now += timedelta(hours=1)
+        self.assertIsNone(self.watermark.get())
+
+    def test_expires_at_rollover(self):
+        self.now = datetime(2024, 1, 2, 23, tzinfo=timezone.utc)
+        self.watermark.set(datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.now += timedelta(hours=1)
+        self.assertIsNone(self.watermark.get())
+
+    def test_observe_raises_cached_value(self):
+        self.watermark.set(datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.watermark.observe([datetime(2024, 1, 2, tzinfo=timezone.utc), datetime(2023, 12, 1, tzinfo=timezone.utc)])
+        self.assertEqual(self.watermark.get(), datetime(2024, 1, 2, tzinfo=timezone.utc))
+
+    def test_observe_only_seeds_with_today(self):
+        self.watermark.observe([datetime(2024, 1, 1, tzinfo=timezone.utc)])
+        self.assertIsNone(self.watermark.get())
+        self.watermark.observe([datetime(2024, 1, 2, tzinfo=timezone.utc)])
+        self.assertEqual(self.watermark.get(), datetime(2024, 1, 2, tzinfo=timezone.utc))
+
+if __name__ == "__main__":
+    unittest.main ()